@@ -0,0 +1,94 @@
+from fastapi import APIRouter, HTTPException
+from ...core.adaptive import get_all_latency_stats
+from ...core.admission import get_admission_controllers
+from ...core.capture import get_traffic_capture
+from ...core.circuit_breaker import get_circuit_breakers
+from ...core.config_reload import ConfigReloadError, get_config_reloader
+from ...core.embeddings import get_embedding_batchers
+from ...core.rate_limit import get_rate_limiters
+from ...core.response_cache import get_response_cache
+from ...core.singleflight import get_singleflight
+
+router = APIRouter()
+
+
+@router.get("/admin/circuit-breakers")
+async def list_circuit_breakers():
+    """查看所有提供商的熔断器状态"""
+    return {"circuit_breakers": [breaker.snapshot() for breaker in get_circuit_breakers()]}
+
+
+@router.get("/admin/admission")
+async def list_admission_controllers():
+    """查看所有提供商的并发与排队情况"""
+    return {"providers": [controller.snapshot() for controller in get_admission_controllers()]}
+
+
+@router.get("/admin/rate-limits")
+async def list_rate_limits():
+    """查看所有提供商的 RPM / TPM 剩余预算"""
+    return {"providers": [limiter.snapshot() for limiter in get_rate_limiters()]}
+
+
+@router.get("/admin/latency")
+async def list_latency_stats():
+    """查看各提供商的延迟与错误率 EWMA（自适应排序使用）"""
+    return {"providers": [stats.snapshot() for stats in get_all_latency_stats()]}
+
+
+@router.get("/admin/cache")
+async def get_cache_stats():
+    """查看响应缓存的命中统计"""
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await cache.stats()}
+
+
+@router.delete("/admin/cache")
+async def clear_cache():
+    """清空响应缓存"""
+    cache = get_response_cache()
+    if cache is not None:
+        await cache.clear()
+    return {"cleared": cache is not None}
+
+
+@router.get("/admin/capture")
+async def get_capture_stats():
+    """查看流量捕获的写入情况"""
+    capture = get_traffic_capture()
+    if capture is None:
+        return {"enabled": False}
+    return {"enabled": True, **capture.stats()}
+
+
+@router.get("/admin/embeddings")
+async def list_embedding_batchers():
+    """查看各提供商 embeddings 微批的合并情况"""
+    return {"providers": [batcher.snapshot() for batcher in get_embedding_batchers()]}
+
+
+@router.get("/admin/singleflight")
+async def get_singleflight_stats():
+    """查看请求合并的统计"""
+    singleflight = get_singleflight()
+    if singleflight is None:
+        return {"enabled": False}
+    return {"enabled": True, **singleflight.stats()}
+
+
+@router.post("/admin/reload")
+async def reload_config():
+    """重新加载配置文件；新配置校验失败时返回400并保持当前配置"""
+    try:
+        changes = await get_config_reloader().reload()
+    except ConfigReloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"reloaded": True, **changes}
+
+
+@router.get("/admin/reload")
+async def get_reload_status():
+    """查看配置热重载的状态"""
+    return get_config_reloader().snapshot()
@@ -1,50 +1,289 @@
+import asyncio
 import json
-from fastapi import APIRouter, HTTPException
-from ...models.schemas import AIRequest, AIResponse, ChatMessage
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, List, Optional
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+from ...models.schemas import (
+    AIRequest,
+    AIResponse,
+    BatchItemResult,
+    BatchRequest,
+    BatchResponse,
+    ChatMessage,
+    EmbeddingRequest,
+    ExtendedChatCompletionChunk,
+    ExtendedEmbeddingResponse,
+)
 from ...core.ai_factory import AIFactory
-from ...config.settings import get_settings
-from ...utils.logger import logger
+from ...core.batch import get_batch_limits, run_batch
+from ...core.capture import CaptureEntry, get_traffic_capture
+from ...core.deadline import DEADLINE_HEADER, DeadlineExceededError, resolve_deadline
+from ...core.dispatcher import complete
+from ...core.embeddings import EmbeddingsNotSupportedError, create_embeddings
+from ...core.metrics import REQUEST_LATENCY, ROUTE_IN_FLIGHT, ROUTE_REQUESTS, route_label
+from ...core.failover import (
+    AllProvidersContextExceededError,
+    AllProvidersFailedError,
+    AllProvidersRateLimitedError,
+    AllProvidersSaturatedError,
+    LeasedStream,
+    open_stream_with_failover,
+)
+from ...utils.logger import logger, message_log_policy
 
 router = APIRouter()
 
+# 客户端在响应返回前断开连接时使用的状态码（沿用 nginx 的约定，实际不会被客户端收到）
+CLIENT_CLOSED_REQUEST = 499
+
+
+class _ClientDisconnected(Exception):
+    """客户端在响应返回前断开了连接"""
+
+
+async def _wait_for_disconnect(http_request: Request):
+    # 请求体已经读完，之后收到的消息只会是断开连接
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel_on_disconnect(http_request: Request, awaitable: Awaitable[Any]) -> Any:
+    """等待 awaitable 完成；客户端先断开连接时立即取消它（包括正在进行的上游调用）"""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        watcher.cancel()
+        raise
+    watcher.cancel()
+    if task in done:
+        return task.result()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    raise _ClientDisconnected()
+
+
+class _StreamFinalizer:
+    """流式请求结束时的清理：归还上游的并发名额与限流预算、在途计数和流量捕获；只执行一次"""
+
+    def __init__(self, chunks: LeasedStream, route_name: str, capture: Optional[CaptureEntry] = None):
+        self.chunks = chunks
+        self.route_name = route_name
+        self.capture = capture
+        self.finished = False
+
+    async def finish(self, outcome: str = "cancelled"):
+        if self.finished:
+            return
+        self.finished = True
+        ROUTE_IN_FLIGHT.dec(self.route_name)
+        if self.capture is not None:
+            self.capture.finish(outcome)
+        await self.chunks.aclose()
+
+
+async def _sse_events(finalizer: _StreamFinalizer) -> AsyncIterator[str]:
+    """把分块编码为OpenAI兼容的SSE事件"""
+    capture = finalizer.capture
+    # 客户端中途断开时生成器被关闭，结果记为 cancelled
+    outcome = "cancelled"
+    try:
+        async for chunk in finalizer.chunks:
+            if capture is not None:
+                capture.observe_chunk(chunk)
+            yield f"data: {chunk.model_dump_json()}\n\n"
+        outcome = "success"
+        ROUTE_REQUESTS.inc(finalizer.route_name, outcome)
+    except Exception as e:
+        # 首个token之后不再故障转移，只能把错误通知给客户端
+        logger.error("流式响应中断: %s", e)
+        outcome = "stream_error"
+        ROUTE_REQUESTS.inc(finalizer.route_name, outcome)
+        error = {"error": {"message": str(e), "type": "provider_error"}}
+        yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+    finally:
+        await finalizer.finish(outcome)
+    yield "data: [DONE]\n\n"
+
+
+class _EventStreamResponse(StreamingResponse):
+    """
+    SSE 流式响应，发送结束后总会执行清理。
+    响应体生成器只在开始发送后才运行：客户端在响应开始前断开、或发送响应头时出错，生成器的 finally 都不会执行，
+    上游并发名额会一直被占用；这里在 __call__ 结束时（包括异常）兜底清理，而不是用只在正常结束时运行的 BackgroundTask。
+    """
+
+    def __init__(self, finalizer: _StreamFinalizer):
+        super().__init__(_sse_events(finalizer), media_type="text/event-stream")
+        self.finalizer = finalizer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await self.finalizer.finish()
+
 
 @router.post("/chat/completions", response_model=AIResponse)
-async def generate_response(request: AIRequest):
-    settings = get_settings()
-    # 解析用户请求中的分组
-    raw_model = request.model
-    providers = settings.resolve_providers(raw_model)
-
-    logger.info(f"开始处理AI请求，解析后的提供商顺序: {providers}")
-    logger.info(
-        "对话内容（已过滤system角色）: \n"
-        + "\n".join(
-            [
-                f"  角色: {message.get('role')}, 内容: {message.get('content')}"
+async def generate_response(request: AIRequest, http_request: Request):
+    # 通过预编译的路由表解析用户请求中的分组
+    try:
+        route = AIFactory.resolve(request.model)
+        deadline = resolve_deadline(request.timeout, http_request.headers.get(DEADLINE_HEADER))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    providers = route.providers
+    if not providers:
+        error_msg = f"没有可用的AI提供商: {request.model}"
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+    logger.info("开始处理AI请求，解析后的提供商顺序: %s", [p.provider_name for p in providers])
+    if message_log_policy.should_log(logger):
+        logger.info(
+            "对话内容（已过滤system角色）: \n%s",
+            "\n".join(
+                f"  角色: {message.get('role')}, 内容: {message_log_policy.truncate(message.get('content'))}"
                 for message in request.messages
                 if message.get("role") != "system"
-            ]
+            ),
         )
-    )
 
-    last_error = None
-    for provider_name in providers:
-        try:
-            logger.info(f"尝试使用AI提供商: {provider_name}")
-            provider = AIFactory.create_provider(provider_name)
-            response = await provider.generate_response(
-                messages=request.messages,
-                max_tokens=request.max_tokens,
-                temperature=request.temperature,
+    traffic_capture = get_traffic_capture()
+    capture = traffic_capture.start(request, providers) if traffic_capture is not None else None
+    route_name = route_label(route.name)
+    ROUTE_IN_FLIGHT.inc(route_name)
+    started = time.monotonic()
+    streaming = False
+    response = None
+    # 未预期的异常不计入路由结果统计，但仍以 error 记入流量捕获
+    outcome = None
+    try:
+        if request.stream:
+            chunks = await _cancel_on_disconnect(
+                http_request, open_stream_with_failover(route.ordered_providers(), request, deadline)
             )
-            logger.info(f"AI提供商 {provider_name} 成功生成响应")
-            logger.debug(f"AI响应: \n{json.dumps(response.model_dump(), ensure_ascii=False, indent=2)}")
-            return response
-        except Exception as e:
-            last_error = str(e)
-            logger.error(f"AI提供商 {provider_name} 失败: {last_error}", exc_info=True)
-            continue
-
-    error_msg = f"所有AI提供商都失败了。最后的错误: {last_error}"
-    logger.error(error_msg)
-    raise HTTPException(status_code=500, detail=error_msg)
+            # 在途计数和结果在流结束时记录；之后客户端断开时由 StreamingResponse 取消输出
+            streaming = True
+            return _EventStreamResponse(_StreamFinalizer(chunks, route_name, capture))
+
+        response = await _cancel_on_disconnect(http_request, complete(route, request, deadline))
+        outcome = "success"
+    except _ClientDisconnected:
+        # 客户端已经离开，不再继续尝试其他提供商
+        logger.info("客户端断开连接，已取消请求")
+        outcome = "cancelled"
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except DeadlineExceededError as e:
+        outcome = "deadline_exceeded"
+        raise HTTPException(status_code=504, detail=str(e))
+    except AllProvidersRateLimitedError as e:
+        # 所有提供商的限流预算都已耗尽，按最早恢复的时间提示客户端重试
+        outcome = "rate_limited"
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AllProvidersSaturatedError as e:
+        # 所有提供商都满载时快速拒绝，而不是堆积协程直到超时
+        outcome = "saturated"
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AllProvidersContextExceededError as e:
+        # 对话超出所有提供商的上下文窗口，属于请求本身的问题
+        outcome = "context_exceeded"
+        raise HTTPException(status_code=400, detail=str(e))
+    except AllProvidersFailedError as e:
+        outcome = "error"
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not streaming:
+            ROUTE_IN_FLIGHT.dec(route_name)
+            REQUEST_LATENCY.observe(route_name, value=time.monotonic() - started)
+            if outcome is not None:
+                ROUTE_REQUESTS.inc(route_name, outcome)
+            if capture is not None:
+                if response is not None:
+                    capture.finish(outcome or "error", response.provider, response.usage)
+                else:
+                    capture.finish(outcome or "error")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("AI响应: \n%s", json.dumps(response.model_dump(), ensure_ascii=False, indent=2))
+    return _json_response(response)
+
+
+def _json_response(model) -> Response:
+    """
+    直接序列化响应模型。
+    响应对象由本服务构建且类型已确定，跳过 FastAPI 按 response_model 的重新校验和 jsonable_encoder 转换，由 pydantic-core 直接编码为字节。
+    """
+    return Response(content=model.__pydantic_serializer__.to_json(model), media_type="application/json")
+
+
+@router.post("/embeddings", response_model=ExtendedEmbeddingResponse)
+async def generate_embeddings(request: EmbeddingRequest, http_request: Request):
+    """
+    OpenAI兼容的 embeddings 接口，按与对话补全相同的提供商、分组和优先级解析路由。
+    同一提供商上并发到达的小请求在短时间窗口内合并为一次上游调用。
+    """
+    try:
+        route = AIFactory.resolve(request.model)
+        deadline = resolve_deadline(request.timeout, http_request.headers.get(DEADLINE_HEADER))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        response = await _cancel_on_disconnect(http_request, create_embeddings(route, request.inputs, deadline))
+    except _ClientDisconnected:
+        logger.info("客户端断开连接，已取消 embeddings 请求")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except EmbeddingsNotSupportedError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AllProvidersSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except AllProvidersFailedError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return _json_response(response)
+
+
+async def _ndjson_lines(results: AsyncIterator[BatchItemResult]) -> AsyncIterator[str]:
+    """按完成顺序把每条结果编码为一行JSON"""
+    async for result in results:
+        yield result.model_dump_json(exclude_none=True) + "\n"
+
+
+@router.post("/chat/completions/batch", response_model=BatchResponse)
+async def generate_batch(batch: BatchRequest, http_request: Request):
+    """
+    并发执行一批对话补全请求，每条请求独立路由与故障转移。
+    默认在全部完成后按输入顺序返回；stream 为 true 时按完成顺序以 NDJSON 逐行返回（带 index）。
+    """
+    max_concurrency, max_items = get_batch_limits()
+    if len(batch.requests) > max_items:
+        raise HTTPException(status_code=413, detail=f"单批请求数不能超过 {max_items}")
+    concurrency = min(batch.concurrency or max_concurrency, max_concurrency, len(batch.requests))
+    logger.info("收到批量请求: %s 条，并发数: %s", len(batch.requests), concurrency)
+
+    results = run_batch(enumerate(batch.requests), concurrency)
+    if batch.stream:
+        return StreamingResponse(_ndjson_lines(results), media_type="application/x-ndjson")
+
+    ordered: List[Optional[BatchItemResult]] = [None] * len(batch.requests)
+
+    async def collect():
+        async for result in results:
+            ordered[result.index] = result
+
+    try:
+        await _cancel_on_disconnect(http_request, collect())
+    except _ClientDisconnected:
+        logger.info("客户端断开连接，已取消批量请求")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    return _json_response(BatchResponse(results=ordered))
@@ -0,0 +1,240 @@
+"""
+离线批量执行 JSONL 请求。
+
+    python -m app.batch in.jsonl out.jsonl [--concurrency 8]
+
+输入文件每行一个 AIRequest，输出文件每行一个结果（index 为输入行号，从0开始），按输入顺序写出。
+运行过程中定期写入检查点，中断后以相同参数重新运行即可从中断处继续。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, Optional, TextIO, Tuple, Union
+from pydantic import ValidationError
+from .config.settings import get_settings
+from .core.ai_factory import AIFactory
+from .core.batch import get_batch_limits, run_item
+from .core.client_pool import close_client_registry, init_client_registry
+from .models.schemas import AIRequest, BatchItemError, BatchItemResult
+from .utils.logger import logger
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+CHECKPOINT_EVERY_DEFAULT = 100
+# 已完成但因前面的请求未完成而暂不能写出的结果数上限 = 并发数 * 该倍数
+WINDOW_FACTOR_DEFAULT = 4
+
+
+class BatchStats:
+    """批量执行的累计统计，随检查点一起保存，续跑时继续累加"""
+
+    def __init__(self, **kwargs):
+        self.total = kwargs.get("total", 0)
+        self.succeeded = kwargs.get("succeeded", 0)
+        self.failed = kwargs.get("failed", 0)
+        self.prompt_tokens = kwargs.get("prompt_tokens", 0)
+        self.completion_tokens = kwargs.get("completion_tokens", 0)
+        self.elapsed = kwargs.get("elapsed", 0.0)
+
+    def record(self, result: BatchItemResult):
+        self.total += 1
+        if result.error is not None:
+            self.failed += 1
+            return
+        self.succeeded += 1
+        usage = result.response.usage
+        if usage:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"共 {self.total} 条，成功 {self.succeeded}，失败 {self.failed}；"
+            f"耗时 {self.elapsed:.1f} 秒，吞吐 {self.total / elapsed:.2f} 条/秒；"
+            f"提示词token {self.prompt_tokens}，生成token {self.completion_tokens}"
+            f"（{self.completion_tokens / elapsed:.1f} token/秒）"
+        )
+
+
+class Checkpoint:
+    """
+    检查点：已按顺序写出的输入行数和输出文件的字节偏移。
+    续跑时跳过已完成的输入行，并把输出文件截断到偏移处，丢弃检查点之后写出的部分结果。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, completed: int, output_offset: int, stats: BatchStats):
+        # 先写临时文件再原子替换，避免中断时留下损坏的检查点
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"completed": completed, "output_offset": output_offset, "stats": stats.to_dict()}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+Item = Tuple[int, Union[AIRequest, BatchItemResult]]
+
+
+def read_requests(f: TextIO, skip: int) -> Iterator[Item]:
+    """逐行惰性读取请求；无法解析的行直接产出错误结果"""
+    for index, line in enumerate(f):
+        if index < skip:
+            continue
+        line = line.strip()
+        if not line:
+            error = BatchItemError(status_code=400, message="空行")
+            yield index, BatchItemResult(index=index, error=error)
+            continue
+        try:
+            # 与 HTTP 接口一致，先解析JSON再校验（直接校验JSON时消息内容会被识别为可迭代的分段）
+            request = AIRequest.model_validate(json.loads(line))
+        except (ValueError, ValidationError) as e:
+            error = BatchItemError(status_code=400, message=f"无法解析请求: {e}")
+            yield index, BatchItemResult(index=index, error=error)
+            continue
+        yield index, request
+
+
+class OrderedWriter:
+    """
+    按输入顺序写出结果。
+    先完成的结果暂存在内存中，暂存数量受 window 限制，超出时工作协程等待，内存占用与输入规模无关。
+    """
+
+    def __init__(
+        self,
+        output: TextIO,
+        start: int,
+        window: int,
+        checkpoint: Checkpoint,
+        checkpoint_every: int,
+        stats: BatchStats,
+    ):
+        self.output = output
+        self.next_index = start
+        self.slots = asyncio.Semaphore(window)
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.stats = stats
+        self._pending: Dict[int, BatchItemResult] = {}
+        self._since_checkpoint = 0
+        self._started = time.monotonic()
+        self._base_elapsed = stats.elapsed
+
+    def put(self, result: BatchItemResult):
+        self._pending[result.index] = result
+        while self.next_index in self._pending:
+            ready = self._pending.pop(self.next_index)
+            self.output.write(ready.model_dump_json(exclude_none=True) + "\n")
+            self.stats.record(ready)
+            self.next_index += 1
+            self._since_checkpoint += 1
+            self.slots.release()
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.save_checkpoint()
+
+    def save_checkpoint(self):
+        self.output.flush()
+        self.stats.elapsed = self._base_elapsed + time.monotonic() - self._started
+        self.checkpoint.save(self.next_index, self.output.tell(), self.stats)
+        self._since_checkpoint = 0
+
+
+async def process(items: Iterator[Item], writer: OrderedWriter, concurrency: int):
+    """固定数量的工作协程按需取出请求执行，结果交给 OrderedWriter 按顺序写出"""
+
+    async def worker():
+        while True:
+            await writer.slots.acquire()
+            item = next(items, None)
+            if item is None:
+                writer.slots.release()
+                return
+            index, request = item
+            if isinstance(request, BatchItemResult):
+                writer.put(request)
+            else:
+                writer.put(await run_item(index, request))
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+
+async def run(args: argparse.Namespace) -> BatchStats:
+    checkpoint = Checkpoint(args.checkpoint or args.output + CHECKPOINT_SUFFIX)
+    state = None if args.restart else checkpoint.load()
+    if state and not os.path.exists(args.output):
+        logger.warning("检查点存在但输出文件缺失，从头开始: %s", args.output)
+        state = None
+    completed = state["completed"] if state else 0
+    stats = BatchStats(**state["stats"]) if state else BatchStats()
+
+    if state:
+        # 丢弃检查点之后写出的结果，这些行会重新执行
+        with open(args.output, "r+b") as f:
+            f.truncate(state["output_offset"])
+        logger.info("从检查点继续，已完成 %s 条", completed)
+
+    settings = get_settings()
+    init_client_registry(settings)
+    AIFactory.build_routing_table(settings)
+    try:
+        with open(args.input, "r", encoding="utf-8") as input_file, \
+                open(args.output, "a" if state else "w", encoding="utf-8") as output_file:
+            window = args.window or args.concurrency * WINDOW_FACTOR_DEFAULT
+            writer = OrderedWriter(output_file, completed, window, checkpoint, args.checkpoint_every, stats)
+            try:
+                await process(read_requests(input_file, completed), writer, args.concurrency)
+            finally:
+                writer.save_checkpoint()
+    finally:
+        await close_client_registry()
+        AIFactory.reset()
+
+    checkpoint.remove()
+    return stats
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    max_concurrency, _ = get_batch_limits()
+    parser = argparse.ArgumentParser(prog="python -m app.batch", description="离线批量执行 JSONL 请求")
+    parser.add_argument("input", help="输入文件，每行一个 AIRequest")
+    parser.add_argument("output", help="输出文件，每行一个结果，按输入顺序写出")
+    parser.add_argument("--concurrency", type=int, default=max_concurrency, help="并发数（默认取 batch.max_concurrency）")
+    parser.add_argument("--window", type=int, default=None, help="暂存的乱序结果上限（默认并发数的4倍）")
+    parser.add_argument("--checkpoint", default=None, help="检查点文件路径（默认为输出文件加 .checkpoint）")
+    parser.add_argument("--checkpoint-every", type=int, default=CHECKPOINT_EVERY_DEFAULT, help="每写出多少条保存一次检查点")
+    parser.add_argument("--restart", action="store_true", help="忽略已有检查点，从头开始")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        stats = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        logger.warning("批量执行被中断，重新运行相同命令即可从检查点继续")
+        return 130
+    logger.info("批量执行完成: %s", stats.summary())
+    print(stats.summary(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
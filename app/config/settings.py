@@ -1,8 +1,8 @@
 from pydantic import Field, PrivateAttr
 from pydantic_settings import BaseSettings
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+import hashlib
 import yaml
-from functools import lru_cache
 import os
 from ..utils.logger import logger
 
@@ -14,6 +14,79 @@ class ProviderConfig:
         self.base_url: Optional[str] = kwargs.get('base_url')
         self.model: str = kwargs['model']
         self.max_tokens: int = kwargs.get('max_tokens', 2000)
+        # 上下文窗口（token数，未设置表示不检查）及估算token数时使用的分词器提示（见 app/core/tokens.py）
+        self.context_window: Optional[int] = kwargs.get('context_window')
+        self.tokenizer: Optional[str] = kwargs.get('tokenizer')
+
+        # Ollama：模型保持加载的时间（如 "30m"，-1 表示常驻）、上下文长度，以及是否在启动时预热加载模型
+        self.keep_alive: Optional[Union[str, float]] = kwargs.get('keep_alive')
+        self.num_ctx: Optional[int] = kwargs.get('num_ctx')
+        self.warmup: bool = kwargs.get('warmup', False)
+
+        # embeddings：生成向量使用的模型（未设置时使用 model）及单次上游调用最多合并的输入条数（未设置时使用全局配置）
+        self.embedding_model: Optional[str] = kwargs.get('embedding_model')
+        self.embedding_batch_size: Optional[int] = kwargs.get('embedding_batch_size')
+
+        # 连接池配置：每个提供商持有一个长连接客户端
+        self.max_connections: int = kwargs.get('max_connections', 100)
+        self.max_keepalive_connections: int = kwargs.get('max_keepalive_connections', 20)
+        self.keepalive_expiry: float = kwargs.get('keepalive_expiry', 30.0)
+        self.http2: bool = kwargs.get('http2', False)
+        self.connect_timeout: float = kwargs.get('connect_timeout', 10.0)
+        self.read_timeout: float = kwargs.get('read_timeout', 600.0)
+        self.max_retries: int = kwargs.get('max_retries', 2)
+
+        # 熔断器配置：连续失败达到阈值后熔断，冷却期结束后进入半开探测（阈值为0表示禁用）
+        self.failure_threshold: int = kwargs.get('failure_threshold', 5)
+        self.recovery_timeout: float = kwargs.get('recovery_timeout', 30.0)
+        self.half_open_max_calls: int = kwargs.get('half_open_max_calls', 1)
+
+        # 并发准入：同时在途请求上限（未设置表示不限制）及排队上限，队列满时直接转向下一个提供商
+        self.max_concurrency: Optional[int] = kwargs.get('max_concurrency')
+        self.max_queue: int = kwargs.get('max_queue', 0)
+
+        # 限流：每分钟请求数 / 每分钟token数（未设置表示不限制），预算耗尽时在路由中跳过
+        self.rpm: Optional[int] = kwargs.get('rpm')
+        self.tpm: Optional[int] = kwargs.get('tpm')
+
+    @property
+    def fingerprint(self) -> str:
+        """决定生成结果的配置（类型、模型、地址）的摘要，用于区分配置变更前后的缓存结果"""
+        identity = f"{self.type}|{self.model}|{self.base_url or ''}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+
+class GroupConfig:
+    """
+    单个分组的配置。
+    分组既可以写成提供商列表，也可以写成包含 providers 和调度选项的字典。
+    """
+    def __init__(self, **kwargs):
+        self.providers: List[str] = kwargs.get('providers') or []
+        # 对冲：当前提供商超过该毫秒数仍未返回时，启动下一个提供商
+        self.hedge_after_ms: Optional[int] = kwargs.get('hedge_after_ms')
+        # 竞速：同时向前 N 个提供商发起请求
+        self.race: int = kwargs.get('race', 0)
+        # 响应缓存的TTL（秒），未设置时使用全局配置，0 表示该分组不缓存
+        self.cache_ttl: Optional[int] = kwargs.get('cache_ttl')
+        # 组内排序策略：未设置时按配置顺序，adaptive 按延迟与错误率自适应排序
+        self.strategy: Optional[str] = kwargs.get('strategy')
+        # 组内模式：未设置时为故障转移，balance 在成员间负载均衡（失败时仍在组内故障转移）
+        self.mode: Optional[str] = kwargs.get('mode')
+        # 负载均衡算法：round_robin（加权轮询）、least_outstanding（最少在途）、p2c（二选一）
+        self.balance: str = kwargs.get('balance', 'round_robin')
+        # 成员权重（提供商名 -> 权重，默认1，0 表示只作为后备）
+        self.weights: Dict[str, float] = kwargs.get('weights') or {}
+
+    @classmethod
+    def parse(cls, value) -> "GroupConfig":
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls(providers=value)
+
+# model 字符串中调度修饰符的分隔符，如 "cloud-services@race"
+ROUTE_MODIFIER_SEPARATOR = "@"
+RACE_COUNT_DEFAULT = 2
+HEDGE_AFTER_MS_DEFAULT = 500
 
 class Settings(BaseSettings):
     """
@@ -35,6 +108,8 @@ class Settings(BaseSettings):
     _providers: Dict[str, ProviderConfig] = PrivateAttr(default_factory=dict)
     _priority: List[str] = PrivateAttr(default_factory=list)
     _groups: Dict[str, List[str]] = PrivateAttr(default_factory=dict)
+    _group_configs: Dict[str, GroupConfig] = PrivateAttr(default_factory=dict)
+    _config_path: str = PrivateAttr(default="")
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -44,7 +119,7 @@ class Settings(BaseSettings):
         """加载YAML配置文件"""
         # 优先使用环境变量中的配置路径
         config_path = os.getenv("CONFIG_PATH", self.CONFIG_PATH)
-        logger.info(f"开始加载配置文件，当前路径: {config_path}")
+        logger.info("开始加载配置文件，当前路径: %s", config_path)
 
         # 如果是测试环境，使用测试配置文件
         if os.getenv("TESTING") == "true":
@@ -53,28 +128,29 @@ class Settings(BaseSettings):
                 "tests",
                 "test_config.yaml"
             )
-            logger.info(f"检测到测试环境，使用测试配置文件: {config_path}")
+            logger.info("检测到测试环境，使用测试配置文件: %s", config_path)
 
         if not os.path.exists(config_path):
             error_msg = f"配置文件不存在: {config_path}"
             logger.critical(error_msg)
             raise FileNotFoundError(error_msg)
 
-        logger.info(f"正在加载配置文件: {config_path}")
+        logger.info("正在加载配置文件: %s", config_path)
+        self._config_path = config_path
         with open(config_path, 'r', encoding='utf-8') as f:
             self._config = yaml.safe_load(f)
         logger.debug("配置文件原始内容加载完成")
 
         # 加载提供商配置
         providers_config = self._config.get('providers', {})
-        logger.info(f"发现 {len(providers_config)} 个提供商配置")
+        logger.info("发现 %s 个提供商配置", len(providers_config))
         for name, config in providers_config.items():
             self._providers[name] = ProviderConfig(**config)
         logger.debug("提供商配置加载完成")
 
         # 加载并验证优先级配置
         self._priority = self._config.get('priority', [])
-        logger.info(f"加载优先级配置: {self._priority}")
+        logger.info("加载优先级配置: %s", self._priority)
 
         # 检查优先级列表中的所有提供商是否都已配置
         invalid_providers = [p for p in self._priority if p not in self._providers]
@@ -85,12 +161,16 @@ class Settings(BaseSettings):
         logger.info("优先级配置验证通过")
 
         # 新增分组配置加载
-        self._groups = self._config.get('groups', {})
-        logger.info(f"加载 {len(self._groups)} 个分组配置")
+        self._group_configs = {
+            name: GroupConfig.parse(value)
+            for name, value in (self._config.get('groups') or {}).items()
+        }
+        self._groups = {name: group.providers for name, group in self._group_configs.items()}
+        logger.info("加载 %s 个分组配置", len(self._groups))
 
         # 验证分组中的提供商是否都存在
         for group_name, providers in self._groups.items():
-            logger.debug(f"验证分组 '{group_name}' 的提供商列表: {providers}")
+            logger.debug("验证分组 '%s' 的提供商列表: %s", group_name, providers)
             invalid_providers = [p for p in providers if p not in self._providers]
             if invalid_providers:
                 error_msg = f"分组 '{group_name}' 包含未配置的提供商: {', '.join(invalid_providers)}"
@@ -100,11 +180,24 @@ class Settings(BaseSettings):
 
     def resolve_providers(self, providers: Optional[str] = None) -> List[str]:
         """解析包含分组的提供商列表，保持顺序并去重"""
-        resolved = []
+        resolved = [
+            provider
+            for _, segment in self.resolve_provider_segments(providers)
+            for provider in segment
+        ]
+        logger.info("最终解析后的去重提供商列表: %s", resolved)
+        return resolved
+
+    def resolve_provider_segments(self, providers: Optional[str] = None) -> List[Tuple[Optional[str], List[str]]]:
+        """
+        按 model 字符串中的每一项拆分解析结果，返回 [(分组名或None, 该项新增的提供商列表)]。
+        去重只会移除成员，因此每个分组新增的成员在最终列表中是连续的。
+        """
+        segments: List[Tuple[Optional[str], List[str]]] = []
         seen = set()  # 用于跟踪已添加的提供商
 
         if providers:
-            logger.debug(f"解析包含分组的model参数: {providers}")
+            logger.debug("解析包含分组的model参数: %s", providers)
             # 清理输入并分割参数
             items = providers.strip().strip(";").split(";")
 
@@ -114,29 +207,86 @@ class Settings(BaseSettings):
 
                 if item in self._groups:
                     # 处理分组中的每个提供商
+                    added = []
                     for provider in self._groups[item]:
                         if provider not in seen:
                             seen.add(provider)
-                            resolved.append(provider)
-                            logger.debug(f"添加分组 {item} 中的提供商: {provider}")
+                            added.append(provider)
+                            logger.debug("添加分组 %s 中的提供商: %s", item, provider)
+                    segments.append((item, added))
                 else:
                     # 处理单个提供商
                     if item not in seen:
                         seen.add(item)
-                        resolved.append(item)
-                        logger.debug(f"添加独立提供商: {item}")
+                        segments.append((None, [item]))
+                        logger.debug("添加独立提供商: %s", item)
 
-                logger.debug(f"当前解析进度: {resolved}")
+                logger.debug("当前解析进度: %s", segments)
         else:
             # 处理默认优先级时也去重
-            seen = set()
+            added = []
             for item in self._priority:
                 if item not in seen:
                     seen.add(item)
-                    resolved.append(item)
+                    added.append(item)
+            segments.append((None, added))
 
-        logger.info(f"最终解析后的去重提供商列表: {resolved}")
-        return resolved
+        return segments
+
+    def split_route_modifier(self, providers: Optional[str]) -> Tuple[Optional[str], Dict]:
+        """
+        拆分 model 字符串末尾的调度修饰符，返回 (提供商字符串, 调度选项)。
+        支持 "@race"、"@race:3"（同时竞速前N个）和 "@hedge:300"（300毫秒后对冲）。
+        """
+        if not providers or ROUTE_MODIFIER_SEPARATOR not in providers:
+            return providers, {}
+
+        base, modifier = providers.rsplit(ROUTE_MODIFIER_SEPARATOR, 1)
+        name, _, value = modifier.strip().partition(":")
+        options = {}
+        try:
+            if name == "race":
+                options["race"] = int(value) if value else None
+            elif name == "hedge":
+                options["hedge_after_ms"] = int(value) if value else None
+            else:
+                raise ValueError(f"未知的调度修饰符: {name}")
+        except ValueError as e:
+            error_msg = f"无法解析调度修饰符 '{modifier}': {str(e)}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        return base, options
+
+    def resolve_route_options(self, providers: Optional[str]) -> Dict:
+        """
+        解析请求的调度选项：先取 model 字符串中第一个带调度选项的分组，
+        再用修饰符覆盖。返回 {"hedge_after_ms": ..., "race": ..., "cache_ttl": ...}。
+        """
+        base, modifier = self.split_route_modifier(providers)
+        items = base.strip().strip(";").split(";") if base else self._priority
+
+        options = {"hedge_after_ms": None, "race": 0, "cache_ttl": None}
+        for item in items:
+            group = self._group_configs.get(item)
+            if group and (group.hedge_after_ms is not None or group.race):
+                options["hedge_after_ms"] = group.hedge_after_ms
+                options["race"] = group.race
+                break
+        for item in items:
+            group = self._group_configs.get(item)
+            if group and group.cache_ttl is not None:
+                options["cache_ttl"] = group.cache_ttl
+                break
+
+        if "race" in modifier:
+            race = modifier["race"]
+            options["race"] = race if race is not None else (options["race"] or RACE_COUNT_DEFAULT)
+        if "hedge_after_ms" in modifier:
+            hedge_after_ms = modifier["hedge_after_ms"]
+            if hedge_after_ms is None:
+                hedge_after_ms = options["hedge_after_ms"]
+            options["hedge_after_ms"] = hedge_after_ms if hedge_after_ms is not None else HEDGE_AFTER_MS_DEFAULT
+        return options
 
     @property
     def AI_PRIORITY(self) -> List[str]:
@@ -155,10 +305,27 @@ class Settings(BaseSettings):
             for name, provider in self._providers.items()
         }
 
+    @property
+    def AI_GROUPS(self) -> Dict[str, List[str]]:
+        """获取分组配置（分组名 -> 提供商列表）"""
+        return dict(self._groups)
+
+    def get_group_config(self, group_name: str) -> Optional[GroupConfig]:
+        """获取指定分组的配置"""
+        return self._group_configs.get(group_name)
+
+    def get_section(self, name: str) -> Dict:
+        """获取配置文件中的顶层配置段，不存在时返回空字典"""
+        return self._config.get(name) or {}
+
     def get_provider_config(self, provider_name: str) -> Optional[ProviderConfig]:
         """获取指定提供商的配置"""
         return self._providers.get(provider_name)
 
+    def get_config_path(self) -> str:
+        """实际加载的配置文件路径"""
+        return self._config_path
+
     class Config:
         """
         Pydantic 配置类
@@ -168,10 +335,19 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-@lru_cache()
-def get_settings():
+_settings: Optional[Settings] = None
+
+def get_settings() -> Settings:
     """
-    获取设置实例的函数
-    使用 lru_cache 装饰器来缓存设置实例，避免重复读取环境变量
+    获取当前生效的设置实例
+    首次调用时加载配置并缓存，避免重复读取环境变量和配置文件；热重载时由 set_settings 整体替换
     """
-    return Settings()
\ No newline at end of file
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+def set_settings(settings: Settings):
+    """替换当前生效的设置实例（热重载校验通过后调用）"""
+    global _settings
+    _settings = settings
@@ -0,0 +1,102 @@
+import random
+from typing import Dict, List, Optional, Sequence
+from .ai_provider import AIProvider
+from ..config.settings import get_settings
+
+EWMA_ALPHA_DEFAULT = 0.3
+EXPLORATION_DEFAULT = 0.05
+# 错误率接近1时的下限，避免得分无穷大
+MIN_SUCCESS_RATE = 0.05
+
+
+class ProviderLatencyStats:
+    """单个提供商的延迟与错误率指数加权移动平均（EWMA）"""
+
+    def __init__(self, name: str, alpha: float = EWMA_ALPHA_DEFAULT):
+        self.name = name
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+
+    def record(self, latency: float, ok: bool):
+        """记录一次真实调用；失败只更新错误率，不计入延迟"""
+        self.samples += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+
+    def score(self) -> float:
+        """期望的每次成功耗时，越小越好；没有样本时为0，优先尝试以积累数据"""
+        if self.latency is None:
+            return 0.0 if self.samples == 0 else float("inf")
+        return self.latency / max(1.0 - self.error_rate, MIN_SUCCESS_RATE)
+
+    def snapshot(self) -> Dict:
+        return {
+            "provider": self.name,
+            "latency_ewma": round(self.latency, 4) if self.latency is not None else None,
+            "error_rate_ewma": round(self.error_rate, 4),
+            "samples": self.samples,
+        }
+
+
+_stats: Dict[str, ProviderLatencyStats] = {}
+
+
+def get_latency_stats(provider_name: str) -> ProviderLatencyStats:
+    """获取提供商的延迟统计，不存在时按配置 adaptive.alpha 创建"""
+    stats = _stats.get(provider_name)
+    if stats is None:
+        alpha = get_settings().get_section("adaptive").get("alpha", EWMA_ALPHA_DEFAULT)
+        stats = ProviderLatencyStats(provider_name, alpha)
+        _stats[provider_name] = stats
+    return stats
+
+
+def get_all_latency_stats() -> List[ProviderLatencyStats]:
+    """获取所有已记录的延迟统计"""
+    return list(_stats.values())
+
+
+def record_call(provider_name: str, latency: float, ok: bool):
+    """记录一次上游调用的耗时与结果"""
+    get_latency_stats(provider_name).record(latency, ok)
+
+
+class AdaptiveSelector:
+    """
+    按 EWMA 得分对分组成员排序，最快且健康的成员排在最前。
+    以 exploration 的概率把随机一个其他成员提到最前，保持统计数据新鲜。
+    """
+
+    def __init__(self, exploration: float = EXPLORATION_DEFAULT):
+        self.exploration = exploration
+
+    def order(self, providers: Sequence[AIProvider]) -> List[AIProvider]:
+        ordered = sorted(providers, key=lambda p: get_latency_stats(p.provider_name).score())
+        if len(ordered) > 1 and random.random() < self.exploration:
+            explored = ordered.pop(random.randrange(1, len(ordered)))
+            ordered.insert(0, explored)
+        return ordered
+
+
+_selector: Optional[AdaptiveSelector] = None
+
+
+def get_adaptive_selector() -> AdaptiveSelector:
+    """获取全局自适应排序器，按配置 adaptive.exploration 创建"""
+    global _selector
+    if _selector is None:
+        config = get_settings().get_section("adaptive")
+        _selector = AdaptiveSelector(config.get("exploration", EXPLORATION_DEFAULT))
+    return _selector
+
+
+def reset_adaptive_selector():
+    """丢弃全局自适应排序器，下次使用时按当前配置重新创建；已积累的延迟统计保留"""
+    global _selector
+    _selector = None
@@ -0,0 +1,239 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, Iterable, List, Optional
+from .state_backend import SQLiteStateBackend, get_state_backend
+from ..config.settings import get_settings
+
+RETRY_AFTER_DEFAULT = 1
+# 共享并发上限下，为排队的请求检查其他 worker 是否空出名额的初始间隔和退避上限（秒）
+ADMISSION_POLL_INTERVAL = 0.02
+ADMISSION_POLL_INTERVAL_MAX = 0.5
+
+
+class ProviderSaturatedError(Exception):
+    """提供商并发已满且等待队列已满"""
+    pass
+
+
+class AdmissionController:
+    """
+    单个提供商的并发准入控制。
+    同时在途的请求数不超过 max_concurrency，超出的请求最多排队 max_queue 个；
+    队列也满时立即拒绝，由故障转移循环转向下一个提供商。
+    """
+
+    def __init__(self, name: str, max_concurrency: Optional[int] = None, max_queue: int = 0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def saturated(self) -> bool:
+        """并发和队列是否都已占满"""
+        if self.max_concurrency is None:
+            return False
+        return self.active >= self.max_concurrency and self.waiting >= self.max_queue
+
+    async def acquire(self) -> bool:
+        """获取一个并发名额；队列已满时立即返回 False"""
+        if self.max_concurrency is None or (self.active < self.max_concurrency and not self._waiters):
+            self.active += 1
+            return True
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # 名额由 release 直接转交，active 计数不变
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 名额已转交但等待者被取消，归还名额
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return True
+
+    def release(self):
+        """归还名额，优先转交给队列中的下一个等待者"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def snapshot(self) -> Dict:
+        return {
+            "provider": self.name,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+
+class SharedAdmissionController(AdmissionController):
+    """
+    max_concurrency 为同一主机上所有 worker 合计的并发上限，名额记录在共享存储中，占用和归还都在后端线程中执行。
+    本 worker 归还名额时直接转交给本 worker 的等待者；其他 worker 释放的名额由每个控制器一个的轮询任务获取，
+    轮询间隔从 ADMISSION_POLL_INTERVAL 开始加倍退避到 ADMISSION_POLL_INTERVAL_MAX，获取到名额后重置。
+    共享存储不可用时按本 worker 的在途数判断。max_queue 限制的是本 worker 的排队数。
+    """
+
+    def __init__(
+        self, name: str, backend: SQLiteStateBackend, max_concurrency: Optional[int] = None, max_queue: int = 0
+    ):
+        super().__init__(name, max_concurrency=max_concurrency, max_queue=max_queue)
+        self.backend = backend
+        # 最近一次从共享存储得知的所有 worker 合计的在途数
+        self.host_active: Optional[int] = None
+        # 共享存储不可用时按本 worker 判断放行的名额，归还时不写共享存储
+        self._local = 0
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def saturated(self) -> bool:
+        if self.max_concurrency is None or self.waiting < self.max_queue:
+            return False
+        host_active = self.host_active if self.host_active is not None else self.active
+        return host_active >= self.max_concurrency
+
+    async def _try_acquire_slot(self) -> bool:
+        future = self.backend.submit(self.backend.try_acquire_slot, self.name, self.max_concurrency)
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 名额可能已在后端线程中占用，得到结果后归还
+            future.add_done_callback(self._release_abandoned)
+            raise
+        if result is None:
+            if self.active >= self.max_concurrency:
+                return False
+            self._local += 1
+            return True
+        acquired, self.host_active = result
+        return acquired
+
+    def _release_abandoned(self, future: Future):
+        result = future.result()
+        if result is None:
+            return
+        if result[0]:
+            self.backend.submit(self.backend.release_slot, self.name)
+
+    async def acquire(self) -> bool:
+        if self.max_concurrency is None:
+            self.active += 1
+            return True
+        if not self._waiters and await self._try_acquire_slot():
+            self.active += 1
+            return True
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        try:
+            # 名额由 release 或轮询任务转交，active 计数已包含
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+        return True
+
+    async def _poll(self):
+        """为本 worker 的等待者获取其他 worker 空出的名额，没有空出时退避"""
+        interval = ADMISSION_POLL_INTERVAL
+        while any(not waiter.done() for waiter in self._waiters):
+            if await self._try_acquire_slot():
+                self.active += 1
+                # 转交给下一个等待者；等待者都已离开时归还
+                self.release()
+                interval = ADMISSION_POLL_INTERVAL
+                continue
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, ADMISSION_POLL_INTERVAL_MAX)
+
+    def release(self):
+        """归还名额：优先转交给本 worker 的等待者（共享存储中的计数不变），否则在后端线程中归还"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        if self.max_concurrency is None:
+            return
+        if self._local:
+            self._local -= 1
+            return
+        self.backend.submit(self.backend.release_slot, self.name)
+
+    def snapshot(self) -> Dict:
+        snapshot = super().snapshot()
+        # 所有 worker 合计的在途请求数（最近一次占用名额时得知）
+        snapshot["host_active"] = self.host_active if self.max_concurrency is not None else None
+        return snapshot
+
+
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(provider_name: str) -> AdmissionController:
+    """获取提供商的准入控制器，不存在时按提供商配置创建；配置了共享状态后端时并发上限为所有 worker 合计"""
+    controller = _controllers.get(provider_name)
+    if controller is None:
+        provider_config = get_settings().get_provider_config(provider_name)
+        kwargs = {}
+        if provider_config:
+            kwargs = dict(max_concurrency=provider_config.max_concurrency, max_queue=provider_config.max_queue)
+        backend = get_state_backend()
+        if backend is not None:
+            controller = SharedAdmissionController(provider_name, backend, **kwargs)
+        else:
+            controller = AdmissionController(provider_name, **kwargs)
+        _controllers[provider_name] = controller
+    return controller
+
+
+def get_admission_controllers() -> List[AdmissionController]:
+    """获取所有已配置提供商的准入控制器"""
+    for provider_name in get_settings().AI_MODELS:
+        get_admission_controller(provider_name)
+    return list(_controllers.values())
+
+
+def reset_admission_controllers(provider_names: Optional[Iterable[str]] = None):
+    """
+    丢弃指定提供商（默认全部）的准入控制器，下次使用时按当前配置重新创建（配置热重载时调用）。
+    在途请求仍在旧控制器上释放名额，因此重载后短时间内的实际并发可能超过新上限。
+    """
+    if provider_names is None:
+        _controllers.clear()
+        return
+    for provider_name in provider_names:
+        _controllers.pop(provider_name, None)
+
+
+def get_retry_after() -> int:
+    """所有提供商都饱和时返回给客户端的 Retry-After（秒）"""
+    return get_settings().get_section("admission").get("retry_after", RETRY_AFTER_DEFAULT)
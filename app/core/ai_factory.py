@@ -1,17 +1,93 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from .ai_provider import (
     AIProvider,
     OpenAIFormatProvider,
     AnthropicProvider,
     OllamaProvider
 )
-from ..config.settings import get_settings
+from .balancer import reset_balance_selectors
+from .client_pool import ClientRegistry, get_client_registry
+from .routing import Route, RoutingTable, ROUTING_MEMO_SIZE_DEFAULT
+from .tokens import get_tokenizer_profile
+from ..config.settings import Settings, get_settings
 from ..utils.logger import logger
 
 class AIFactory:
+    # 提供商实例缓存：实例无请求级状态，可在所有请求间共享
+    _instances: Dict[str, AIProvider] = {}
+    _routing_table: Optional[RoutingTable] = None
+
+    @classmethod
+    def get_provider(cls, provider_name: str) -> AIProvider:
+        """获取缓存的提供商实例，不存在时创建"""
+        provider = cls._instances.get(provider_name)
+        if provider is None:
+            provider = cls.create_provider(provider_name)
+            cls._instances[provider_name] = provider
+        return provider
+
+    @classmethod
+    def build_routing_table(cls, settings: Optional[Settings] = None) -> RoutingTable:
+        """在配置加载时预编译路由表，并预先创建所有提供商实例"""
+        settings = settings or get_settings()
+        table, instances = cls.prepare_routing_table(settings, get_client_registry())
+        cls.install_routing_table(table, instances)
+        return table
+
+    @classmethod
+    def prepare_routing_table(
+        cls, settings: Settings, registry: ClientRegistry
+    ) -> Tuple[RoutingTable, Dict[str, AIProvider]]:
+        """
+        按给定配置和客户端注册表构建路由表及其提供商实例，不影响当前生效的路由表。
+        配置热重载时先在旁边构建好，再通过 install_routing_table 一次性替换。
+        """
+        instances: Dict[str, AIProvider] = {}
+
+        def get_provider(provider_name: str) -> AIProvider:
+            provider = instances.get(provider_name)
+            if provider is None:
+                provider = cls.create_provider(provider_name, settings, registry)
+                instances[provider_name] = provider
+            return provider
+
+        # 负载均衡排序器按新的分组配置重建；旧路由已持有各自的排序器，不受影响
+        reset_balance_selectors()
+        memo_size = settings.get_section("routing").get("memo_size", ROUTING_MEMO_SIZE_DEFAULT)
+        return RoutingTable(settings, get_provider, memo_size=memo_size), instances
+
+    @classmethod
+    def install_routing_table(cls, table: RoutingTable, instances: Dict[str, AIProvider]):
+        """替换当前生效的路由表与提供商实例"""
+        cls._instances = instances
+        cls._routing_table = table
+
+    @classmethod
+    def get_routing_table(cls) -> RoutingTable:
+        """获取路由表，未初始化时按当前配置懒加载"""
+        if cls._routing_table is None:
+            cls.build_routing_table()
+        return cls._routing_table
+
+    @classmethod
+    def reset(cls):
+        """清空实例缓存与路由表（客户端关闭后调用）"""
+        cls._instances = {}
+        cls._routing_table = None
+
+    @classmethod
+    def resolve(cls, model: Optional[str] = None) -> Route:
+        """把请求中的model字符串解析为路由（按顺序排列的提供商实例及调度选项）"""
+        return cls.get_routing_table().resolve(model)
+
     @staticmethod
-    def create_provider(provider_name: str) -> AIProvider:
-        settings = get_settings()
+    def create_provider(
+        provider_name: str,
+        settings: Optional[Settings] = None,
+        registry: Optional[ClientRegistry] = None,
+    ) -> AIProvider:
+        settings = settings or get_settings()
+        registry = registry or get_client_registry()
         logger.info(f"正在创建AI提供商: {provider_name}")
 
         provider_config = settings.get_provider_config(provider_name)
@@ -25,28 +101,37 @@ class AIFactory:
         logger.debug(f"提供商 {provider_name} 的类型为: {provider_type}")
 
         try:
+            # 所有提供商实例共享注册表中的长连接客户端
+            client = registry.get(provider_name)
+
             if provider_type == "openai":
-                return OpenAIFormatProvider(
+                provider = OpenAIFormatProvider(
                     api_key=provider_config.api_key,
                     base_url=provider_config.base_url,
                     model=provider_config.model,
                     max_tokens=provider_config.max_tokens,
-                    provider_name=provider_name
+                    provider_name=provider_name,
+                    client=client
                 )
 
             elif provider_type == "anthropic":
-                return AnthropicProvider(
+                provider = AnthropicProvider(
                     api_key=provider_config.api_key,
                     model=provider_config.model,
-                    max_tokens=provider_config.max_tokens
+                    max_tokens=provider_config.max_tokens,
+                    provider_name=provider_name,
+                    client=client
                 )
 
             elif provider_type == "ollama":
-                return OllamaProvider(
+                provider = OllamaProvider(
                     base_url=provider_config.base_url,
                     model=provider_config.model,
                     max_tokens=provider_config.max_tokens,
-                    provider_name=provider_name
+                    provider_name=provider_name,
+                    client=client,
+                    keep_alive=provider_config.keep_alive,
+                    num_ctx=provider_config.num_ctx,
                 )
 
             else:
@@ -54,6 +139,14 @@ class AIFactory:
                 logger.error(error_msg)
                 raise ValueError(error_msg)
 
+            provider.client_registry = registry
+            # Ollama 会静默截断超出 num_ctx 的提示词，未单独配置窗口时以 num_ctx 作为上下文窗口
+            provider.context_window = provider_config.context_window or provider_config.num_ctx
+            provider.tokenizer = get_tokenizer_profile(provider_config.tokenizer)
+            provider.embedding_model = provider_config.embedding_model
+            provider.fingerprint = provider_config.fingerprint
+            return provider
+
         except Exception as e:
             logger.error(f"创建提供商 {provider_name} 时发生错误: {str(e)}", exc_info=True)
             raise
\ No newline at end of file
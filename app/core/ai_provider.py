@@ -1,30 +1,152 @@
 import time
 from abc import ABC, abstractmethod
-from typing import Optional, List
-from openai import AsyncOpenAI
-from openai.types.chat.chat_completion import ChatCompletion
+from typing import Optional, List, AsyncIterator, Dict, Tuple, Union
+from openai import AsyncOpenAI, NOT_GIVEN as OPENAI_NOT_GIVEN
+from anthropic import AsyncAnthropic, NOT_GIVEN as ANTHROPIC_NOT_GIVEN
 from anthropic.types.message import Message as AnthropicMessage
 from anthropic.types.text_block import TextBlock
 from ollama import AsyncClient as AsyncOllama
 from ollama import Options as OllamaOptions
 from ollama import ChatResponse as OllamaChatCompletion
-from ..models.schemas import ChatMessage, ExtendedChatCompletion
+from .client_pool import ClientRegistry
+from .metrics import record_usage
+from .tokens import DEFAULT_TOKENIZER, TokenizerProfile
+from ..models.schemas import (
+    ChatMessage,
+    ExtendedChatCompletion,
+    ExtendedChatCompletionChunk,
+    build_chat_chunk,
+    build_completion,
+    extend_chunk,
+    extend_completion,
+)
 from ..utils.logger import logger
 
+# 思维链标签
+THINK_OPEN_TAG = "<tink>"
+THINK_CLOSE_TAG = "</tink>"
+
+# Anthropic stop_reason 到 OpenAI finish_reason 的映射
+ANTHROPIC_FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+}
+
+class ReasoningStreamSplitter:
+    """
+    增量拆分流式输出中的 <tink>...</tink> 思维链。
+    只保留可能构成标签前缀的少量字符，不会缓存整段回复。
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "detect"  # detect: 判断是否以思维链开头; reasoning: 思维链中; content: 正文
+        self._strip_reasoning = True
+        self._strip_content = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        """text 末尾与 tag 前缀重合的最大长度"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        """输入一段增量文本，返回 (reasoning_content, content) 增量"""
+        self._buffer += text
+        reasoning, content = "", ""
+
+        if self._state == "detect":
+            stripped = self._buffer.lstrip()
+            if stripped.startswith(THINK_OPEN_TAG):
+                self._buffer = stripped[len(THINK_OPEN_TAG):]
+                self._state = "reasoning"
+            elif THINK_OPEN_TAG.startswith(stripped):
+                # 仍可能是开始标签的一部分，继续等待
+                return "", ""
+            else:
+                self._state = "content"
+
+        if self._state == "reasoning":
+            end = self._buffer.find(THINK_CLOSE_TAG)
+            if end >= 0:
+                reasoning = self._buffer[:end]
+                self._buffer = self._buffer[end + len(THINK_CLOSE_TAG):]
+                self._state = "content"
+                self._strip_content = True
+            else:
+                keep = self._partial_tag_length(self._buffer, THINK_CLOSE_TAG)
+                reasoning = self._buffer[:len(self._buffer) - keep]
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+            if self._strip_reasoning:
+                reasoning = reasoning.lstrip()
+                self._strip_reasoning = not reasoning
+
+        if self._state == "content":
+            content, self._buffer = self._buffer, ""
+            if self._strip_content:
+                content = content.lstrip()
+                self._strip_content = not content
+
+        return reasoning, content
+
+    def flush(self) -> Tuple[str, str]:
+        """流结束时输出剩余缓冲内容"""
+        remaining, self._buffer = self._buffer, ""
+        if self._state == "reasoning":
+            return remaining, ""
+        return "", remaining
+
 class AIProvider(ABC):
+    provider_name: str
+    # 默认的最大生成长度，用于请求未指定 max_tokens 时估算限流预算
+    max_tokens: Optional[int] = None
+    # 持有所用客户端的注册表，由 AIFactory 设置；用于配置热重载后等待旧客户端上的调用结束
+    client_registry: Optional[ClientRegistry] = None
+    # 上下文窗口（token数，None 表示不检查）与估算token数所用的分词器提示，由 AIFactory 按配置设置
+    context_window: Optional[int] = None
+    tokenizer: TokenizerProfile = DEFAULT_TOKENIZER
+    # 是否实现了 create_embeddings；生成向量使用的模型由 AIFactory 按配置设置，None 时使用对话模型
+    supports_embeddings: bool = False
+    embedding_model: Optional[str] = None
+    # 提供商配置（类型、模型、地址）的指纹，由 AIFactory 设置，参与响应缓存的键
+    fingerprint: str = ""
+
     @abstractmethod
     async def generate_response(
         self,
         messages: List[ChatMessage],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
     ) -> ExtendedChatCompletion:
-        """生成AI响应的抽象方法"""
+        """生成AI响应的抽象方法；timeout 为本次调用的超时（秒），由故障转移按请求的截止时间分配"""
+        pass
+
+    @abstractmethod
+    def stream_response(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+    ) -> AsyncIterator[ExtendedChatCompletionChunk]:
+        """以OpenAI格式分块流式生成AI响应的抽象方法"""
         pass
 
+    async def create_embeddings(
+        self, inputs: List[str], timeout: Optional[float] = None
+    ) -> Tuple[List[List[float]], int]:
+        """为一批输入生成向量，返回 (按输入顺序排列的向量, 提示词token数)"""
+        raise NotImplementedError(f"{self.provider_name} 不支持 embeddings")
+
 class OpenAIFormatProvider(AIProvider):
     """通用的OpenAI API格式提供商"""
 
+    supports_embeddings = True
+
     def __init__(
         self,
         api_key: Optional[str],
@@ -32,32 +154,39 @@ class OpenAIFormatProvider(AIProvider):
         model: str,
         max_tokens: int,
         provider_name: str,
+        client: Optional[AsyncOpenAI] = None,
     ):
         self.api_key = api_key
         self.base_url = base_url
         self.model = model
         self.max_tokens = max_tokens
         self.provider_name = provider_name
+        # 通常由工厂注入共享的长连接客户端
+        self.client = client
 
     async def generate_response(
         self,
         messages: List[ChatMessage],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
     ) -> ExtendedChatCompletion:
         try:
-            logger.info(f"[{self.provider_name}] 开始生成响应")
-            logger.debug(f"[{self.provider_name}] 参数: model={self.model}, max_tokens={max_tokens or self.max_tokens}, temperature={temperature or 0.7}")
+            logger.info("[%s] 开始生成响应", self.provider_name)
+            logger.debug("[%s] 参数: model=%s, max_tokens=%s, temperature=%s", self.provider_name, self.model, max_tokens or self.max_tokens, 0.7 if temperature is None else temperature)
 
-            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
-            response = await client.chat.completions.create(
+            if self.client is None:
+                # 未注入共享客户端时创建实例级客户端，之后复用
+                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 max_tokens=max_tokens or self.max_tokens,
-                temperature=temperature or 0.7,
+                temperature=0.7 if temperature is None else temperature,
+                timeout=timeout if timeout is not None else OPENAI_NOT_GIVEN,
             )
 
-            logger.info(f"[{self.provider_name}] 成功生成响应")
+            logger.info("[%s] 成功生成响应", self.provider_name)
 
             try:
                 content = response.choices[0].message.content
@@ -66,55 +195,102 @@ class OpenAIFormatProvider(AIProvider):
             except:
                 pass
 
-            return ExtendedChatCompletion(
-                **response.model_dump(), provider=self.provider_name
+            record_usage(self.provider_name, response.usage)
+            # SDK 返回的对象已经解析过，直接复用，不再序列化后重新校验
+            return extend_completion(response, self.provider_name)
+        except Exception as e:
+            error_msg = f"{self.provider_name} API error: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise Exception(error_msg)
+
+    async def stream_response(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+    ) -> AsyncIterator[ExtendedChatCompletionChunk]:
+        try:
+            logger.info("[%s] 开始流式生成响应", self.provider_name)
+
+            if self.client is None:
+                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens or self.max_tokens,
+                temperature=0.7 if temperature is None else temperature,
+                stream=True,
+                # 最后一个分块携带用量，用于计量和修正限流预算
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    record_usage(self.provider_name, chunk.usage)
+                yield extend_chunk(chunk, self.provider_name)
+
+            logger.info("[%s] 流式响应完成", self.provider_name)
+        except Exception as e:
+            error_msg = f"{self.provider_name} API error: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise Exception(error_msg)
+
+    async def create_embeddings(
+        self, inputs: List[str], timeout: Optional[float] = None
+    ) -> Tuple[List[List[float]], int]:
+        try:
+            logger.debug("[%s] 生成 %s 条向量", self.provider_name, len(inputs))
+            if self.client is None:
+                self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            response = await self.client.embeddings.create(
+                model=self.embedding_model or self.model,
+                input=inputs,
+                timeout=timeout if timeout is not None else OPENAI_NOT_GIVEN,
             )
+            prompt_tokens = response.usage.prompt_tokens if response.usage else 0
+            record_usage(self.provider_name, {"prompt_tokens": prompt_tokens})
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)], prompt_tokens
         except Exception as e:
             error_msg = f"{self.provider_name} API error: {str(e)}"
             logger.error(error_msg, exc_info=True)
             raise Exception(error_msg)
 
 class AnthropicProvider(AIProvider):
-    def __init__(self, api_key: Optional[str], model: str, max_tokens: int):
+    def __init__(
+        self,
+        api_key: Optional[str],
+        model: str,
+        max_tokens: int,
+        provider_name: str = "anthropic",
+        client: Optional[AsyncAnthropic] = None,
+    ):
         self.api_key = api_key
         self.model = model
         self.max_tokens = max_tokens
-        self.provider_name = "anthropic"  # 添加provider名称
+        self.provider_name = provider_name
+        self.client = client
 
     def _convert_anthropic_to_openai_format(
         self, anthropic_response: AnthropicMessage
     ) -> ExtendedChatCompletion:
-        """将Anthropic响应转换为OpenAI格式"""
-        # 创建Choice对象
-        choice = {
-            "finish_reason": anthropic_response.stop_reason or "stop",  # 使用stop_reason
-            "index": 0,
-            "message": {
+        """将Anthropic响应转换为OpenAI格式，一次性构建最终响应对象"""
+        return build_completion(
+            self.provider_name,
+            anthropic_response.id,
+            self.model,
+            int(time.time()),
+            {
                 "role": anthropic_response.role,
+                # 仅提取TextBlock的text并合并内容块
                 "content": "".join(
-                    [
-                        block.text if isinstance(block, TextBlock) else ""  # 仅提取TextBlock的text
-                        for block in anthropic_response.content
-                    ]
-                ),  # 合并内容块
+                    block.text for block in anthropic_response.content if isinstance(block, TextBlock)
+                ),
+            },
+            finish_reason=ANTHROPIC_FINISH_REASONS.get(anthropic_response.stop_reason, "stop"),  # 映射stop_reason
+            usage={
+                "prompt_tokens": anthropic_response.usage.input_tokens,
+                "completion_tokens": anthropic_response.usage.output_tokens,
+                "total_tokens": anthropic_response.usage.input_tokens + anthropic_response.usage.output_tokens,
             },
-            "logprobs": None,  # 根据需要添加logprobs
-        }
-
-        # 创建ChatCompletion对象
-        completion_data = ChatCompletion(
-            **{
-                "id": anthropic_response.id,
-                "choices": [choice],
-                "created": int(time.time()),
-                "model": self.model,
-                "object": "chat.completion",
-                "usage": anthropic_response.usage,  # 使用原始的usage信息
-            }
-        )
-
-        return ExtendedChatCompletion(
-            **completion_data.model_dump(), provider=self.provider_name
         )
 
     async def generate_response(
@@ -122,86 +298,201 @@ class AnthropicProvider(AIProvider):
         messages: List[ChatMessage],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
     ) -> ExtendedChatCompletion:
-        from anthropic import AsyncAnthropic
-
-        logger.info(f"[{self.provider_name}] 开始生成响应")
-        logger.debug(f"[{self.provider_name}] 参数: model={self.model}, max_tokens={max_tokens or self.max_tokens}, temperature={temperature or 0.7}")
+        logger.info("[%s] 开始生成响应", self.provider_name)
+        logger.debug("[%s] 参数: model=%s, max_tokens=%s, temperature=%s", self.provider_name, self.model, max_tokens or self.max_tokens, 0.7 if temperature is None else temperature)
 
         try:
-            client = AsyncAnthropic(api_key=self.api_key)
-            response = await client.messages.create(
+            if self.client is None:
+                self.client = AsyncAnthropic(api_key=self.api_key)
+            response = await self.client.messages.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": str(msg.get("content", ""))}
-                    for msg in messages
-                ],
+                messages=self._build_messages(messages),
                 max_tokens=max_tokens or self.max_tokens,
-                temperature=temperature or 0.7,
+                temperature=0.7 if temperature is None else temperature,
+                timeout=timeout if timeout is not None else ANTHROPIC_NOT_GIVEN,
             )
 
-            logger.info(f"[{self.provider_name}] 成功生成响应")
+            logger.info("[%s] 成功生成响应", self.provider_name)
+            record_usage(self.provider_name, {
+                "prompt_tokens": response.usage.input_tokens,
+                "completion_tokens": response.usage.output_tokens,
+            })
             return self._convert_anthropic_to_openai_format(response)
         except Exception as e:
             error_msg = f"{self.provider_name} API error: {str(e)}"
             logger.error(error_msg, exc_info=True)
             raise Exception(error_msg)
 
+    async def stream_response(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+    ) -> AsyncIterator[ExtendedChatCompletionChunk]:
+        logger.info("[%s] 开始流式生成响应", self.provider_name)
+
+        try:
+            if self.client is None:
+                self.client = AsyncAnthropic(api_key=self.api_key)
+            stream = await self.client.messages.create(
+                model=self.model,
+                messages=self._build_messages(messages),
+                max_tokens=max_tokens or self.max_tokens,
+                temperature=0.7 if temperature is None else temperature,
+                stream=True,
+            )
+
+            message_id = f"anthropic-{int(time.time())}"
+            created = int(time.time())
+            prompt_tokens = 0
+            async for event in stream:
+                if event.type == "message_start":
+                    message_id = event.message.id
+                    prompt_tokens = event.message.usage.input_tokens
+                    yield build_chat_chunk(
+                        self.provider_name, self.model, message_id, created,
+                        {"role": "assistant", "content": ""},
+                    )
+                elif event.type == "content_block_delta":
+                    if event.delta.type == "text_delta":
+                        delta = {"content": event.delta.text}
+                    elif event.delta.type == "thinking_delta":
+                        delta = {"reasoning_content": event.delta.thinking}
+                    else:
+                        continue
+                    yield build_chat_chunk(self.provider_name, self.model, message_id, created, delta)
+                elif event.type == "message_delta":
+                    completion_tokens = event.usage.output_tokens
+                    record_usage(self.provider_name, {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                    })
+                    yield build_chat_chunk(
+                        self.provider_name, self.model, message_id, created, {},
+                        finish_reason=ANTHROPIC_FINISH_REASONS.get(event.delta.stop_reason, "stop"),
+                        usage={
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    )
+
+            logger.info("[%s] 流式响应完成", self.provider_name)
+        except Exception as e:
+            error_msg = f"{self.provider_name} API error: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise Exception(error_msg)
+
+    @staticmethod
+    def _build_messages(messages: List[ChatMessage]) -> List[Dict]:
+        """转换为Anthropic消息格式"""
+        return [
+            {"role": "user", "content": str(msg.get("content", ""))}
+            for msg in messages
+        ]
+
 class OllamaProvider(AIProvider):
+    supports_embeddings = True
+
     def __init__(
-        self, base_url: Optional[str], model: str, max_tokens: int, provider_name: str
+        self,
+        base_url: Optional[str],
+        model: str,
+        max_tokens: int,
+        provider_name: str,
+        client: Optional[AsyncOllama] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        num_ctx: Optional[int] = None,
     ):
         self.base_url = base_url.rstrip("/") if base_url else "http://localhost:11434"
         self.model = model
         self.max_tokens = max_tokens
         self.provider_name = provider_name
+        self.client = client
+        # 模型在最后一次请求后保持加载的时间（如 "30m"，-1 表示常驻），None 使用 Ollama 的默认值
+        self.keep_alive = keep_alive
+        # 上下文长度；每次请求都要传同样的值，否则 Ollama 会按新的长度重新加载模型
+        self.num_ctx = num_ctx
+
+    def _options(self, max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> OllamaOptions:
+        """生成参数：max_tokens 对应 num_predict，限制本地生成的长度"""
+        return OllamaOptions(
+            temperature=0.7 if temperature is None else temperature,
+            num_predict=max_tokens or self.max_tokens,
+            num_ctx=self.num_ctx,
+        )
+
+    async def warm_up(self):
+        """
+        预先把模型加载到内存：空提示词的生成请求只加载模型，不生成内容。
+        使用与正式请求相同的 num_ctx 和 keep_alive，避免第一个请求再次加载。
+        """
+        if self.client is None:
+            self.client = AsyncOllama(host=self.base_url)
+        await self.client.generate(
+            model=self.model,
+            prompt="",
+            options=OllamaOptions(num_ctx=self.num_ctx),
+            keep_alive=self.keep_alive,
+        )
+
+    async def create_embeddings(
+        self, inputs: List[str], timeout: Optional[float] = None
+    ) -> Tuple[List[List[float]], int]:
+        try:
+            logger.debug("[%s] 生成 %s 条向量", self.provider_name, len(inputs))
+            if self.client is None:
+                self.client = AsyncOllama(host=self.base_url)
+            # 与对话请求使用相同的 keep_alive，同一模型兼做对话和向量时不会被反复加载
+            response = await self.client.embed(
+                model=self.embedding_model or self.model,
+                input=inputs,
+                keep_alive=self.keep_alive,
+            )
+            prompt_tokens = response.prompt_eval_count or 0
+            record_usage(self.provider_name, {"prompt_tokens": prompt_tokens})
+            return list(response.embeddings), prompt_tokens
+        except Exception as e:
+            error_msg = f"{self.provider_name} API error: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise Exception(error_msg)
 
     def _convert_ollama_to_openai_format(
         self, ollama_response: OllamaChatCompletion
     ) -> ExtendedChatCompletion:
 
         # 判断是否有思维链
-        if ollama_response.message.content and "</tink>" in ollama_response.message.content:
-            reasoning_content = ollama_response.message.content.split("</tink>")[
+        if ollama_response.message.content and THINK_CLOSE_TAG in ollama_response.message.content:
+            reasoning_content = ollama_response.message.content.split(THINK_CLOSE_TAG)[
                 0
-            ].replace("<tink>", "").strip()
-            message_content = ollama_response.message.content.split("</tink>")[1].strip()
+            ].replace(THINK_OPEN_TAG, "").strip()
+            message_content = ollama_response.message.content.split(THINK_CLOSE_TAG)[1].strip()
         else:
             reasoning_content = None
             message_content = ollama_response.message.content
 
-        """将Ollama响应转换为OpenAI格式"""
-        # 创建Choice对象
-        choice = {
-            "finish_reason": "stop",  # Ollama目前没有提供具体的finish_reason
-            "index": 0,
-            "message": {
+        """将Ollama响应转换为OpenAI格式，一次性构建最终响应对象"""
+        prompt_tokens = ollama_response.prompt_eval_count or 0
+        completion_tokens = ollama_response.eval_count or 0
+        return build_completion(
+            self.provider_name,
+            f"ollama-{int(time.time())}",  # 生成一个唯一ID
+            self.model,
+            int(time.time()),
+            {
                 "role": ollama_response.message.role,
                 "content": message_content,
                 "reasoning_content": reasoning_content,
             },
-            "logprobs": None,
-        }
-
-        # 创建ChatCompletion对象
-        completion_data = ChatCompletion(
-            **{
-                "id": f"ollama-{int(time.time())}",  # 生成一个唯一ID
-                "choices": [choice],
-                "created": int(time.time()),
-                "model": self.model,
-                "object": "chat.completion",
-                "usage": {
-                    "prompt_tokens": ollama_response.prompt_eval_count or 0,
-                    "completion_tokens": ollama_response.eval_count or 0,
-                    "total_tokens": (ollama_response.prompt_eval_count or 0)
-                    + (ollama_response.eval_count or 0),
-                },
-            }
-        )
-
-        return ExtendedChatCompletion(
-            **completion_data.model_dump(), provider=self.provider_name
+            # 达到 num_predict 时 done_reason 为 length
+            finish_reason="length" if ollama_response.done_reason == "length" else "stop",
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
         )
 
     async def generate_response(
@@ -209,28 +500,104 @@ class OllamaProvider(AIProvider):
         messages: List[ChatMessage],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
     ) -> ExtendedChatCompletion:
         try:
-            logger.info(f"[{self.provider_name}] 开始生成响应")
-            logger.debug(f"[{self.provider_name}] 参数: model={self.model}, base_url={self.base_url}, temperature={temperature or 0.7}")
+            logger.info("[%s] 开始生成响应", self.provider_name)
+            logger.debug("[%s] 参数: model=%s, base_url=%s, temperature=%s", self.provider_name, self.model, self.base_url, 0.7 if temperature is None else temperature)
 
-            client = AsyncOllama(host=self.base_url)
-            response = await client.chat(
+            if self.client is None:
+                self.client = AsyncOllama(host=self.base_url)
+            # ollama 客户端不支持单次调用的超时，由故障转移在外层强制执行 timeout
+            response = await self.client.chat(
                 model=self.model,
-                messages=[
-                    {
-                        "role": msg.get("role", "user"),
-                        "content": str(msg.get("content", "")),
-                    }
-                    for msg in messages
-                ],
+                messages=self._build_messages(messages),
                 stream=False,
-                options=OllamaOptions(temperature=temperature or 0.7),
+                options=self._options(max_tokens, temperature),
+                keep_alive=self.keep_alive,
             )
 
-            logger.info(f"[{self.provider_name}] 成功生成响应")
+            logger.info("[%s] 成功生成响应", self.provider_name)
+            record_usage(self.provider_name, {
+                "prompt_tokens": response.prompt_eval_count,
+                "completion_tokens": response.eval_count,
+            })
             return self._convert_ollama_to_openai_format(response)
         except Exception as e:
             error_msg = f"{self.provider_name} API error: {str(e)}"
             logger.error(error_msg, exc_info=True)
             raise Exception(error_msg)
+
+    async def stream_response(
+        self,
+        messages: List[ChatMessage],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+    ) -> AsyncIterator[ExtendedChatCompletionChunk]:
+        try:
+            logger.info("[%s] 开始流式生成响应", self.provider_name)
+
+            if self.client is None:
+                self.client = AsyncOllama(host=self.base_url)
+            stream = await self.client.chat(
+                model=self.model,
+                messages=self._build_messages(messages),
+                stream=True,
+                options=self._options(max_tokens, temperature),
+                keep_alive=self.keep_alive,
+            )
+
+            chunk_id = f"ollama-{int(time.time())}"
+            created = int(time.time())
+            # 增量拆分思维链，不缓存整段回复
+            splitter = ReasoningStreamSplitter()
+            yield build_chat_chunk(
+                self.provider_name, self.model, chunk_id, created,
+                {"role": "assistant", "content": ""},
+            )
+            async for part in stream:
+                reasoning, content = splitter.feed(part.message.content or "")
+                if part.done:
+                    tail_reasoning, tail_content = splitter.flush()
+                    reasoning += tail_reasoning
+                    content += tail_content
+                if reasoning or content:
+                    delta = {}
+                    if reasoning:
+                        delta["reasoning_content"] = reasoning
+                    if content:
+                        delta["content"] = content
+                    yield build_chat_chunk(self.provider_name, self.model, chunk_id, created, delta)
+                if part.done:
+                    prompt_tokens = part.prompt_eval_count or 0
+                    completion_tokens = part.eval_count or 0
+                    record_usage(self.provider_name, {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                    })
+                    yield build_chat_chunk(
+                        self.provider_name, self.model, chunk_id, created, {},
+                        finish_reason="length" if part.done_reason == "length" else "stop",
+                        usage={
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    )
+
+            logger.info("[%s] 流式响应完成", self.provider_name)
+        except Exception as e:
+            error_msg = f"{self.provider_name} API error: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            raise Exception(error_msg)
+
+    @staticmethod
+    def _build_messages(messages: List[ChatMessage]) -> List[Dict]:
+        """转换为Ollama消息格式"""
+        return [
+            {
+                "role": msg.get("role", "user"),
+                "content": str(msg.get("content", "")),
+            }
+            for msg in messages
+        ]
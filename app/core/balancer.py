@@ -0,0 +1,123 @@
+import random
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+from .admission import get_admission_controller
+from .ai_provider import AIProvider
+from ..config.settings import GroupConfig
+from ..utils.logger import logger
+
+# 负载均衡算法
+BALANCE_ROUND_ROBIN = "round_robin"
+BALANCE_LEAST_OUTSTANDING = "least_outstanding"
+BALANCE_P2C = "p2c"
+
+WEIGHT_DEFAULT = 1
+
+
+def _outstanding(provider: AIProvider) -> int:
+    """提供商当前在途（含排队）的请求数"""
+    controller = get_admission_controller(provider.provider_name)
+    return controller.active + controller.waiting
+
+
+class _BalanceSelector(ABC):
+    """
+    负载均衡排序器的基类。
+    每次请求选出一个成员排在最前，其余成员按负载排在后面作为组内故障转移的后备。
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = weights
+
+    def weight(self, provider: AIProvider) -> float:
+        return self.weights.get(provider.provider_name, WEIGHT_DEFAULT)
+
+    def load(self, provider: AIProvider) -> float:
+        """按权重归一化的负载，越小越空闲；权重为0的成员排在最后"""
+        weight = self.weight(provider)
+        if weight <= 0:
+            return float("inf")
+        return (_outstanding(provider) + 1) / weight
+
+    @abstractmethod
+    def pick(self, providers: Sequence[AIProvider]) -> AIProvider:
+        """从权重大于0的成员中选出本次请求优先使用的一个"""
+
+    def order(self, providers: Sequence[AIProvider]) -> List[AIProvider]:
+        members = [p for p in providers if self.weight(p) > 0]
+        if not members:
+            return list(providers)
+        chosen = self.pick(members)
+        rest = sorted((p for p in providers if p is not chosen), key=self.load)
+        return [chosen] + rest
+
+
+class WeightedRoundRobinSelector(_BalanceSelector):
+    """平滑加权轮询（与 nginx 相同的算法），按权重比例交错分配请求"""
+
+    def __init__(self, weights: Dict[str, float]):
+        super().__init__(weights)
+        self._current: Dict[str, float] = {}
+
+    def pick(self, providers: Sequence[AIProvider]) -> AIProvider:
+        total = 0.0
+        best = None
+        for provider in providers:
+            name = provider.provider_name
+            weight = self.weight(provider)
+            self._current[name] = self._current.get(name, 0.0) + weight
+            total += weight
+            if best is None or self._current[name] > self._current[best.provider_name]:
+                best = provider
+        self._current[best.provider_name] -= total
+        return best
+
+
+class LeastOutstandingSelector(_BalanceSelector):
+    """选择按权重归一化后在途请求最少的成员"""
+
+    def pick(self, providers: Sequence[AIProvider]) -> AIProvider:
+        return min(providers, key=self.load)
+
+
+class PowerOfTwoChoicesSelector(_BalanceSelector):
+    """按权重随机抽取两个不同的成员（不放回），选择其中负载较低的一个"""
+
+    def _sample(self, providers: Sequence[AIProvider]) -> AIProvider:
+        return random.choices(providers, weights=[self.weight(p) for p in providers])[0]
+
+    def pick(self, providers: Sequence[AIProvider]) -> AIProvider:
+        if len(providers) == 1:
+            return providers[0]
+        first = self._sample(providers)
+        second = self._sample([p for p in providers if p is not first])
+        return first if self.load(first) <= self.load(second) else second
+
+
+_SELECTOR_CLASSES = {
+    BALANCE_ROUND_ROBIN: WeightedRoundRobinSelector,
+    BALANCE_LEAST_OUTSTANDING: LeastOutstandingSelector,
+    BALANCE_P2C: PowerOfTwoChoicesSelector,
+}
+
+# 分组名 -> 排序器；轮询状态需要在同一分组的所有路由间共享
+_selectors: Dict[str, _BalanceSelector] = {}
+
+
+def get_balance_selector(group_name: str, group: GroupConfig) -> Optional[_BalanceSelector]:
+    """获取分组的负载均衡排序器，不存在时按分组配置创建；算法未知时返回 None"""
+    selector = _selectors.get(group_name)
+    if selector is None:
+        selector_class = _SELECTOR_CLASSES.get(group.balance)
+        if selector_class is None:
+            logger.warning("分组 '%s' 的负载均衡算法未知: %s，按配置顺序尝试", group_name, group.balance)
+            return None
+        selector = selector_class(dict(group.weights))
+        _selectors[group_name] = selector
+        logger.debug("分组 '%s' 使用负载均衡: %s, 权重: %s", group_name, group.balance, group.weights)
+    return selector
+
+
+def reset_balance_selectors():
+    """清空所有分组的排序器（路由表按新配置重建时调用）"""
+    _selectors.clear()
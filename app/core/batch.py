@@ -0,0 +1,113 @@
+import asyncio
+from typing import AsyncIterator, Iterable, Optional, Tuple
+from .ai_factory import AIFactory
+from .deadline import DeadlineExceededError, resolve_deadline
+from .dispatcher import complete
+from .failover import (
+    AllProvidersContextExceededError,
+    AllProvidersFailedError,
+    AllProvidersRateLimitedError,
+    AllProvidersSaturatedError,
+)
+from .metrics import ROUTE_REQUESTS, route_label
+from ..config.settings import get_settings
+from ..models.schemas import AIRequest, BatchItemError, BatchItemResult
+from ..utils.logger import logger
+
+BATCH_MAX_CONCURRENCY_DEFAULT = 8
+BATCH_MAX_ITEMS_DEFAULT = 1000
+
+
+def get_batch_limits() -> Tuple[int, int]:
+    """批量请求的 (并发上限, 单批最大条数)，由配置 batch.max_concurrency / batch.max_items 指定"""
+    config = get_settings().get_section("batch")
+    return (
+        config.get("max_concurrency", BATCH_MAX_CONCURRENCY_DEFAULT),
+        config.get("max_items", BATCH_MAX_ITEMS_DEFAULT),
+    )
+
+
+def _error(index: int, status_code: int, message: str) -> BatchItemResult:
+    return BatchItemResult(index=index, error=BatchItemError(status_code=status_code, message=message))
+
+
+async def run_item(index: int, request: AIRequest) -> BatchItemResult:
+    """
+    执行单个请求，与单条接口使用相同的路由、缓存、合并与故障转移流程。
+    错误不会抛出，而是按单条接口的状态码写入结果。
+    截止时间由请求的 timeout 字段或默认配置决定，从该条请求开始执行时计算。
+    """
+    if request.stream:
+        return _error(index, 400, "批量请求不支持流式输出")
+    try:
+        route = AIFactory.resolve(request.model)
+        deadline = resolve_deadline(request.timeout)
+    except ValueError as e:
+        return _error(index, 400, str(e))
+    if not route.providers:
+        return _error(index, 500, f"没有可用的AI提供商: {request.model}")
+
+    route_name = route_label(route.name)
+    try:
+        response = await complete(route, request, deadline)
+    except DeadlineExceededError as e:
+        ROUTE_REQUESTS.inc(route_name, "deadline_exceeded")
+        return _error(index, 504, str(e))
+    except AllProvidersRateLimitedError as e:
+        ROUTE_REQUESTS.inc(route_name, "rate_limited")
+        return _error(index, 429, str(e))
+    except AllProvidersSaturatedError as e:
+        ROUTE_REQUESTS.inc(route_name, "saturated")
+        return _error(index, 503, str(e))
+    except AllProvidersContextExceededError as e:
+        ROUTE_REQUESTS.inc(route_name, "context_exceeded")
+        return _error(index, 400, str(e))
+    except AllProvidersFailedError as e:
+        ROUTE_REQUESTS.inc(route_name, "error")
+        return _error(index, 500, str(e))
+    except Exception as e:
+        # 单条请求的意外错误不影响批次中的其他请求
+        logger.error("批量请求第 %s 条处理失败: %s", index, e, exc_info=True)
+        ROUTE_REQUESTS.inc(route_name, "error")
+        return _error(index, 500, str(e))
+    ROUTE_REQUESTS.inc(route_name, "success")
+    return BatchItemResult(index=index, response=response)
+
+
+async def run_batch(
+    items: Iterable[Tuple[int, AIRequest]], concurrency: int
+) -> AsyncIterator[BatchItemResult]:
+    """
+    以固定数量的工作协程并发执行请求，按完成顺序产出结果。
+    工作协程从同一个迭代器中按需取出请求，结果队列有界，
+    因此输入可以是惰性读取的大文件，内存占用只与并发数有关。
+    """
+    results: "asyncio.Queue[Optional[BatchItemResult]]" = asyncio.Queue(maxsize=concurrency)
+    iterator = iter(items)
+    failures = []
+
+    async def worker():
+        try:
+            for index, request in iterator:
+                await results.put(await run_item(index, request))
+        except Exception as e:
+            # 读取输入失败等意外异常，由消费者在所有工作协程结束后抛出
+            failures.append(e)
+        await results.put(None)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    logger.info("开始执行批量请求，并发数: %s", concurrency)
+    try:
+        remaining = len(workers)
+        while remaining:
+            result = await results.get()
+            if result is None:
+                remaining -= 1
+                continue
+            yield result
+        if failures:
+            raise failures[0]
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,240 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+from .ai_provider import AIProvider
+from ..config.settings import get_settings
+from ..models.schemas import AIRequest, ExtendedChatCompletionChunk
+from ..utils.logger import logger
+
+CAPTURE_PATH_DEFAULT = "logs/capture.jsonl"
+CAPTURE_BATCH_SIZE_DEFAULT = 256
+CAPTURE_FLUSH_INTERVAL_DEFAULT = 1.0
+CAPTURE_MAX_QUEUE_DEFAULT = 10000
+# 关闭时等待写出剩余记录的最长时间（秒）
+CAPTURE_STOP_TIMEOUT = 5.0
+# 脱敏时替换消息文本的字符，保留原始长度，使回放的请求大小与真实流量一致
+REDACTION_CHAR = "x"
+
+_STOP = object()
+
+
+def redact_messages(messages: Sequence[Dict]) -> List[Dict]:
+    """把消息文本替换为等长的占位字符，保留角色和结构；非文本内容（如图片）替换为类型占位"""
+    redacted = []
+    for message in messages:
+        message = dict(message)
+        content = message.get("content")
+        if isinstance(content, str):
+            message["content"] = REDACTION_CHAR * len(content)
+        elif isinstance(content, list):
+            parts = []
+            for part in content:
+                if isinstance(part, dict) and isinstance(part.get("text"), str):
+                    parts.append({**part, "text": REDACTION_CHAR * len(part["text"])})
+                else:
+                    part_type = part.get("type") if isinstance(part, dict) else None
+                    parts.append({"type": "text", "text": f"[{part_type or 'content'}]"})
+            message["content"] = parts
+        redacted.append(message)
+    return redacted
+
+
+class CaptureEntry:
+    """一个请求的捕获记录：请求开始时创建，结束时交给后台线程序列化并写入"""
+
+    __slots__ = ("capture", "request", "providers", "arrived_at", "started", "ttfb", "provider", "usage")
+
+    def __init__(self, capture: "TrafficCapture", request: AIRequest, providers: Sequence[AIProvider]):
+        self.capture = capture
+        self.request = request
+        self.providers = [p.provider_name for p in providers]
+        self.arrived_at = time.time()
+        self.started = time.monotonic()
+        self.ttfb: Optional[float] = None
+        self.provider: Optional[str] = None
+        self.usage = None
+
+    def observe_chunk(self, chunk: ExtendedChatCompletionChunk):
+        """流式响应的每个分块：记录首个分块的时间、实际使用的提供商和最后给出的 usage"""
+        if self.ttfb is None:
+            self.ttfb = time.monotonic() - self.started
+        self.provider = chunk.provider
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+
+    def finish(self, outcome: str, provider: Optional[str] = None, usage=None):
+        latency = time.monotonic() - self.started
+        if provider is not None:
+            self.provider = provider
+        if usage is not None:
+            self.usage = usage
+        self.capture.submit(self, outcome, latency)
+
+
+class TrafficCapture:
+    """
+    流量捕获：把每个请求的到达时间、请求体、解析后的提供商、实际使用的提供商、耗时和token用量
+    追加写入 JSONL 文件，供 benchmarks.replay 回放。
+    请求路径上只把记录放入有界队列；序列化和写文件由后台线程按批完成，
+    队列满时丢弃记录并计数，不阻塞请求。
+    """
+
+    def __init__(
+        self,
+        path: str = CAPTURE_PATH_DEFAULT,
+        redact: bool = False,
+        batch_size: int = CAPTURE_BATCH_SIZE_DEFAULT,
+        flush_interval: float = CAPTURE_FLUSH_INTERVAL_DEFAULT,
+        max_queue: int = CAPTURE_MAX_QUEUE_DEFAULT,
+    ):
+        self.path = path
+        self.redact = redact
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.captured = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue: "queue.Queue" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self, request: AIRequest, providers: Sequence[AIProvider]) -> CaptureEntry:
+        return CaptureEntry(self, request, providers)
+
+    def submit(self, entry: CaptureEntry, outcome: str, latency: float):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((entry, outcome, latency))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._thread.start()
+
+    def to_record(self, entry: CaptureEntry, outcome: str, latency: float) -> Dict:
+        request = entry.request.model_dump(exclude_none=True)
+        if self.redact:
+            request["messages"] = redact_messages(request["messages"])
+        usage = entry.usage
+        return {
+            "ts": round(entry.arrived_at, 6),
+            "request": request,
+            "providers": entry.providers,
+            "provider": entry.provider,
+            "outcome": outcome,
+            "latency_ms": round(latency * 1000, 3),
+            "ttfb_ms": None if entry.ttfb is None else round(entry.ttfb * 1000, 3),
+            "usage": None if usage is None else {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+            },
+        }
+
+    def _next_batch(self) -> Optional[list]:
+        """阻塞等待第一条记录，之后最多再等 flush_interval 秒凑满一批；收到停止信号且没有待写的记录时返回 None"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # 写完当前批次后退出
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                lines = []
+                for entry, outcome, latency in batch:
+                    try:
+                        record = self.to_record(entry, outcome, latency)
+                        lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    except Exception as e:
+                        logger.warning("流量捕获记录无法序列化，已跳过: %s", e)
+                f.write("".join(lines))
+                f.flush()
+                self.captured += len(lines)
+                self.batches += 1
+
+    def stop(self, timeout: Optional[float] = None):
+        """写完队列中剩余的记录后停止后台线程；timeout 为 None 时不等待"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        if timeout is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "redact": self.redact,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+        }
+
+
+_capture: Optional[TrafficCapture] = None
+_capture_loaded = False
+
+
+def get_traffic_capture() -> Optional[TrafficCapture]:
+    """获取流量捕获；配置中未启用（capture.enabled）时返回 None"""
+    global _capture, _capture_loaded
+    if not _capture_loaded:
+        config = get_settings().get_section("capture")
+        if config.get("enabled", False):
+            _capture = TrafficCapture(
+                path=config.get("path", CAPTURE_PATH_DEFAULT),
+                redact=config.get("redact", False),
+                batch_size=config.get("batch_size", CAPTURE_BATCH_SIZE_DEFAULT),
+                flush_interval=config.get("flush_interval", CAPTURE_FLUSH_INTERVAL_DEFAULT),
+                max_queue=config.get("max_queue", CAPTURE_MAX_QUEUE_DEFAULT),
+            )
+            logger.info("流量捕获已启用: %s（脱敏: %s）", _capture.path, _capture.redact)
+        _capture_loaded = True
+    return _capture
+
+
+def reset_traffic_capture():
+    """停止当前的流量捕获（后台写完剩余记录），下次使用时按当前配置重新创建（capture 配置热重载时调用）"""
+    global _capture, _capture_loaded
+    if _capture is not None:
+        _capture.stop()
+    _capture = None
+    _capture_loaded = False
+
+
+def close_traffic_capture():
+    """应用关闭时写出剩余的记录"""
+    global _capture, _capture_loaded
+    if _capture is not None:
+        _capture.stop(CAPTURE_STOP_TIMEOUT)
+    _capture = None
+    _capture_loaded = False
@@ -0,0 +1,254 @@
+import time
+from concurrent.futures import Future
+from enum import Enum
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from .ai_provider import AIProvider
+from .state_backend import SQLiteStateBackend, get_state_backend, wall_to_monotonic
+from ..config.settings import get_settings
+from ..utils.logger import logger
+
+FAILURE_THRESHOLD_DEFAULT = 5
+RECOVERY_TIMEOUT_DEFAULT = 30.0
+HALF_OPEN_MAX_CALLS_DEFAULT = 1
+
+# 熔断中的提供商的处理方式：last 移到解析顺序末尾作为最后手段，skip 直接跳过
+OPEN_POLICY_LAST = "last"
+OPEN_POLICY_SKIP = "skip"
+
+
+class ProviderCircuitOpenError(Exception):
+    """提供商熔断中且配置为跳过（open_policy: skip），没有发送请求"""
+    pass
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    单个提供商的熔断器。
+    - closed: 正常放行，连续失败达到阈值后进入 open
+    - open: 冷却期内不放行，冷却结束后进入 half_open
+    - half_open: 只放行有限的探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = FAILURE_THRESHOLD_DEFAULT,
+        recovery_timeout: float = RECOVERY_TIMEOUT_DEFAULT,
+        half_open_max_calls: int = HALF_OPEN_MAX_CALLS_DEFAULT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.total_successes = 0
+        self.total_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> CircuitState:
+        """当前状态，冷却期结束时惰性切换到 half_open"""
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info("熔断器 %s 冷却结束，进入半开状态", self.name)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否放行一次请求；半开状态下会占用一个探测名额"""
+        state = self.state
+        if state == CircuitState.CLOSED or not self.enabled:
+            return True
+        if state == CircuitState.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        return False
+
+    def release(self):
+        """请求被取消且没有结果时，归还半开状态下占用的探测名额"""
+        if self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self):
+        self.total_successes += 1
+        self._failures = 0
+        if self._state != CircuitState.CLOSED:
+            logger.info("熔断器 %s 恢复为关闭状态", self.name)
+        self._state = CircuitState.CLOSED
+        self._half_open_calls = 0
+
+    def record_failure(self):
+        self.total_failures += 1
+        if not self.enabled:
+            return
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != CircuitState.OPEN:
+                logger.warning(
+                    "熔断器 %s 打开：连续失败 %s 次，冷却 %s 秒", self.name, self._failures, self.recovery_timeout
+                )
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+            self._half_open_calls = 0
+
+    def snapshot(self) -> Dict:
+        """供管理接口展示的状态快照"""
+        state = self.state
+        retry_after = 0.0
+        if state == CircuitState.OPEN:
+            retry_after = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        return {
+            "provider": self.name,
+            "state": state.value,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "retry_after": round(retry_after, 3),
+            "total_successes": self.total_successes,
+            "total_failures": self.total_failures,
+        }
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """
+    在同一主机的多个 worker 之间共享打开/关闭状态的熔断器。
+    状态变化在后端线程中写入共享存储；本地状态超过 sync_interval 未同步时在后台读取一次，
+    结果在之后的检查中应用，其他 worker 大约 sync_interval 秒后同步到，检查本身从不等待数据库。
+    连续失败计数和半开探测名额仍按 worker 统计。
+    """
+
+    def __init__(self, name: str, backend: SQLiteStateBackend, **kwargs):
+        super().__init__(name, **kwargs)
+        self.backend = backend
+        # 本地状态对应的共享记录的变更时间（time.time()），只采纳比它新的记录
+        self._changed_at = 0.0
+        self._synced_at = float("-inf")
+        self._pending: Optional[Future] = None
+
+    @property
+    def state(self) -> CircuitState:
+        self._sync()
+        return super().state
+
+    def _sync(self):
+        """应用已完成的后台读取；距上次同步超过 sync_interval 时提交新的读取，不等待结果"""
+        pending = self._pending
+        if pending is not None:
+            if not pending.done():
+                return
+            self._pending = None
+            self._apply(pending.result())
+        now = time.monotonic()
+        if now - self._synced_at < self.backend.sync_interval:
+            return
+        self._synced_at = now
+        self._pending = self.backend.submit(self.backend.load_breaker, self.name)
+
+    def _apply(self, row: Optional[Tuple[str, float, float]]):
+        if row is None or row[2] <= self._changed_at:
+            return
+        state, opened_at, self._changed_at = row
+        if state == CircuitState.OPEN.value:
+            if self._state != CircuitState.OPEN:
+                logger.warning("熔断器 %s 已被其他 worker 打开", self.name)
+            self._state = CircuitState.OPEN
+            self._opened_at = wall_to_monotonic(opened_at)
+            self._half_open_calls = 0
+        elif self._state != CircuitState.CLOSED:
+            logger.info("熔断器 %s 已被其他 worker 恢复为关闭状态", self.name)
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def _publish(self):
+        now = time.time()
+        self._changed_at = now
+        opened_at = now - (time.monotonic() - self._opened_at)
+        self.backend.submit(self.backend.save_breaker, self.name, self._state.value, opened_at, now)
+
+    def record_success(self):
+        previous = self._state
+        super().record_success()
+        if previous != CircuitState.CLOSED:
+            self._publish()
+
+    def record_failure(self):
+        previous = self._state
+        super().record_failure()
+        if self._state == CircuitState.OPEN and previous != CircuitState.OPEN:
+            self._publish()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(provider_name: str) -> CircuitBreaker:
+    """获取提供商的熔断器，不存在时按提供商配置创建；配置了共享状态后端时在 worker 之间共享状态"""
+    breaker = _breakers.get(provider_name)
+    if breaker is None:
+        provider_config = get_settings().get_provider_config(provider_name)
+        kwargs = {}
+        if provider_config:
+            kwargs = dict(
+                failure_threshold=provider_config.failure_threshold,
+                recovery_timeout=provider_config.recovery_timeout,
+                half_open_max_calls=provider_config.half_open_max_calls,
+            )
+        backend = get_state_backend()
+        if backend is not None:
+            breaker = SharedCircuitBreaker(provider_name, backend, **kwargs)
+        else:
+            breaker = CircuitBreaker(provider_name, **kwargs)
+        _breakers[provider_name] = breaker
+    return breaker
+
+
+def get_circuit_breakers() -> List[CircuitBreaker]:
+    """获取所有已配置提供商的熔断器"""
+    for provider_name in get_settings().AI_MODELS:
+        get_circuit_breaker(provider_name)
+    return list(_breakers.values())
+
+
+def reset_circuit_breakers(provider_names: Optional[Iterable[str]] = None):
+    """
+    丢弃指定提供商（默认全部）的熔断器，下次使用时按当前配置重新创建（配置热重载时调用）。
+    在途请求的结果仍记录在旧熔断器上，不影响新实例。
+    """
+    if provider_names is None:
+        _breakers.clear()
+        return
+    for provider_name in provider_names:
+        _breakers.pop(provider_name, None)
+
+
+def get_open_policy() -> str:
+    """熔断中的提供商的处理方式"""
+    return get_settings().get_section("circuit_breaker").get("open_policy", OPEN_POLICY_LAST)
+
+
+def order_by_health(providers: Sequence[AIProvider], open_policy: str = OPEN_POLICY_LAST) -> List[AIProvider]:
+    """把熔断中的提供商移到末尾（或直接跳过），其余保持原有顺序"""
+    available, opened = [], []
+    for provider in providers:
+        if get_circuit_breaker(provider.provider_name).state == CircuitState.OPEN:
+            opened.append(provider)
+        else:
+            available.append(provider)
+    if opened:
+        logger.debug("熔断中的提供商: %s", [p.provider_name for p in opened])
+    if open_policy == OPEN_POLICY_SKIP:
+        return available
+    return available + opened
@@ -0,0 +1,177 @@
+import asyncio
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+import anthropic
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient as OpenAIHttpxClient
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient as AnthropicHttpxClient
+from ollama import AsyncClient as AsyncOllama
+from ..config.settings import Settings, ProviderConfig, get_settings
+from ..utils.logger import logger
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 关闭旧注册表前检查在途调用的间隔（秒）
+DRAIN_POLL_INTERVAL = 0.1
+
+
+def _pool_options(limits_type: type, timeout_type: type, config: ProviderConfig) -> Tuple[Any, Any]:
+    """
+    按提供商配置构建连接池限制和超时，类型必须来自SDK实际使用的HTTP库。
+    openai/anthropic SDK 内部使用的可能不是顶层的 httpx 包，混用另一个包的 Timeout 会被当作单个数值，
+    未逐次传入 timeout 的调用（如流式请求）在建立连接时就会出错。
+    """
+    limits = limits_type(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry,
+    )
+    return limits, timeout_type(config.read_timeout, connect=config.connect_timeout)
+
+
+class ClientRegistry:
+    """
+    上游SDK客户端注册表。
+    每个配置的提供商持有一个长连接客户端，所有请求共享同一个连接池，
+    避免每次调用都重新进行 TCP/TLS 握手。
+    """
+
+    def __init__(self, settings: Settings):
+        self._settings = settings
+        self._clients: Dict[str, Any] = {}
+        # 正在使用本注册表客户端的上游调用数（含未结束的流）
+        self.in_flight = 0
+
+    def acquire(self):
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+
+    def adopt(self, other: "ClientRegistry", provider_names: Iterable[str]):
+        """复用另一个注册表中指定提供商的客户端（配置热重载时保留未变更提供商的连接池）"""
+        for name in provider_names:
+            client = other._clients.get(name)
+            if client is not None:
+                self._clients[name] = client
+
+    def discard(self, provider_names: Iterable[str]):
+        """移除指定提供商的客户端但不关闭，之后关闭本注册表时不会关闭它们（所有权已交给其他注册表）"""
+        for name in provider_names:
+            self._clients.pop(name, None)
+
+    def start(self):
+        """预先为所有已配置的提供商创建客户端"""
+        for name in self._settings.AI_MODELS:
+            self.get(name)
+        logger.info("客户端注册表初始化完成，共 %s 个客户端", len(self._clients))
+
+    def get(self, provider_name: str) -> Any:
+        """获取指定提供商的客户端，不存在时按配置创建"""
+        client = self._clients.get(provider_name)
+        if client is None:
+            provider_config = self._settings.get_provider_config(provider_name)
+            if not provider_config:
+                error_msg = f"未找到提供商配置: {provider_name}"
+                logger.error(error_msg)
+                raise ValueError(error_msg)
+            client = self._build_client(provider_name, provider_config)
+            self._clients[provider_name] = client
+        return client
+
+    def _build_client(self, provider_name: str, config: ProviderConfig) -> Any:
+        """根据提供商类型创建带连接池配置的客户端"""
+        http2 = config.http2
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("[%s] 未安装 h2，HTTP/2 已禁用（pip install 'httpx[http2]'）", provider_name)
+            http2 = False
+
+        logger.debug(
+            "[%s] 创建客户端: type=%s, max_connections=%s, keepalive_expiry=%s, http2=%s",
+            provider_name, config.type, config.max_connections, config.keepalive_expiry, http2,
+        )
+
+        if config.type == "openai":
+            limits, timeout = _pool_options(type(openai.DEFAULT_CONNECTION_LIMITS), openai.Timeout, config)
+            return AsyncOpenAI(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                max_retries=config.max_retries,
+                http_client=OpenAIHttpxClient(limits=limits, timeout=timeout, http2=http2),
+            )
+        elif config.type == "anthropic":
+            limits, timeout = _pool_options(type(anthropic.DEFAULT_CONNECTION_LIMITS), anthropic.Timeout, config)
+            return AsyncAnthropic(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                max_retries=config.max_retries,
+                http_client=AnthropicHttpxClient(limits=limits, timeout=timeout, http2=http2),
+            )
+        elif config.type == "ollama":
+            base_url = config.base_url.rstrip("/") if config.base_url else "http://localhost:11434"
+            limits, timeout = _pool_options(httpx.Limits, httpx.Timeout, config)
+            return AsyncOllama(host=base_url, limits=limits, timeout=timeout, http2=http2)
+        else:
+            error_msg = f"不支持的提供商类型: {config.type}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+
+    async def aclose(self):
+        """关闭所有客户端，释放连接池"""
+        for name, client in list(self._clients.items()):
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning("关闭提供商 %s 的客户端失败: %s", name, e)
+        self._clients.clear()
+        logger.info("客户端注册表已关闭")
+
+    async def drain(self, timeout: float, poll_interval: float = DRAIN_POLL_INTERVAL):
+        """等待本注册表客户端上的在途调用结束（最多 timeout 秒）后关闭所有客户端"""
+        deadline = time.monotonic() + timeout
+        try:
+            while self.in_flight > 0 and time.monotonic() < deadline:
+                await asyncio.sleep(poll_interval)
+            if self.in_flight > 0:
+                logger.warning("等待旧客户端的在途调用超时，仍有 %s 个调用，强制关闭", self.in_flight)
+        finally:
+            # 应用关闭时会取消等待，此时直接关闭
+            await self.aclose()
+
+
+_registry: Optional[ClientRegistry] = None
+
+
+def get_client_registry() -> ClientRegistry:
+    """获取全局客户端注册表，未初始化时按当前配置懒加载"""
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry(get_settings())
+    return _registry
+
+
+def init_client_registry(settings: Settings) -> ClientRegistry:
+    """在应用启动时创建并预热客户端注册表"""
+    global _registry
+    _registry = ClientRegistry(settings)
+    _registry.start()
+    return _registry
+
+
+def set_client_registry(registry: ClientRegistry):
+    """替换全局客户端注册表（配置热重载时调用），原注册表由调用方负责关闭"""
+    global _registry
+    _registry = registry
+
+
+async def close_client_registry():
+    """在应用关闭时关闭所有客户端"""
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import signal
+import time
+from typing import Dict, List, Optional, Set
+from .adaptive import reset_adaptive_selector
+from .admission import reset_admission_controllers
+from .ai_factory import AIFactory
+from .capture import reset_traffic_capture
+from .circuit_breaker import reset_circuit_breakers
+from .embeddings import reset_embedding_batchers
+from .client_pool import ClientRegistry, get_client_registry, set_client_registry
+from .failover import reset_hedge_limiter
+from .rate_limit import reset_rate_limiters
+from .response_cache import reset_response_cache
+from .singleflight import reset_singleflight
+from .state_backend import get_state_backend, reset_state_backend
+from .warmup import start_warmup
+from ..config.settings import Settings, get_settings, set_settings
+from ..utils.logger import logger
+
+# 旧客户端等待在途调用结束的最长时间（秒），默认与上游读超时一致
+DRAIN_TIMEOUT_DEFAULT = 600.0
+# 监视配置文件时检查修改时间的间隔（秒）
+WATCH_INTERVAL_DEFAULT = 2.0
+
+
+def _reset_shared_state():
+    """状态后端变更时，依赖它的熔断、准入、限流和缓存状态都按新后端重建"""
+    reset_state_backend()
+    reset_circuit_breakers()
+    reset_admission_controllers()
+    reset_rate_limiters()
+    reset_response_cache()
+
+
+# 顶层配置段 -> 该段变更时需要按新配置重建的全局组件
+_SECTION_RESETS = {
+    "state": _reset_shared_state,
+    "cache": reset_response_cache,
+    "singleflight": reset_singleflight,
+    "hedging": reset_hedge_limiter,
+    "adaptive": reset_adaptive_selector,
+    "capture": reset_traffic_capture,
+    "embeddings": reset_embedding_batchers,
+}
+
+
+class ConfigReloadError(Exception):
+    """新配置无法加载或校验失败，当前配置保持不变"""
+
+
+def diff_providers(old: Settings, new: Settings) -> Dict[str, List[str]]:
+    """比较两份配置中的提供商，返回新增、删除和配置有变化的提供商名"""
+    old_providers = old.get_section("providers")
+    new_providers = new.get_section("providers")
+    return {
+        "added": [name for name in new_providers if name not in old_providers],
+        "removed": [name for name in old_providers if name not in new_providers],
+        "changed": [
+            name for name in new_providers
+            if name in old_providers and new_providers[name] != old_providers[name]
+        ],
+    }
+
+
+def _file_version(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        # 编辑器保存时可能短暂删除文件，下次检查再处理
+        return None
+
+
+class ConfigReloader:
+    """
+    配置热重载：
+    1. 在线程中加载并校验新配置（沿用 Settings._load_config 的检查），失败时保持当前配置不变；
+    2. 在旁边创建新的客户端注册表、提供商实例和路由表，未变更的提供商复用原有客户端和连接池；
+    3. 一次性替换配置、注册表和路由表（中间没有 await，请求看不到半新半旧的状态），
+       并丢弃变更/删除的提供商的熔断、准入和限流状态；
+    4. 旧注册表中不再使用的客户端等在途调用（含流式响应）结束后关闭。
+    可由 SIGHUP、管理接口或配置文件监视触发。
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._drains: Set[asyncio.Task] = set()
+        # 由信号触发的重载任务，需要保留引用以免被回收
+        self._signal_tasks: Set[asyncio.Task] = set()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._signal_installed = False
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_reload_at: Optional[float] = None
+
+    async def reload(self) -> Dict:
+        """重新加载配置文件并原子替换路由状态，返回提供商的变化"""
+        async with self._lock:
+            try:
+                return await self._reload()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error("配置重载失败，保持当前配置: %s", e)
+                raise ConfigReloadError(str(e)) from e
+
+    async def _reload(self) -> Dict:
+        old_settings = get_settings()
+        # 读取和解析文件放到线程中，不阻塞事件循环
+        new_settings = await asyncio.to_thread(Settings)
+        diff = diff_providers(old_settings, new_settings)
+        stale = diff["changed"] + diff["removed"]
+        unchanged = [name for name in new_settings.AI_MODELS if name not in diff["added"] and name not in stale]
+
+        old_registry = get_client_registry()
+        registry = ClientRegistry(new_settings)
+        registry.adopt(old_registry, unchanged)
+        try:
+            registry.start()
+            table, instances = AIFactory.prepare_routing_table(new_settings, registry)
+        except Exception:
+            # 只关闭新建的客户端，复用的客户端仍归旧注册表所有
+            registry.discard(unchanged)
+            await registry.aclose()
+            raise
+
+        # 以下替换之间没有 await，对事件循环中的请求是原子的
+        set_settings(new_settings)
+        set_client_registry(registry)
+        AIFactory.install_routing_table(table, instances)
+        reset_circuit_breakers(stale)
+        reset_admission_controllers(stale)
+        reset_rate_limiters(stale)
+        for section, reset in _SECTION_RESETS.items():
+            if old_settings.get_section(section) != new_settings.get_section(section):
+                reset()
+        if stale:
+            # 共享存储中这些提供商的熔断和限流状态也按新配置重新开始
+            backend = get_state_backend()
+            if backend is not None:
+                backend.submit(backend.reset, stale)
+            # 缓存键包含提供商配置指纹，变更前的结果不会再命中，随 TTL 和容量淘汰，无需清空缓存
+
+        old_registry.discard(unchanged)
+        self._drain(old_registry, old_settings)
+        # 新增和变更的 Ollama 提供商在后台预热，不阻塞重载
+        await start_warmup(new_settings, diff["added"] + diff["changed"], wait=False)
+
+        self.reloads += 1
+        self.last_error = None
+        self.last_reload_at = time.time()
+        logger.info(
+            "配置重载完成: 新增 %s，删除 %s，变更 %s", diff["added"], diff["removed"], diff["changed"]
+        )
+        return diff
+
+    def _drain(self, registry: ClientRegistry, settings: Settings):
+        """后台等待旧注册表的在途调用结束后关闭其客户端"""
+        timeout = settings.get_section("reload").get("drain_timeout", DRAIN_TIMEOUT_DEFAULT)
+        task = asyncio.create_task(registry.drain(timeout))
+        self._drains.add(task)
+        task.add_done_callback(self._drains.discard)
+
+    async def _reload_quietly(self):
+        try:
+            await self.reload()
+        except ConfigReloadError:
+            pass
+
+    def _on_sighup(self):
+        logger.info("收到 SIGHUP，重新加载配置")
+        task = asyncio.create_task(self._reload_quietly())
+        self._signal_tasks.add(task)
+        task.add_done_callback(self._signal_tasks.discard)
+
+    async def _watch(self, interval: float):
+        """轮询配置文件的修改时间，变化时触发重载"""
+        path = get_settings().get_config_path()
+        version = _file_version(path)
+        logger.info("开始监视配置文件: %s，检查间隔 %s 秒", path, interval)
+        while True:
+            await asyncio.sleep(interval)
+            current = _file_version(path)
+            if current is None or current == version:
+                continue
+            version = current
+            logger.info("检测到配置文件变化: %s", path)
+            await self._reload_quietly()
+
+    def start(self, settings: Settings):
+        """在应用启动时按配置注册 SIGHUP 处理并启动文件监视"""
+        config = settings.get_section("reload")
+        if config.get("sighup", True) and hasattr(signal, "SIGHUP"):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self._on_sighup)
+                self._signal_installed = True
+                logger.info("已注册 SIGHUP 配置重载")
+            except (NotImplementedError, RuntimeError, ValueError) as e:
+                # 非主线程或不支持信号的事件循环
+                logger.warning("无法注册 SIGHUP 配置重载: %s", e)
+        if config.get("watch", False):
+            interval = config.get("interval", WATCH_INTERVAL_DEFAULT)
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    async def stop(self):
+        """在应用关闭时停止监视，并立即关闭仍在等待的旧客户端"""
+        if self._signal_installed:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+            self._signal_installed = False
+        tasks = list(self._drains)
+        if self._watch_task is not None:
+            tasks.append(self._watch_task)
+            self._watch_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict:
+        return {
+            "config_path": get_settings().get_config_path(),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_reload_at": self.last_reload_at,
+            "draining_registries": len(self._drains),
+            "watching": self._watch_task is not None,
+        }
+
+
+_reloader: Optional[ConfigReloader] = None
+
+
+def get_config_reloader() -> ConfigReloader:
+    """获取全局配置重载器"""
+    global _reloader
+    if _reloader is None:
+        _reloader = ConfigReloader()
+    return _reloader
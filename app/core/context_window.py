@@ -0,0 +1,71 @@
+from typing import List, Optional, Tuple
+from .ai_provider import AIProvider
+from .tokens import PromptEstimate
+from ..config.settings import get_settings
+from ..models.schemas import AIRequest, ChatMessage
+from ..utils.logger import logger
+
+TRIM_DEFAULT = False
+
+
+class ContextWindowExceededError(Exception):
+    """请求的提示词加最大生成长度超出提供商的上下文窗口，未发送请求"""
+
+    def __init__(self, provider_name: str, required: int, context_window: int):
+        super().__init__(f"{provider_name} 上下文窗口不足（需要约 {required} token，窗口 {context_window}）")
+        self.provider_name = provider_name
+        self.required = required
+        self.context_window = context_window
+
+
+def is_trim_enabled() -> bool:
+    """配置 context.trim 开启时，放不下的对话丢弃最早的非system消息后再尝试，而不是直接跳过"""
+    return get_settings().get_section("context").get("trim", TRIM_DEFAULT)
+
+
+def required_tokens(provider: AIProvider, request: AIRequest, prompt_tokens: int) -> int:
+    """一次请求在该提供商上预计占用的token数（提示词 + 最大生成长度）"""
+    return prompt_tokens + (request.max_tokens or provider.max_tokens or 0)
+
+
+def fits(provider: AIProvider, request: AIRequest, prompt_tokens: int) -> bool:
+    return provider.context_window is None or required_tokens(provider, request, prompt_tokens) <= provider.context_window
+
+
+def trim_messages(
+    messages: List[ChatMessage], message_tokens: List[int], budget: int
+) -> Optional[Tuple[List[ChatMessage], int]]:
+    """
+    从最早的非system消息开始丢弃，直到估算的token数不超过 budget。
+    保留所有system消息和最后一条消息；剩余对话以用户消息开头（一并丢弃孤立的助手回复和工具结果）。
+    返回保留的消息及其token数；保留的内容仍超出预算时返回 None。
+    """
+    total = sum(message_tokens)
+    last = len(messages) - 1
+    dropped = set()
+    for index, message in enumerate(messages[:last]):
+        if message.get("role") == "system":
+            continue
+        if total <= budget and message.get("role") == "user":
+            break
+        dropped.add(index)
+        total -= message_tokens[index]
+    if total > budget:
+        return None
+    return [message for index, message in enumerate(messages) if index not in dropped], total
+
+
+def trim_to_fit(
+    provider: AIProvider, request: AIRequest, prompt: PromptEstimate
+) -> Optional[Tuple[AIRequest, int]]:
+    """裁剪对话以放入提供商的上下文窗口，返回裁剪后的请求及其提示词token数；无法放入时返回 None"""
+    budget = provider.context_window - required_tokens(provider, request, 0)
+    trimmed = trim_messages(request.messages, prompt.message_tokens(provider.tokenizer), budget)
+    if trimmed is None:
+        return None
+    messages, prompt_tokens = trimmed
+    logger.info(
+        "对话超出 %s 的上下文窗口，已丢弃最早的 %s 条消息",
+        provider.provider_name, len(request.messages) - len(messages),
+    )
+    return request.model_copy(update={"messages": messages}), prompt_tokens
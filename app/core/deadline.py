@@ -0,0 +1,67 @@
+import time
+from typing import Optional
+from ..config.settings import get_settings
+
+# 客户端指定本次请求总超时（秒）的请求头，AIRequest.timeout 字段优先
+DEADLINE_HEADER = "X-Request-Timeout"
+# 未指定时的默认总超时（秒），配置为 0 表示不限制
+DEFAULT_TIMEOUT_DEFAULT = 300.0
+# 每次尝试至少分配的时间（秒），避免排在后面的提供商分到的时间过短
+MIN_ATTEMPT_TIMEOUT_DEFAULT = 1.0
+
+
+class DeadlineExceededError(Exception):
+    """请求在截止时间前没有得到任何提供商的响应"""
+
+
+class Deadline:
+    """一次请求的截止时间；故障转移时把剩余时间分配给后续的每次尝试"""
+
+    def __init__(self, timeout: float, min_attempt_timeout: float = MIN_ATTEMPT_TIMEOUT_DEFAULT):
+        self.timeout = timeout
+        self.min_attempt_timeout = min_attempt_timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def attempt_timeout(self, attempts_left: int) -> float:
+        """
+        本次尝试的超时：剩余时间在还可能尝试的提供商之间平均分配，但不少于 min_attempt_timeout。
+        前面的尝试提前失败时，节省的时间自动留给后面的尝试。
+        """
+        remaining = self.remaining()
+        share = remaining / max(attempts_left, 1)
+        return min(remaining, max(share, self.min_attempt_timeout))
+
+    def error(self, detail: Optional[str] = None) -> DeadlineExceededError:
+        message = f"请求超过截止时间（{self.timeout:g} 秒）"
+        return DeadlineExceededError(f"{message}: {detail}" if detail else message)
+
+
+def resolve_deadline(timeout: Optional[float] = None, header_value: Optional[str] = None) -> Optional[Deadline]:
+    """
+    按 请求字段 > 请求头 > 配置 deadline.default_timeout 的顺序确定总超时，
+    并受 deadline.max_timeout 限制；结果为0或未配置时返回 None（不限制）。
+    请求头无法解析时抛出 ValueError。
+    """
+    config = get_settings().get_section("deadline")
+    if timeout is None and header_value:
+        try:
+            timeout = float(header_value)
+        except ValueError:
+            raise ValueError(f"无法解析请求头 {DEADLINE_HEADER}: {header_value}")
+        if timeout <= 0:
+            raise ValueError(f"请求头 {DEADLINE_HEADER} 必须大于0: {header_value}")
+    if timeout is None:
+        timeout = config.get("default_timeout", DEFAULT_TIMEOUT_DEFAULT)
+    if not timeout:
+        return None
+    max_timeout = config.get("max_timeout")
+    if max_timeout:
+        timeout = min(timeout, max_timeout)
+    return Deadline(timeout, config.get("min_attempt_timeout", MIN_ATTEMPT_TIMEOUT_DEFAULT))
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+from ..models.schemas import ExtendedChatCompletion
+from ..utils.logger import logger
+
+DISK_CACHE_PATH_DEFAULT = "data/response_cache.sqlite"
+DISK_CACHE_MAX_BYTES_DEFAULT = 1024 * 1024 * 1024
+DISK_CACHE_COMPRESSION_LEVEL_DEFAULT = 6
+# 每写入多少条执行一次压缩整理（删除过期条目、按大小淘汰、回收空闲页）
+DISK_CACHE_COMPACT_EVERY_DEFAULT = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+class DiskResponseCache:
+    """
+    本地磁盘上的响应缓存（SQLite WAL），作为内存缓存之后的第二级，进程重启后仍然有效。
+    响应以 zlib 压缩的 JSON 保存；条目按TTL过期，压缩后的总大小超过 max_bytes 时按最近访问时间淘汰。
+    所有方法都是同步的，由调用方放到线程中执行，连接由锁保护；
+    数据库在第一次使用时（即调用方的线程中）才打开并整理一次，创建实例本身不做磁盘操作。
+    """
+
+    def __init__(
+        self,
+        path: str = DISK_CACHE_PATH_DEFAULT,
+        max_bytes: int = DISK_CACHE_MAX_BYTES_DEFAULT,
+        ttl: Optional[float] = None,
+        compression_level: int = DISK_CACHE_COMPRESSION_LEVEL_DEFAULT,
+        compact_every: int = DISK_CACHE_COMPACT_EVERY_DEFAULT,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        # 为 None 时沿用内存缓存的TTL
+        self.ttl = ttl
+        self.compression_level = compression_level
+        self.compact_every = compact_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        # 可重入：打开数据库时在锁内执行首次整理
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """返回数据库连接，首次调用时打开数据库并整理一次；调用方需持有锁"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            # auto_vacuum 只能在建表前设置，已有文件保持原来的设置
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self.compact()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[float, ExtendedChatCompletion]]:
+        """返回未过期条目的 (剩余TTL, 响应)"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT expires_at, payload FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        expires_at, payload = row
+        try:
+            response = ExtendedChatCompletion.model_validate_json(zlib.decompress(payload))
+        except (zlib.error, ValueError) as e:
+            logger.warning("磁盘缓存条目无法解析，已丢弃: %s", e)
+            self.delete(key)
+            return None
+        return expires_at - now, response
+
+    def set(self, key: str, response: ExtendedChatCompletion, ttl: float):
+        ttl = self.ttl if self.ttl is not None else ttl
+        if ttl <= 0:
+            return
+        payload = zlib.compress(response.model_dump_json().encode("utf-8"), self.compression_level)
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO responses (key, expires_at, accessed_at, size, payload) VALUES (?, ?, ?, ?, ?)",
+                (key, now + ttl, now, len(payload), payload),
+            )
+            self._writes += 1
+            compact = self._writes % self.compact_every == 0
+        if compact:
+            self.compact()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def compact(self) -> int:
+        """删除过期条目，总大小超过 max_bytes 时淘汰最久未访问的条目，并回收空闲页和截断WAL，返回删除的条数"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+                (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+                evicted = []
+                excess = total - self.max_bytes
+                if excess > 0:
+                    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                        evicted.append((key,))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self.evictions += len(evicted)
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if removed or evicted:
+            logger.debug("磁盘缓存整理: 过期 %s 条，淘汰 %s 条", removed, len(evicted))
+        return removed + len(evicted)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.execute("PRAGMA incremental_vacuum")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Optional
+from .deadline import Deadline, DeadlineExceededError
+from .failover import generate_with_failover
+from .response_cache import get_response_cache, provider_cache_identity, request_cache_key
+from .routing import Route
+from .singleflight import get_singleflight
+from ..models.schemas import AIRequest, ExtendedChatCompletion
+from ..utils.logger import logger
+
+
+async def complete(route: Route, request: AIRequest, deadline: Optional[Deadline] = None) -> ExtendedChatCompletion:
+    """
+    非流式请求的处理流程：响应缓存 -> 合并相同的在途请求 -> 故障转移。
+    deadline 在故障转移中按次分配；只有总超时和路由选项（对冲/竞速）都相同的请求才会合并，
+    共享的调用因发起者的截止时间失败、而本请求仍有剩余时间时，按自己的截止时间重新发起。
+    """
+    cache = get_response_cache()
+    singleflight = get_singleflight()
+    if singleflight is not None and not singleflight.is_eligible(request):
+        singleflight = None
+
+    use_cache = cache is not None and route.cache_ttl != 0 and cache.is_eligible(request)
+    key = None
+    if use_cache or singleflight is not None:
+        key = request_cache_key(request, [provider_cache_identity(p) for p in route.providers])
+
+    if use_cache:
+        cached = await cache.lookup(key)
+        if cached is not None:
+            logger.info("命中响应缓存，提供商: %s", cached.provider)
+            return cached
+
+    async def call_upstream() -> ExtendedChatCompletion:
+        response = await generate_with_failover(
+            route.ordered_providers(),
+            request,
+            hedge_after_ms=route.hedge_after_ms,
+            race=route.race,
+            deadline=deadline,
+        )
+        if use_cache:
+            cache.store(key, response, route.cache_ttl)
+        return response
+
+    if singleflight is None:
+        return await call_upstream()
+    # 共享的调用按发起者的截止时间和路由选项执行，总超时或对冲/竞速设置不同的请求不合并
+    flight_key = f"{key}|race={route.race}|hedge={route.hedge_after_ms}"
+    if deadline is not None:
+        flight_key += f"|deadline={deadline.timeout:g}"
+    while True:
+        try:
+            if deadline is None:
+                return await singleflight.do(flight_key, call_upstream)
+            # 这里只限制本请求的等待时间；最后一个等待者离开时共享的调用才会被取消
+            return await asyncio.wait_for(singleflight.do(flight_key, call_upstream), deadline.remaining())
+        except asyncio.TimeoutError:
+            raise deadline.error("等待合并的在途请求超时")
+        except DeadlineExceededError:
+            if deadline is None or deadline.expired:
+                raise
+            logger.info("合并的在途请求因发起者的截止时间失败，按本请求的截止时间重新发起")
@@ -0,0 +1,267 @@
+import asyncio
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+from .admission import ProviderSaturatedError, get_admission_controller
+from .ai_provider import AIProvider
+from .circuit_breaker import (
+    OPEN_POLICY_SKIP,
+    ProviderCircuitOpenError,
+    get_circuit_breaker,
+    get_open_policy,
+    order_by_health,
+)
+from .deadline import Deadline
+from .failover import AttemptLease, FailoverState
+from .metrics import PROVIDER_REQUESTS, UPSTREAM_LATENCY
+from .routing import Route
+from ..config.settings import get_settings
+from ..models.schemas import ExtendedEmbeddingResponse, build_embedding_response
+from ..utils.logger import logger
+
+# 微批的时间窗口（毫秒），0 表示不合并
+EMBEDDING_BATCH_WINDOW_MS_DEFAULT = 5
+# 单次上游调用最多合并的输入条数
+EMBEDDING_BATCH_SIZE_DEFAULT = 64
+
+Embeddings = Tuple[List[List[float]], int]
+
+
+class EmbeddingsNotSupportedError(Exception):
+    """解析出的提供商都不支持 embeddings"""
+
+
+class _Pending(NamedTuple):
+    inputs: List[str]
+    future: asyncio.Future
+    deadline: Optional[Deadline]
+
+
+def _is_request_error(error: BaseException) -> bool:
+    """上游因请求内容拒绝（4xx，限流的429除外），换一批输入可能成功"""
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and 400 <= status_code < 500 and status_code != 429
+
+
+def _batch_timeout(batch: Sequence[_Pending]) -> Optional[float]:
+    """合并后的调用按等待者中最晚的截止时间执行；有不限时的等待者时不限时"""
+    if any(item.deadline is None for item in batch):
+        return None
+    return max(item.deadline.remaining() for item in batch)
+
+
+class EmbeddingBatcher:
+    """
+    单个提供商的 embeddings 微批。
+    window_ms 内到达的小请求合并为一次上游调用（输入总条数不超过 batch_size），结果按各请求的输入切分后返回；
+    凑满 batch_size 时立即发送，因此单个请求最多多等 window_ms。
+    输入条数已达到 batch_size 的请求不参与合并，直接发送。
+    合并调用的提示词token数按各请求的输入字符数比例分摊。
+    熔断器按上游调用记录结果；合并调用因请求内容被拒绝（4xx）时拆开逐个重试，只让有问题的请求失败。
+    """
+
+    def __init__(
+        self,
+        provider: AIProvider,
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS_DEFAULT,
+        batch_size: int = EMBEDDING_BATCH_SIZE_DEFAULT,
+    ):
+        self.provider = provider
+        self.window = window_ms / 1000
+        self.batch_size = batch_size
+        self.requests = 0
+        self.batches = 0
+        self.inputs = 0
+        self.splits = 0
+        self._pending: List[_Pending] = []
+        self._pending_inputs = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 正在执行的合并调用，保持引用避免被垃圾回收
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, inputs: List[str], deadline: Optional[Deadline] = None) -> Embeddings:
+        self.requests += 1
+        if self.window <= 0 or len(inputs) >= self.batch_size:
+            self.batches += 1
+            self.inputs += len(inputs)
+            return await self._call(inputs, deadline.remaining() if deadline is not None else None)
+
+        if self._pending_inputs + len(inputs) > self.batch_size:
+            self._flush()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Pending(inputs, future, deadline))
+        self._pending_inputs += len(inputs)
+        if self._pending_inputs >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        # 等待者被取消时合并调用照常进行，结果只交给其他等待者
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_inputs = self._pending, [], 0
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[_Pending]):
+        inputs = [text for item in batch for text in item.inputs]
+        self.batches += 1
+        self.inputs += len(inputs)
+        split = len(batch) > 1
+        try:
+            vectors, prompt_tokens = await self._call(inputs, _batch_timeout(batch), split=split)
+            if len(vectors) != len(inputs):
+                raise ValueError(f"{self.provider.provider_name} 返回了 {len(vectors)} 条向量，期望 {len(inputs)} 条")
+        except Exception as e:
+            if split and _is_request_error(e):
+                logger.warning("AI提供商 %s 拒绝了合并的 embeddings 请求，拆开逐个重试: %s", self.provider.provider_name, e)
+                self.splits += 1
+                await asyncio.gather(*(self._run([item]) for item in batch))
+                return
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        total_chars = sum(len(text) for text in inputs) or 1
+        offset = 0
+        for item in batch:
+            count = len(item.inputs)
+            share = round(prompt_tokens * sum(len(text) for text in item.inputs) / total_chars)
+            if not item.future.done():
+                item.future.set_result((vectors[offset:offset + count], share))
+            offset += count
+
+    async def _call(self, inputs: List[str], timeout: Optional[float], split: bool = False) -> Embeddings:
+        """
+        一次上游调用：占用一个并发名额和客户端，结果记录到熔断器。
+        split 为 True 时请求内容导致的失败不计入熔断器，由拆开后的调用各自记录。
+        """
+        provider_name = self.provider.provider_name
+        breaker = get_circuit_breaker(provider_name)
+        if not breaker.allow_request() and get_open_policy() == OPEN_POLICY_SKIP:
+            raise ProviderCircuitOpenError(f"{provider_name} 熔断中")
+        admission = get_admission_controller(provider_name)
+        try:
+            admitted = await admission.acquire()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        if not admitted:
+            breaker.release()
+            raise ProviderSaturatedError(f"{provider_name} 并发已满")
+        lease = AttemptLease(self.provider, admission)
+        started = time.monotonic()
+        try:
+            try:
+                result = await asyncio.wait_for(self.provider.create_embeddings(inputs, timeout), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{provider_name} 超过本次尝试的超时（{timeout:.1f} 秒）")
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            if split and _is_request_error(e):
+                breaker.release()
+            else:
+                breaker.record_failure()
+            raise
+        finally:
+            lease.release(None)
+            UPSTREAM_LATENCY.observe(provider_name, value=time.monotonic() - started)
+        breaker.record_success()
+        return result
+
+    def snapshot(self) -> Dict:
+        return {
+            "provider": self.provider.provider_name,
+            "requests": self.requests,
+            "batches": self.batches,
+            "inputs": self.inputs,
+            "avg_batch_inputs": round(self.inputs / self.batches, 2) if self.batches else 0.0,
+            "splits": self.splits,
+            "window_ms": self.window * 1000,
+            "batch_size": self.batch_size,
+        }
+
+
+_batchers: Dict[str, EmbeddingBatcher] = {}
+
+
+def get_embedding_batcher(provider: AIProvider) -> EmbeddingBatcher:
+    """获取提供商的微批器；提供商实例在配置热重载后更换时重新创建"""
+    batcher = _batchers.get(provider.provider_name)
+    if batcher is None or batcher.provider is not provider:
+        config = get_settings().get_section("embeddings")
+        provider_config = get_settings().get_provider_config(provider.provider_name)
+        batch_size = config.get("batch_size", EMBEDDING_BATCH_SIZE_DEFAULT)
+        if provider_config is not None and provider_config.embedding_batch_size:
+            batch_size = provider_config.embedding_batch_size
+        batcher = EmbeddingBatcher(
+            provider, window_ms=config.get("batch_window_ms", EMBEDDING_BATCH_WINDOW_MS_DEFAULT), batch_size=batch_size
+        )
+        _batchers[provider.provider_name] = batcher
+    return batcher
+
+
+def get_embedding_batchers() -> List[EmbeddingBatcher]:
+    return list(_batchers.values())
+
+
+def reset_embedding_batchers():
+    """丢弃所有微批器，下次使用时按当前配置重新创建（embeddings 配置热重载时调用）；已合并的调用照常完成"""
+    _batchers.clear()
+
+
+async def embed_with_failover(
+    providers: Sequence[AIProvider], inputs: List[str], deadline: Optional[Deadline] = None
+) -> Tuple[AIProvider, Embeddings]:
+    """
+    按顺序尝试支持 embeddings 的提供商（熔断中的排在最后或跳过），返回第一个成功的提供商和结果。
+    熔断器由微批器按上游调用记录，合并在一起的请求只计一次。
+    """
+    supported = [provider for provider in providers if provider.supports_embeddings]
+    if not supported:
+        raise EmbeddingsNotSupportedError(f"没有支持 embeddings 的提供商: {[p.provider_name for p in providers]}")
+
+    state = FailoverState()
+    for provider in order_by_health(supported, get_open_policy()):
+        if deadline is not None and deadline.expired:
+            break
+        provider_name = provider.provider_name
+        state.begin_attempt()
+        try:
+            result = get_embedding_batcher(provider).embed(inputs, deadline)
+            if deadline is not None:
+                result = asyncio.wait_for(result, deadline.remaining())
+            result = await result
+        except asyncio.CancelledError:
+            raise
+        except ProviderCircuitOpenError:
+            logger.debug("AI提供商 %s 熔断中，已跳过", provider_name)
+            continue
+        except asyncio.TimeoutError as e:
+            # 等待超过请求截止时间时 wait_for 抛出的异常没有消息
+            state.record(provider_name, e if str(e) else TimeoutError(f"{provider_name} 超过请求的截止时间"))
+            continue
+        except Exception as e:
+            state.record(provider_name, e)
+            continue
+        PROVIDER_REQUESTS.inc(provider_name, "success")
+        return provider, result
+    raise state.error(deadline)
+
+
+async def create_embeddings(
+    route: Route, inputs: List[str], deadline: Optional[Deadline] = None
+) -> ExtendedEmbeddingResponse:
+    provider, (vectors, prompt_tokens) = await embed_with_failover(route.ordered_providers(), inputs, deadline)
+    logger.info("AI提供商 %s 生成了 %s 条向量", provider.provider_name, len(vectors))
+    model = provider.embedding_model or getattr(provider, "model", provider.provider_name)
+    return build_embedding_response(provider.provider_name, model, vectors, prompt_tokens)
@@ -0,0 +1,557 @@
+import asyncio
+import math
+import time
+from typing import AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Sequence
+from .admission import (
+    AdmissionController,
+    ProviderSaturatedError,
+    get_admission_controller,
+    get_retry_after,
+)
+from .adaptive import record_call
+from .ai_provider import AIProvider
+from .metrics import FAILOVERS, PROVIDER_REQUESTS, TIME_TO_FIRST_TOKEN, UPSTREAM_LATENCY
+from .circuit_breaker import (
+    OPEN_POLICY_SKIP,
+    CircuitBreaker,
+    get_circuit_breaker,
+    get_open_policy,
+    order_by_health,
+)
+from .context_window import ContextWindowExceededError, fits, is_trim_enabled, required_tokens, trim_to_fit
+from .rate_limit import ProviderRateLimitedError, ProviderRateLimiter, get_rate_limiter
+from .deadline import Deadline, DeadlineExceededError
+from .tokens import PromptEstimate
+from ..config.settings import get_settings
+from ..models.schemas import AIRequest, ExtendedChatCompletion, ExtendedChatCompletionChunk
+from ..utils.logger import logger
+
+
+class AllProvidersFailedError(Exception):
+    """所有提供商都失败时抛出"""
+    pass
+
+
+class AllProvidersSaturatedError(AllProvidersFailedError):
+    """所有可用提供商都因并发已满被拒绝时抛出，附带建议的重试间隔"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AllProvidersRateLimitedError(AllProvidersSaturatedError):
+    """所有可用提供商的限流预算都已耗尽时抛出"""
+    pass
+
+
+class AllProvidersContextExceededError(AllProvidersFailedError):
+    """对话超出所有提供商的上下文窗口（且未开启或无法裁剪）时抛出，属于请求本身的问题"""
+    pass
+
+
+class FailoverState:
+    """记录一次故障转移过程中各提供商的失败情况，用于决定最终返回的错误"""
+
+    def __init__(self):
+        self.last_error: Optional[str] = None
+        self.failed = 0
+        self.saturated = 0
+        self.rate_limited = 0
+        self.rate_limit_wait: Optional[float] = None
+        self.context_exceeded = 0
+        # 失败后尚未转向下一个提供商的提供商；之后确实尝试了其他提供商时才计入故障转移次数
+        self._pending_failovers: List[str] = []
+
+    def begin_attempt(self):
+        """开始尝试一个提供商（或已有其他请求在途）：之前失败的提供商计为一次故障转移"""
+        for provider_name in self._pending_failovers:
+            FAILOVERS.inc(provider_name)
+        self._pending_failovers.clear()
+
+    def record(self, provider_name: str, error: BaseException):
+        self.last_error = str(error)
+        if isinstance(error, ContextWindowExceededError):
+            # 上下文窗口放不下：不发送请求，直接转向下一个提供商
+            self.context_exceeded += 1
+            outcome = "context_exceeded"
+            logger.warning("%s，转向下一个", error)
+        elif isinstance(error, ProviderRateLimitedError):
+            # 预算耗尽：不发送请求，直接转向下一个提供商
+            self.rate_limited += 1
+            outcome = "rate_limited"
+            if self.rate_limit_wait is None or error.wait < self.rate_limit_wait:
+                self.rate_limit_wait = error.wait
+            logger.warning("AI提供商 %s 限流预算耗尽，转向下一个", provider_name)
+        elif isinstance(error, ProviderSaturatedError):
+            # 并发已满：不等待，直接转向下一个提供商
+            self.saturated += 1
+            outcome = "saturated"
+            logger.warning("AI提供商 %s 并发已满，转向下一个", provider_name)
+        else:
+            self.failed += 1
+            outcome = "error"
+            logger.error("AI提供商 %s 失败: %s", provider_name, self.last_error, exc_info=error)
+        PROVIDER_REQUESTS.inc(provider_name, outcome)
+        self._pending_failovers.append(provider_name)
+
+    def error(self, deadline: Optional[Deadline] = None) -> Exception:
+        """构造所有提供商都失败时的异常；已超过截止时间时返回 DeadlineExceededError"""
+        if deadline is not None and deadline.expired:
+            error = deadline.error(self.last_error)
+            logger.error("%s", error)
+            return error
+        if self.context_exceeded and not (self.failed or self.saturated or self.rate_limited):
+            error_msg = f"对话超出所有AI提供商的上下文窗口。最后的错误: {self.last_error}"
+            logger.warning(error_msg)
+            return AllProvidersContextExceededError(error_msg)
+        if self.failed == 0 and self.rate_limited and not self.saturated:
+            error_msg = "所有AI提供商的限流预算都已耗尽，请稍后重试"
+            logger.warning(error_msg)
+            return AllProvidersRateLimitedError(error_msg, max(1, math.ceil(self.rate_limit_wait)))
+        if self.failed == 0 and (self.saturated or self.rate_limited):
+            error_msg = "所有AI提供商都已满载，请稍后重试"
+            logger.warning(error_msg)
+            return AllProvidersSaturatedError(error_msg, get_retry_after())
+        error_msg = f"所有AI提供商都失败了。最后的错误: {self.last_error or '所有提供商均处于熔断状态'}"
+        logger.error(error_msg)
+        return AllProvidersFailedError(error_msg)
+
+
+HEDGE_MAX_IN_FLIGHT_DEFAULT = 32
+
+
+class HedgeLimiter:
+    """限制全局同时在途的对冲/竞速请求数，避免放大上游负载"""
+
+    def __init__(self, max_in_flight: int = HEDGE_MAX_IN_FLIGHT_DEFAULT):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+_hedge_limiter: Optional[HedgeLimiter] = None
+
+
+def get_hedge_limiter() -> HedgeLimiter:
+    """获取全局对冲限流器，按配置 hedging.max_in_flight 创建"""
+    global _hedge_limiter
+    if _hedge_limiter is None:
+        config = get_settings().get_section("hedging")
+        _hedge_limiter = HedgeLimiter(config.get("max_in_flight", HEDGE_MAX_IN_FLIGHT_DEFAULT))
+    return _hedge_limiter
+
+
+def reset_hedge_limiter():
+    """按当前配置重新创建对冲限流器；在途的对冲请求在旧实例上归还名额"""
+    global _hedge_limiter
+    _hedge_limiter = None
+
+
+class _Candidate(NamedTuple):
+    """一个可尝试的提供商：熔断器、发给它的请求（可能已裁剪）及按其分词器提示估算的提示词token数"""
+    provider: AIProvider
+    breaker: CircuitBreaker
+    request: AIRequest
+    prompt_tokens: int
+
+
+def _admit(
+    provider: AIProvider,
+    request: AIRequest,
+    prompt_tokens: int,
+    open_policy: str,
+    state: FailoverState,
+) -> Optional[_Candidate]:
+    """检查限流预算和熔断器，可以尝试时返回候选"""
+    provider_name = provider.provider_name
+    limiter = get_rate_limiter(provider_name)
+    if limiter.enabled:
+        estimated = required_tokens(provider, request, prompt_tokens)
+        if not limiter.can_admit(estimated):
+            state.record(provider_name, ProviderRateLimitedError(provider_name, limiter.wait_time(estimated)))
+            return None
+    breaker = get_circuit_breaker(provider_name)
+    if not breaker.allow_request() and open_policy == OPEN_POLICY_SKIP:
+        logger.debug("AI提供商 %s 熔断中，已跳过", provider_name)
+        return None
+    return _Candidate(provider, breaker, request, prompt_tokens)
+
+
+def _iter_candidates(
+    providers: Sequence[AIProvider],
+    open_policy: str,
+    request: AIRequest,
+    prompt: PromptEstimate,
+    state: FailoverState,
+) -> Iterator[_Candidate]:
+    """
+    按健康状况排序后逐个给出可尝试的提供商。
+    上下文窗口放不下的提供商排在最后：开启 context.trim 时裁剪对话后尝试，否则跳过；
+    限流预算不足的提供商会被跳过；惰性求值，取用时才占用半开探测名额。
+    """
+    oversized = []
+    for provider in order_by_health(providers, open_policy):
+        prompt_tokens = prompt.tokens(provider.tokenizer)
+        if not fits(provider, request, prompt_tokens):
+            oversized.append((provider, prompt_tokens))
+            continue
+        candidate = _admit(provider, request, prompt_tokens, open_policy, state)
+        if candidate is not None:
+            yield candidate
+
+    trim = bool(oversized) and is_trim_enabled()
+    for provider, prompt_tokens in oversized:
+        trimmed = trim_to_fit(provider, request, prompt) if trim else None
+        if trimmed is None:
+            required = required_tokens(provider, request, prompt_tokens)
+            state.record(
+                provider.provider_name,
+                ContextWindowExceededError(provider.provider_name, required, provider.context_window),
+            )
+            continue
+        candidate = _admit(provider, *trimmed, open_policy, state)
+        if candidate is not None:
+            yield candidate
+
+
+class AttemptLease:
+    """一次尝试占用的并发名额、限流预算（不限流时为 None）和客户端，结束时一并归还/修正"""
+
+    def __init__(
+        self,
+        provider: AIProvider,
+        admission: AdmissionController,
+        limiter: Optional[ProviderRateLimiter] = None,
+        estimated_tokens: int = 0,
+    ):
+        self.admission = admission
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        # 配置热重载后，旧的客户端注册表要等这些调用结束才关闭
+        self.registry = provider.client_registry
+        if self.registry is not None:
+            self.registry.acquire()
+        self.released = False
+
+    def release(self, actual_tokens: Optional[int]):
+        """
+        归还名额并修正预算；可重复调用，只有第一次生效。
+        actual_tokens 为 None（失败、取消、超时或响应中没有用量）时保留预扣的估算，
+        上游可能已经处理了请求，不能当作没有消耗。
+        """
+        if self.released:
+            return
+        self.released = True
+        self.admission.release()
+        if self.limiter is not None:
+            self.limiter.reconcile(self.estimated_tokens, actual_tokens)
+        if self.registry is not None:
+            self.registry.release()
+
+
+async def _acquire(candidate: _Candidate) -> AttemptLease:
+    """获取并发名额并预扣限流预算；失败时归还熔断器的探测名额"""
+    provider, breaker = candidate.provider, candidate.breaker
+    provider_name = provider.provider_name
+    admission = get_admission_controller(provider_name)
+    try:
+        admitted = await admission.acquire()
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    if not admitted:
+        breaker.release()
+        raise ProviderSaturatedError(f"{provider_name} 并发已满")
+
+    limiter = get_rate_limiter(provider_name)
+    estimated = required_tokens(provider, candidate.request, candidate.prompt_tokens)
+    if limiter.enabled and not limiter.try_acquire(estimated):
+        admission.release()
+        breaker.release()
+        raise ProviderRateLimitedError(provider_name, limiter.wait_time(estimated))
+    return AttemptLease(provider, admission, limiter, estimated)
+
+
+async def _attempt(candidate: _Candidate, timeout: Optional[float] = None) -> ExtendedChatCompletion:
+    """
+    向单个提供商发起一次请求（受并发准入与限流控制），并把结果记录到熔断器。
+    timeout 同时传给SDK并在这里强制执行（SDK的重试可能超出单次超时）。
+    """
+    provider, breaker, request = candidate.provider, candidate.breaker, candidate.request
+    provider_name = provider.provider_name
+    lease = await _acquire(candidate)
+    actual_tokens: Optional[int] = None
+    started = time.monotonic()
+    try:
+        logger.debug("尝试使用AI提供商: %s，超时: %s", provider_name, timeout)
+        try:
+            response = await asyncio.wait_for(
+                provider.generate_response(
+                    messages=request.messages,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature,
+                    timeout=timeout,
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{provider_name} 超过本次尝试的超时（{timeout:.1f} 秒）")
+        usage = getattr(response, "usage", None)
+        actual_tokens = usage.total_tokens if usage else None
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception:
+        breaker.record_failure()
+        elapsed = time.monotonic() - started
+        record_call(provider_name, elapsed, ok=False)
+        UPSTREAM_LATENCY.observe(provider_name, value=elapsed)
+        raise
+    finally:
+        lease.release(actual_tokens)
+    breaker.record_success()
+    elapsed = time.monotonic() - started
+    record_call(provider_name, elapsed, ok=True)
+    UPSTREAM_LATENCY.observe(provider_name, value=elapsed)
+    PROVIDER_REQUESTS.inc(provider_name, "success")
+    logger.info("AI提供商 %s 成功生成响应", provider_name)
+    return response
+
+
+async def generate_with_failover(
+    providers: Sequence[AIProvider],
+    request: AIRequest,
+    hedge_after_ms: Optional[int] = None,
+    race: int = 0,
+    deadline: Optional[Deadline] = None,
+) -> ExtendedChatCompletion:
+    """
+    按顺序尝试每个提供商（熔断中的排在最后或跳过），返回第一个成功的响应。
+    指定 hedge_after_ms 或 race 时改为对冲/竞速模式。
+    指定 deadline 时把剩余时间分配给每次尝试，超过截止时间后不再尝试后续提供商。
+    """
+    state = FailoverState()
+    candidates = _iter_candidates(providers, get_open_policy(), request, PromptEstimate(request.messages), state)
+    if hedge_after_ms is not None or race > 1:
+        return await _generate_hedged(candidates, state, hedge_after_ms, race, deadline)
+
+    for attempted, candidate in enumerate(candidates):
+        timeout = None
+        if deadline is not None:
+            if deadline.expired:
+                candidate.breaker.release()
+                break
+            timeout = deadline.attempt_timeout(len(providers) - attempted)
+        state.begin_attempt()
+        try:
+            return await _attempt(candidate, timeout)
+        except Exception as e:
+            state.record(candidate.provider.provider_name, e)
+            continue
+
+    raise state.error(deadline)
+
+
+async def _generate_hedged(
+    candidates: Iterator[_Candidate],
+    state: FailoverState,
+    hedge_after_ms: Optional[int],
+    race: int,
+    deadline: Optional[Deadline] = None,
+) -> ExtendedChatCompletion:
+    """
+    对冲/竞速模式：
+    - 竞速：同时向前 race 个提供商发起请求
+    - 对冲：在途请求超过 hedge_after_ms 仍未返回时，启动下一个提供商
+    返回第一个成功的响应并取消其余请求；某个请求失败时立即启动下一个提供商。
+    额外并发的请求受全局 HedgeLimiter 限制。
+    并行的尝试相互重叠，每次尝试都以启动时的全部剩余时间为超时。
+    """
+    limiter = get_hedge_limiter()
+    delay = hedge_after_ms / 1000 if hedge_after_ms is not None else None
+    tasks: Dict[asyncio.Task, str] = {}
+    exhausted = False
+
+    def launch(is_hedge: bool) -> bool:
+        nonlocal exhausted
+        if deadline is not None and deadline.expired:
+            exhausted = True
+        if exhausted or (is_hedge and not limiter.try_acquire()):
+            return False
+        candidate = next(candidates, None)
+        if candidate is None:
+            exhausted = True
+            if is_hedge:
+                limiter.release()
+            return False
+        timeout = deadline.remaining() if deadline is not None else None
+        state.begin_attempt()
+        task = asyncio.create_task(_attempt(candidate, timeout))
+        provider_name = candidate.provider.provider_name
+        if is_hedge:
+            task.add_done_callback(lambda _: limiter.release())
+            logger.debug("启动对冲请求: %s", provider_name)
+        tasks[task] = provider_name
+        return True
+
+    launch(False)
+    for _ in range(race - 1):
+        launch(True)
+
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(
+                tasks, timeout=None if exhausted else delay, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # 超过对冲延迟仍未返回，启动下一个提供商
+                launch(True)
+                continue
+
+            for task in done:
+                provider_name = tasks.pop(task)
+                if task.exception() is None:
+                    logger.info("AI提供商 %s 在对冲/竞速中胜出", provider_name)
+                    return task.result()
+                state.record(provider_name, task.exception())
+                # 失败后立即故障转移；仍有其他请求在途时按对冲计数
+                if tasks:
+                    state.begin_attempt()
+                launch(bool(tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    raise state.error(deadline)
+
+
+def _has_token(chunk: ExtendedChatCompletionChunk) -> bool:
+    """分块中是否已包含生成内容（或结束标记）"""
+    for choice in chunk.choices:
+        delta = choice.delta
+        if delta.content or getattr(delta, "reasoning_content", None) or choice.finish_reason:
+            return True
+    return False
+
+
+class LeasedStream:
+    """
+    已产生首个token的流式响应：先输出预取的分块，再继续输出剩余分块。
+    流结束、出错或被关闭时归还并发名额并按实际用量修正限流预算（未收到用量时保留预扣的预算）；
+    与异步生成器不同，从未迭代过也可以通过 aclose() 归还，调用方必须在不再需要时关闭它。
+    """
+
+    def __init__(
+        self,
+        buffered: List[ExtendedChatCompletionChunk],
+        stream: AsyncIterator[ExtendedChatCompletionChunk],
+        lease: AttemptLease,
+    ):
+        self._buffered = buffered
+        self._stream = stream
+        self._lease = lease
+        self._actual_tokens: Optional[int] = None
+
+    def __aiter__(self) -> "LeasedStream":
+        return self
+
+    async def __anext__(self) -> ExtendedChatCompletionChunk:
+        if self._buffered:
+            return self._buffered.pop(0)
+        try:
+            chunk = await self._stream.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            self._actual_tokens = usage.total_tokens
+        return chunk
+
+    async def aclose(self):
+        if self._lease.released:
+            return
+        self._lease.release(self._actual_tokens)
+        await self._stream.aclose()
+
+
+async def open_stream_with_failover(
+    providers: Sequence[AIProvider], request: AIRequest, deadline: Optional[Deadline] = None
+) -> LeasedStream:
+    """
+    打开流式响应。
+    在第一个token产生之前允许故障转移；一旦产生token即锁定该提供商，
+    之后的错误会从返回的迭代器中抛出。
+    deadline 只约束产生第一个token之前的阶段，已开始输出的流由客户端断开或SDK的读超时结束。
+    """
+    state = FailoverState()
+    candidates = _iter_candidates(providers, get_open_policy(), request, PromptEstimate(request.messages), state)
+    for attempted, candidate in enumerate(candidates):
+        provider, breaker, attempt_request = candidate.provider, candidate.breaker, candidate.request
+        provider_name = provider.provider_name
+        timeout = None
+        if deadline is not None:
+            if deadline.expired:
+                breaker.release()
+                break
+            timeout = deadline.attempt_timeout(len(providers) - attempted)
+        state.begin_attempt()
+        # 流式请求在整个输出期间占用并发名额
+        try:
+            lease = await _acquire(candidate)
+        except (ProviderSaturatedError, ProviderRateLimitedError) as e:
+            state.record(provider_name, e)
+            continue
+
+        stream = provider.stream_response(
+            messages=attempt_request.messages,
+            max_tokens=attempt_request.max_tokens,
+            temperature=attempt_request.temperature,
+        )
+        buffered: List[ExtendedChatCompletionChunk] = []
+
+        async def prefetch():
+            async for chunk in stream:
+                buffered.append(chunk)
+                if _has_token(chunk):
+                    break
+
+        started = time.monotonic()
+        try:
+            logger.debug("尝试使用AI提供商进行流式生成: %s，首个token超时: %s", provider_name, timeout)
+            try:
+                await asyncio.wait_for(prefetch(), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{provider_name} 超过本次尝试的首个token超时（{timeout:.1f} 秒）")
+        except asyncio.CancelledError:
+            breaker.release()
+            lease.release(None)
+            await stream.aclose()
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            record_call(provider_name, 0.0, ok=False)
+            lease.release(None)
+            await stream.aclose()
+            state.record(provider_name, e)
+            continue
+
+        # 首个token的延迟与完整响应的延迟不可比，流式请求只把失败计入自适应排序的错误率
+        breaker.record_success()
+        TIME_TO_FIRST_TOKEN.observe(provider_name, value=time.monotonic() - started)
+        PROVIDER_REQUESTS.inc(provider_name, "success")
+        logger.info("AI提供商 %s 开始输出流式响应", provider_name)
+        return LeasedStream(buffered, stream, lease)
+
+    raise state.error(deadline)
@@ -0,0 +1,200 @@
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .admission import get_admission_controllers
+
+# 上游调用延迟的分桶（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 流式首个token延迟的分桶（秒）
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """单调递增计数器；所有更新都在事件循环线程中进行，不需要加锁"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """可增可减的计量值"""
+
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class CallbackGauge:
+    """采集时才计算的计量值，请求路径上没有任何开销"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[Labels, float]],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, labels, value) for labels, value in self._callback().items()]
+
+
+class Histogram:
+    """固定分桶的直方图；每次观测只更新一个分桶计数和总和"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [各分桶计数（最后一个为 +Inf）, 总和]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, *labels: str, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        samples = []
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                samples.append((f"{self.name}_bucket", labels + (le,), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                labelnames = metric.labelnames
+                if name.endswith("_bucket") and isinstance(metric, Histogram):
+                    labelnames = labelnames + ("le",)
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _admission_gauge(attribute: str) -> Callable[[], Dict[Labels, float]]:
+    def collect() -> Dict[Labels, float]:
+        return {(controller.name,): getattr(controller, attribute) for controller in get_admission_controllers()}
+    return collect
+
+
+registry = MetricsRegistry()
+
+ROUTE_REQUESTS = registry.register(Counter(
+    "ars_requests_total", "按路由（分组/提供商/default）和结果统计的请求数", ("route", "outcome")
+))
+ROUTE_IN_FLIGHT = registry.register(Gauge(
+    "ars_route_in_flight_requests", "按路由统计的在途请求数", ("route",)
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    "ars_request_duration_seconds", "按路由统计的非流式请求总耗时（含故障转移）", ("route",), LATENCY_BUCKETS
+))
+PROVIDER_REQUESTS = registry.register(Counter(
+    "ars_provider_requests_total", "按提供商和结果统计的上游调用数", ("provider", "outcome")
+))
+FAILOVERS = registry.register(Counter(
+    "ars_failovers_total", "因失败、满载或限流而转向下一个提供商的次数", ("provider",)
+))
+UPSTREAM_LATENCY = registry.register(Histogram(
+    "ars_upstream_latency_seconds", "上游非流式调用的延迟", ("provider",), LATENCY_BUCKETS
+))
+TIME_TO_FIRST_TOKEN = registry.register(Histogram(
+    "ars_time_to_first_token_seconds", "流式响应首个token的延迟", ("provider",), TTFT_BUCKETS
+))
+PROMPT_TOKENS = registry.register(Counter(
+    "ars_prompt_tokens_total", "上游 usage 报告的提示词token数", ("provider",)
+))
+COMPLETION_TOKENS = registry.register(Counter(
+    "ars_completion_tokens_total", "上游 usage 报告的生成token数", ("provider",)
+))
+registry.register(CallbackGauge(
+    "ars_provider_in_flight_requests", "按提供商统计的在途上游调用数", ("provider",), _admission_gauge("active")
+))
+registry.register(CallbackGauge(
+    "ars_provider_queued_requests", "按提供商统计的排队等待数", ("provider",), _admission_gauge("waiting")
+))
+
+
+def record_usage(provider_name: str, usage) -> None:
+    """记录上游返回的 usage（对象或字典）"""
+    if not usage:
+        return
+    if isinstance(usage, dict):
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+    else:
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens:
+        PROMPT_TOKENS.inc(provider_name, amount=prompt_tokens)
+    if completion_tokens:
+        COMPLETION_TOKENS.inc(provider_name, amount=completion_tokens)
+
+
+def route_label(name: Optional[str]) -> str:
+    """路由的指标标签；临时组合统一归为 adhoc，避免标签基数无限增长"""
+    return name if name is not None else "adhoc"
@@ -0,0 +1,241 @@
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional
+from .state_backend import BucketRow, SQLiteStateBackend, bucket_key, get_state_backend
+from ..config.settings import get_settings
+
+
+class ProviderRateLimitedError(Exception):
+    """提供商的 RPM / TPM 预算不足时抛出，附带预算恢复所需的秒数"""
+
+    def __init__(self, provider_name: str, wait: float):
+        super().__init__(f"{provider_name} 限流预算耗尽，约 {wait:.1f} 秒后恢复")
+        self.wait = wait
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按配额/60 的速率匀速补充"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.refill_rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = self.clock()
+
+    def clock(self) -> float:
+        """令牌桶使用的时钟；在 worker 之间共享的令牌桶改用 time.time()，更新时间才能跨进程比较"""
+        return time.monotonic()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = max(0.0, now - self._updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, amount: float) -> float:
+        """补充到 amount 个令牌还需要的秒数"""
+        missing = min(amount, self.capacity) - self.available()
+        return max(0.0, missing / self.refill_rate) if missing > 0 else 0.0
+
+    def adjust(self, amount: float):
+        """扣除（正数）或退还（负数）令牌，允许暂时透支"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class ProviderRateLimiter:
+    """
+    单个提供商的 RPM / TPM 限流。
+    发送前按估算的token数预扣，收到响应后按实际 usage 修正。
+    """
+
+    def __init__(self, name: str, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.throttled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def can_admit(self, estimated_tokens: int) -> bool:
+        """预算是否足够发送一个估算为 estimated_tokens 的请求"""
+        if self.requests is not None and self.requests.available() < 1:
+            return False
+        # 单个请求超过桶容量时只要求桶是满的，避免永远无法发送
+        if self.tokens is not None and self.tokens.available() < min(estimated_tokens, self.tokens.capacity):
+            return False
+        return True
+
+    def try_acquire(self, estimated_tokens: int) -> bool:
+        """检查并预扣预算"""
+        if not self.can_admit(estimated_tokens):
+            self.throttled += 1
+            return False
+        if self.requests is not None:
+            self.requests.adjust(1)
+        if self.tokens is not None:
+            self.tokens.adjust(estimated_tokens)
+        return True
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """按实际消耗的token数修正预扣的预算"""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def wait_time(self, estimated_tokens: int) -> float:
+        """预算恢复到可以发送该请求还需要的秒数"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(estimated_tokens))
+        return wait
+
+    def snapshot(self) -> Dict:
+        return {
+            "provider": self.name,
+            "rpm_available": round(self.requests.available(), 2) if self.requests else None,
+            "tpm_available": round(self.tokens.available(), 2) if self.tokens else None,
+            "throttled": self.throttled,
+        }
+
+
+class SharedRateLimiter(ProviderRateLimiter):
+    """
+    在同一主机的多个 worker 之间共享预算的限流器。
+    检查和预扣都在本地令牌桶上进行，扣除的令牌同时提交到后端线程，在共享存储的事务中从最新的令牌数里扣除；
+    本地令牌桶超过 sync_interval 未同步时在后台读取共享的令牌数，结果在之后的检查中应用，检查本身从不等待数据库。
+    各 worker 最多有 sync_interval 秒看不到彼此的扣除，合计可能短暂超出配置的 RPM / TPM。
+    """
+
+    def __init__(
+        self, name: str, backend: SQLiteStateBackend, rpm: Optional[int] = None, tpm: Optional[int] = None
+    ):
+        super().__init__(name, rpm=rpm, tpm=tpm)
+        self.backend = backend
+        self._keyed: Dict[str, TokenBucket] = {}
+        for kind, bucket in (("rpm", self.requests), ("tpm", self.tokens)):
+            if bucket is not None:
+                bucket.clock = time.time
+                bucket._updated = time.time()
+                self._keyed[bucket_key(name, kind)] = bucket
+        self._keys = list(self._keyed)
+        self._synced_at = float("-inf")
+        self._pending: Optional[Future] = None
+        # 提交最近一次读取之后本地扣除的令牌，读取结果中还没有包含它们
+        self._unsynced: Dict[str, float] = dict.fromkeys(self._keys, 0.0)
+
+    def _apply(self, rows: Dict[str, BucketRow]):
+        """用共享存储中的令牌数覆盖本地令牌桶（没有记录的桶视为满的），再扣除读取之后本地的扣除"""
+        now = time.time()
+        for key, bucket in self._keyed.items():
+            bucket.tokens, bucket._updated = rows.get(key, (bucket.capacity, now))
+            if self._unsynced[key]:
+                bucket.adjust(self._unsynced[key])
+
+    def _sync(self):
+        pending = self._pending
+        if pending is not None:
+            if not pending.done():
+                return
+            self._pending = None
+            rows = pending.result()
+            if rows is not None:
+                self._apply(rows)
+        if self._keys and time.monotonic() - self._synced_at >= self.backend.sync_interval:
+            self._synced_at = time.monotonic()
+            self._unsynced = dict.fromkeys(self._keys, 0.0)
+            self._pending = self.backend.submit(self.backend.load_buckets, self._keys)
+
+    def _push(self, deltas: Dict[str, float]):
+        """把本地扣除（负数为退还）的令牌提交到后端线程，从共享存储中同样扣除"""
+        limits = {key: (self._keyed[key].capacity, self._keyed[key].refill_rate) for key in deltas}
+        for key, amount in deltas.items():
+            self._unsynced[key] += amount
+
+        def debit(rows: Dict[str, Optional[BucketRow]]):
+            now = time.time()
+            updated = {}
+            for key, amount in deltas.items():
+                capacity, refill_rate = limits[key]
+                tokens, at = rows[key] or (capacity, now)
+                tokens = min(capacity, tokens + max(0.0, now - at) * refill_rate)
+                updated[key] = (min(capacity, tokens - amount), now)
+            return updated, None
+
+        self.backend.submit(self.backend.update_buckets, list(deltas), debit)
+
+    def can_admit(self, estimated_tokens: int) -> bool:
+        self._sync()
+        return super().can_admit(estimated_tokens)
+
+    def try_acquire(self, estimated_tokens: int) -> bool:
+        if not self.enabled:
+            return True
+        self._sync()
+        if not super().try_acquire(estimated_tokens):
+            return False
+        deltas = {}
+        if self.requests is not None:
+            deltas[bucket_key(self.name, "rpm")] = 1
+        if self.tokens is not None:
+            deltas[bucket_key(self.name, "tpm")] = estimated_tokens
+        self._push(deltas)
+        return True
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        if self.tokens is not None and actual_tokens is not None:
+            super().reconcile(estimated_tokens, actual_tokens)
+            self._push({bucket_key(self.name, "tpm"): actual_tokens - estimated_tokens})
+
+    def wait_time(self, estimated_tokens: int) -> float:
+        self._sync()
+        return super().wait_time(estimated_tokens)
+
+    def snapshot(self) -> Dict:
+        self._sync()
+        return super().snapshot()
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+
+
+def get_rate_limiter(provider_name: str) -> ProviderRateLimiter:
+    """获取提供商的限流器，不存在时按提供商配置（rpm / tpm）创建；配置了共享状态后端时在 worker 之间共享预算"""
+    limiter = _limiters.get(provider_name)
+    if limiter is None:
+        provider_config = get_settings().get_provider_config(provider_name)
+        rpm = provider_config.rpm if provider_config else None
+        tpm = provider_config.tpm if provider_config else None
+        backend = get_state_backend()
+        if backend is not None:
+            limiter = SharedRateLimiter(provider_name, backend, rpm=rpm, tpm=tpm)
+        else:
+            limiter = ProviderRateLimiter(provider_name, rpm=rpm, tpm=tpm)
+        _limiters[provider_name] = limiter
+    return limiter
+
+
+def get_rate_limiters() -> List[ProviderRateLimiter]:
+    """获取所有已配置提供商的限流器"""
+    for provider_name in get_settings().AI_MODELS:
+        get_rate_limiter(provider_name)
+    return list(_limiters.values())
+
+
+def reset_rate_limiters(provider_names: Optional[Iterable[str]] = None):
+    """
+    丢弃指定提供商（默认全部）的限流器，下次使用时按当前配置重新创建（配置热重载时调用）。
+    在途请求按实际用量修正的是旧限流器的预算。
+    """
+    if provider_names is None:
+        _limiters.clear()
+        return
+    for provider_name in provider_names:
+        _limiters.pop(provider_name, None)
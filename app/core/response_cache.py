@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Set, Tuple
+from .disk_cache import (
+    DISK_CACHE_COMPACT_EVERY_DEFAULT,
+    DISK_CACHE_COMPRESSION_LEVEL_DEFAULT,
+    DISK_CACHE_MAX_BYTES_DEFAULT,
+    DISK_CACHE_PATH_DEFAULT,
+    DiskResponseCache,
+)
+from .ai_provider import AIProvider
+from .state_backend import SQLiteStateBackend, get_state_backend
+from ..config.settings import get_settings
+from ..models.schemas import AIRequest, ExtendedChatCompletion
+from ..utils.logger import logger
+
+CACHE_TTL_DEFAULT = 300
+CACHE_MAX_BYTES_DEFAULT = 64 * 1024 * 1024
+# 每写入多少条共享缓存清理一次过期和超出大小的条目
+SHARED_PRUNE_EVERY = 100
+
+
+def request_cache_key(request: AIRequest, providers: Sequence[str]) -> str:
+    """
+    根据消息、解析后的提供商列表、max_tokens 和 temperature 计算规范化哈希。
+    providers 为提供商的标识，包含配置指纹（见 provider_cache_identity），
+    提供商的类型、模型或地址变更后不会再命中变更前的（包括磁盘上的）缓存结果。
+    """
+    payload = json.dumps(
+        {
+            "messages": request.messages,
+            "providers": list(providers),
+            "max_tokens": request.max_tokens,
+            "temperature": request.temperature,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def provider_cache_identity(provider: AIProvider) -> str:
+    return f"{provider.provider_name}#{provider.fingerprint}"
+
+
+class ResponseCache:
+    """
+    内存响应缓存。
+    条目按TTL过期，总大小超过 max_bytes 时按LRU顺序淘汰。
+    配置了磁盘缓存（disk）时作为第二级：lookup 在内存未命中后到线程中查磁盘，store 在后台线程中写入磁盘，
+    不等待写入完成；磁盘读写出错时记录日志并按未命中处理，不影响请求。
+    """
+
+    def __init__(
+        self,
+        default_ttl: float = CACHE_TTL_DEFAULT,
+        max_bytes: int = CACHE_MAX_BYTES_DEFAULT,
+        deterministic_only: bool = True,
+    ):
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.deterministic_only = deterministic_only
+        # key -> (过期时间, 条目大小, 响应)
+        self._entries: "OrderedDict[str, Tuple[float, int, ExtendedChatCompletion]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk: Optional[DiskResponseCache] = None
+        self.disk_errors = 0
+        # 在途的磁盘写入，保持引用避免被垃圾回收
+        self._disk_writes: Set[asyncio.Task] = set()
+
+    def is_eligible(self, request: AIRequest) -> bool:
+        """只缓存非流式请求；默认只缓存 temperature 为 0 的确定性请求"""
+        if request.stream:
+            return False
+        return not self.deterministic_only or request.temperature == 0
+
+    def get(self, key: str) -> Optional[ExtendedChatCompletion]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, response = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response.model_copy(update={"cached": True})
+
+    def set(self, key: str, response: ExtendedChatCompletion, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = len(response.model_dump_json())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, size, response)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def lookup(self, key: str) -> Optional[ExtendedChatCompletion]:
+        """先查内存，未命中时查下一级；下一级命中的条目按剩余TTL放回内存"""
+        response = self.get(key)
+        if response is not None:
+            return response
+        return await self._lookup_below(key)
+
+    async def _lookup_below(self, key: str) -> Optional[ExtendedChatCompletion]:
+        """在线程中查磁盘"""
+        if self.disk is None:
+            return None
+        try:
+            entry = await asyncio.to_thread(self.disk.get, key)
+        except (sqlite3.Error, OSError) as e:
+            self.disk_errors += 1
+            logger.warning("读取磁盘缓存失败，按未命中处理: %s", e)
+            return None
+        if entry is None:
+            return None
+        ttl, response = entry
+        return self._promote(key, response, ttl)
+
+    def _promote(self, key: str, response: ExtendedChatCompletion, ttl: float) -> ExtendedChatCompletion:
+        """把下一级命中的条目放回本进程内存，本次查找的未命中改记为命中"""
+        ResponseCache.set(self, key, response, ttl)
+        self.misses -= 1
+        self.hits += 1
+        return response.model_copy(update={"cached": True})
+
+    def store(self, key: str, response: ExtendedChatCompletion, ttl: Optional[float] = None):
+        """写入内存，配置了磁盘缓存时在后台线程中写入磁盘（需要在事件循环中调用）"""
+        ttl = self.default_ttl if ttl is None else ttl
+        self.set(key, response, ttl)
+        if self.disk is not None and ttl > 0:
+            task = asyncio.ensure_future(self._write_disk(key, response, ttl))
+            self._disk_writes.add(task)
+            task.add_done_callback(self._disk_writes.discard)
+
+    async def _write_disk(self, key: str, response: ExtendedChatCompletion, ttl: float):
+        try:
+            await asyncio.to_thread(self.disk.set, key, response, ttl)
+        except (sqlite3.Error, OSError) as e:
+            self.disk_errors += 1
+            logger.warning("写入磁盘缓存失败，已跳过: %s", e)
+
+    async def close(self):
+        """等待在途的磁盘写入完成后关闭磁盘缓存；之后仍持有本对象的请求只使用内存缓存"""
+        while self._disk_writes:
+            await asyncio.gather(*self._disk_writes, return_exceptions=True)
+        disk, self.disk = self.disk, None
+        if disk is not None:
+            await asyncio.to_thread(disk.close)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    async def clear(self):
+        """清空内存和磁盘缓存；磁盘操作在线程中执行，与后台整理争用锁时不阻塞事件循环"""
+        self._entries.clear()
+        self._bytes = 0
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.clear)
+            except (sqlite3.Error, OSError) as e:
+                self.disk_errors += 1
+                logger.warning("清空磁盘缓存失败: %s", e)
+
+    async def stats(self) -> Dict:
+        total = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+        if self.disk is not None:
+            try:
+                disk_stats = await asyncio.to_thread(self.disk.stats)
+            except (sqlite3.Error, OSError) as e:
+                self.disk_errors += 1
+                logger.warning("读取磁盘缓存统计失败: %s", e)
+                disk_stats = {"path": self.disk.path}
+            stats["disk"] = {
+                **disk_stats,
+                "errors": self.disk_errors,
+                "pending_writes": len(self._disk_writes),
+            }
+        return stats
+
+
+class SharedResponseCache(ResponseCache):
+    """
+    在内存缓存之外把响应写入同一主机所有 worker 共享的存储，读写都在共享状态后端的线程中执行。
+    本地未命中时（lookup）先查共享存储再查磁盘，命中的条目按剩余TTL放入本地缓存；
+    共享存储的总大小同样受 max_bytes 限制，按过期时间从早到晚淘汰。
+    """
+
+    def __init__(self, backend: SQLiteStateBackend, **kwargs):
+        super().__init__(**kwargs)
+        self.backend = backend
+        self.shared_hits = 0
+        self._shared_sets = 0
+
+    async def _lookup_below(self, key: str) -> Optional[ExtendedChatCompletion]:
+        row = await self.backend.run(self.backend.get_response, key, time.time())
+        if row is None:
+            return await super()._lookup_below(key)
+        expires_at, payload = row
+        response = ExtendedChatCompletion.model_validate_json(payload)
+        self.shared_hits += 1
+        return self._promote(key, response, expires_at - time.time())
+
+    def store(self, key: str, response: ExtendedChatCompletion, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        super().store(key, response, ttl)
+        if ttl > 0:
+            self.backend.submit(self._write_shared, key, response, ttl)
+
+    def _write_shared(self, key: str, response: ExtendedChatCompletion, ttl: float):
+        """在后端线程中序列化并写入共享存储，每写入 SHARED_PRUNE_EVERY 条清理一次"""
+        payload = response.model_dump_json().encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        self.backend.set_response(key, now + ttl, payload)
+        self._shared_sets += 1
+        if self._shared_sets % SHARED_PRUNE_EVERY == 0:
+            self.backend.prune_responses(now, self.max_bytes)
+
+    async def clear(self):
+        await super().clear()
+        self.backend.submit(self.backend.clear_responses)
+
+    async def stats(self) -> Dict:
+        stats = await super().stats()
+        stats["shared_hits"] = self.shared_hits
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+_cache_loaded = False
+# 配置热重载时被替换、正在后台关闭的旧缓存
+_closing: Set[asyncio.Task] = set()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取全局响应缓存；配置中未启用（cache.enabled）时返回 None，配置了共享状态后端时在 worker 之间共享"""
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        config = get_settings().get_section("cache")
+        if config.get("enabled", False):
+            kwargs = dict(
+                default_ttl=config.get("ttl", CACHE_TTL_DEFAULT),
+                max_bytes=config.get("max_bytes", CACHE_MAX_BYTES_DEFAULT),
+                deterministic_only=config.get("deterministic_only", True),
+            )
+            backend = get_state_backend()
+            _cache = SharedResponseCache(backend, **kwargs) if backend is not None else ResponseCache(**kwargs)
+            disk_config = config.get("disk") or {}
+            if disk_config.get("enabled", False):
+                _cache.disk = DiskResponseCache(
+                    path=disk_config.get("path", DISK_CACHE_PATH_DEFAULT),
+                    max_bytes=disk_config.get("max_bytes", DISK_CACHE_MAX_BYTES_DEFAULT),
+                    ttl=disk_config.get("ttl"),
+                    compression_level=disk_config.get("compression_level", DISK_CACHE_COMPRESSION_LEVEL_DEFAULT),
+                    compact_every=disk_config.get("compact_every", DISK_CACHE_COMPACT_EVERY_DEFAULT),
+                )
+                logger.info("磁盘响应缓存已启用: %s", _cache.disk.path)
+            logger.info("响应缓存已启用: ttl=%ss, max_bytes=%s", _cache.default_ttl, _cache.max_bytes)
+        _cache_loaded = True
+    return _cache
+
+
+async def close_response_cache():
+    """应用关闭时写完在途的磁盘缓存并关闭"""
+    global _cache, _cache_loaded
+    if _cache is not None:
+        await _cache.close()
+    if _closing:
+        await asyncio.gather(*_closing, return_exceptions=True)
+    _cache = None
+    _cache_loaded = False
+
+
+def _close_in_background(cache: ResponseCache):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 没有事件循环时也不会有在途的磁盘写入，直接关闭
+        disk, cache.disk = cache.disk, None
+        if disk is not None:
+            disk.close()
+        return
+    task = loop.create_task(cache.close())
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+def reset_response_cache():
+    """
+    丢弃全局响应缓存，下次使用时按当前配置重新创建（cache 配置热重载时调用）。
+    旧缓存在后台写完在途的磁盘缓存后关闭，不阻塞事件循环。
+    """
+    global _cache, _cache_loaded
+    if _cache is not None:
+        _close_in_background(_cache)
+    _cache = None
+    _cache_loaded = False
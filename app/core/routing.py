@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Callable, Dict, List, NamedTuple, Optional, Protocol, Sequence, Tuple
+from .adaptive import get_adaptive_selector
+from .ai_provider import AIProvider
+from .balancer import get_balance_selector
+from ..config.settings import GroupConfig, Settings
+from ..utils.logger import logger
+
+ROUTING_MEMO_SIZE_DEFAULT = 256
+
+# 默认优先级路由在路由表中的键
+DEFAULT_ROUTE_KEY = ""
+DEFAULT_ROUTE_NAME = "default"
+
+# 分组的组内排序策略
+STRATEGY_PRIORITY = "priority"
+STRATEGY_ADAPTIVE = "adaptive"
+
+# 分组的组内模式
+MODE_FAILOVER = "failover"
+MODE_BALANCE = "balance"
+
+
+class Route(NamedTuple):
+    """一条预解析的路由：按顺序排列的提供商实例及调度选项"""
+    providers: Tuple[AIProvider, ...]
+    # 对冲延迟（毫秒），None 表示不对冲
+    hedge_after_ms: Optional[int] = None
+    # 同时竞速的提供商数，0/1 表示不竞速
+    race: int = 0
+    # 响应缓存TTL（秒），None 表示使用全局配置
+    cache_ttl: Optional[int] = None
+    # 需要在每次请求时重新排序的区间：(起始下标, 结束下标, 排序器)
+    selectors: Tuple[Tuple[int, int, "ProviderSelector"], ...] = ()
+    # 静态路由的名称（分组名/提供商名/default），用作指标标签；临时组合为 None
+    name: Optional[str] = None
+
+    @property
+    def parallel(self) -> bool:
+        return self.hedge_after_ms is not None or self.race > 1
+
+    def ordered_providers(self) -> Sequence[AIProvider]:
+        """本次请求的提供商尝试顺序：按各分组的策略重排对应区间，其余保持配置顺序"""
+        if not self.selectors:
+            return self.providers
+        providers = list(self.providers)
+        for start, end, selector in self.selectors:
+            providers[start:end] = selector.order(providers[start:end])
+        return providers
+
+
+class ProviderSelector(Protocol):
+    """组内排序器接口：返回本次请求中分组成员的尝试顺序"""
+
+    def order(self, providers: Sequence[AIProvider]) -> List[AIProvider]:
+        ...
+
+
+def build_selector(group_name: str, group: GroupConfig) -> Optional[ProviderSelector]:
+    """根据分组配置创建排序器；按配置顺序尝试时返回 None"""
+    if group.mode == MODE_BALANCE:
+        return get_balance_selector(group_name, group)
+    if group.mode not in (None, MODE_FAILOVER):
+        logger.warning("分组 '%s' 的模式未知: %s，按故障转移处理", group_name, group.mode)
+    if group.strategy in (None, STRATEGY_PRIORITY):
+        return None
+    if group.strategy == STRATEGY_ADAPTIVE:
+        return get_adaptive_selector()
+    logger.warning("分组 '%s' 的排序策略未知: %s，按配置顺序尝试", group_name, group.strategy)
+    return None
+
+
+class RoutingTable:
+    """
+    预编译的路由表。
+    在配置加载时把所有提供商名、分组名以及默认优先级解析为不可变的路由（提供商实例元组及调度选项），
+    请求路径上只需一次字典查找；临时组合（如 "a;b;c"）解析后写入有界的 LRU 备忘录。
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        provider_getter: Callable[[str], AIProvider],
+        memo_size: int = ROUTING_MEMO_SIZE_DEFAULT,
+    ):
+        self._settings = settings
+        self._provider_getter = provider_getter
+        self._memo_size = memo_size
+        self._memo: "OrderedDict[str, Route]" = OrderedDict()
+
+        table: Dict[str, Route] = {}
+        table[DEFAULT_ROUTE_KEY] = self._compile(None)._replace(name=DEFAULT_ROUTE_NAME)
+        for name in settings.AI_MODELS:
+            table[name] = self._compile(name)._replace(name=name)
+        for group_name in settings.AI_GROUPS:
+            table[group_name] = self._compile(group_name)._replace(name=group_name)
+        self._table = MappingProxyType(table)
+        logger.info("路由表编译完成，共 %s 条静态路由", len(table))
+
+    def _compile(self, model: Optional[str]) -> Route:
+        """把model字符串解析为路由，未配置的提供商会被跳过"""
+        base, _ = self._settings.split_route_modifier(model)
+        options = self._settings.resolve_route_options(model)
+        providers = []
+        selectors = []
+        for group_name, segment in self._settings.resolve_provider_segments(base):
+            start = len(providers)
+            for provider_name in segment:
+                if self._settings.get_provider_config(provider_name) is None:
+                    logger.warning("未找到提供商配置: %s，已从路由中跳过", provider_name)
+                    continue
+                providers.append(self._provider_getter(provider_name))
+            group = self._settings.get_group_config(group_name) if group_name else None
+            selector = build_selector(group_name, group) if group else None
+            if selector is not None and len(providers) - start > 1:
+                selectors.append((start, len(providers), selector))
+        return Route(
+            tuple(providers), options["hedge_after_ms"], options["race"], options["cache_ttl"], tuple(selectors)
+        )
+
+    def resolve(self, model: Optional[str] = None) -> Route:
+        """获取model字符串对应的路由"""
+        route = self._table.get(model or DEFAULT_ROUTE_KEY)
+        if route is not None:
+            return route
+
+        route = self._memo.get(model)
+        if route is not None:
+            self._memo.move_to_end(model)
+            return route
+
+        # 规范化后可能命中静态路由（如 "group;"）
+        normalized = model.strip().strip(";")
+        route = self._table.get(normalized)
+        if route is None:
+            route = self._compile(model)
+        self._memo[model] = route
+        if len(self._memo) > self._memo_size:
+            self._memo.popitem(last=False)
+        return route
+
+    @property
+    def routes(self) -> MappingProxyType:
+        """静态路由表（只读）"""
+        return self._table
@@ -0,0 +1,94 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from ..config.settings import get_settings
+from ..models.schemas import AIRequest
+
+T = TypeVar("T")
+
+
+class _Call:
+    """一个在途的共享调用及仍在等待它的调用方数量"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    合并相同键的并发调用。
+    同一时刻同一个键只会有一个上游调用在途，其结果（或异常）会共享给所有等待者；
+    某个等待者取消（如客户端断开）不影响其他等待者，最后一个等待者离开时取消共享的调用。
+    """
+
+    def __init__(self, deterministic_only: bool = True):
+        self.deterministic_only = deterministic_only
+        self._calls: Dict[str, _Call] = {}
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def is_eligible(self, request: AIRequest) -> bool:
+        """只合并非流式请求；默认只合并 temperature 为 0 的确定性请求，采样请求各自得到独立的结果"""
+        if request.stream:
+            return False
+        return not self.deterministic_only or request.temperature == 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda done: self._forget(key, call))
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 没有人再等待结果，取消上游调用；之后相同的请求会重新发起
+                self._drop(key, call)
+                call.task.cancel()
+                self.cancelled += 1
+
+    def _drop(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _forget(self, key: str, call: _Call):
+        self._drop(key, call)
+        # 所有等待者都已离开时，避免出现 "exception was never retrieved" 警告
+        if not call.task.cancelled():
+            call.task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict:
+        return {"in_flight": self.in_flight, "coalesced": self.coalesced, "cancelled": self.cancelled}
+
+
+_singleflight: Optional[SingleFlight] = None
+_singleflight_loaded = False
+
+
+def get_singleflight() -> Optional[SingleFlight]:
+    """获取全局请求合并器；配置 singleflight.enabled 为 false 时返回 None"""
+    global _singleflight, _singleflight_loaded
+    if not _singleflight_loaded:
+        config = get_settings().get_section("singleflight")
+        if config.get("enabled", True):
+            _singleflight = SingleFlight(deterministic_only=config.get("deterministic_only", True))
+        _singleflight_loaded = True
+    return _singleflight
+
+
+def reset_singleflight():
+    """按当前配置重新创建请求合并器；已在途的合并调用照常完成"""
+    global _singleflight, _singleflight_loaded
+    _singleflight = None
+    _singleflight_loaded = False
@@ -0,0 +1,373 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple, TypeVar
+from ..config.settings import get_settings
+from ..utils.logger import logger
+
+STATE_BACKEND_MEMORY = "memory"
+STATE_BACKEND_SQLITE = "sqlite"
+# 共享状态在本地缓存的最长时间（秒），热路径上的读取只在缓存过期时访问数据库
+SYNC_INTERVAL_DEFAULT = 0.5
+# 等待其他 worker 的写事务的最长时间（秒），超时后放弃本次操作，调用方使用进程内状态
+BUSY_TIMEOUT_DEFAULT = 0.1
+STATE_FILE_NAME = "ai-request-service-state.sqlite"
+
+# 令牌桶行：(令牌数, 更新时间)，时间为 time.time()，各 worker 之间可比
+BucketRow = Tuple[float, float]
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS breakers (
+    provider TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    opened_at REAL NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight (
+    provider TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (provider, pid)
+);
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at);
+"""
+
+
+def default_state_path() -> str:
+    """默认放在 /dev/shm（内存文件系统），不可用时放在临时目录"""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, STATE_FILE_NAME)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteStateBackend:
+    """
+    同一主机上所有 worker 共享的状态存储（SQLite WAL）。
+    保存熔断器状态、限流令牌桶、各提供商的在途请求数和响应缓存；
+    读改写都在 BEGIN IMMEDIATE 的短事务中完成，多个进程并发修改时不会丢失更新。
+    请求路径不直接访问数据库：操作通过 submit / run 交给后端专用的线程按提交顺序执行，
+    事件循环只应用已经完成的结果；数据库被其他 worker 锁住超过 busy_timeout 或出错时放弃本次操作并计数，
+    调用方退回本进程的状态。
+    在途请求数按进程记录，已退出进程遗留的计数在打开时清理。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sync_interval: float = SYNC_INTERVAL_DEFAULT,
+        busy_timeout: float = BUSY_TIMEOUT_DEFAULT,
+    ):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.busy_timeout = busy_timeout
+        self.pid = os.getpid()
+        self.errors = 0
+        # 正常只在后端线程中访问；锁防止其他线程（如测试、关闭时）同时使用同一连接，可重入以便事务回调中读取
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 本后端占用、尚未归还的在途名额，关闭时一并归还
+        self._held: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-backend")
+        # 在后端线程中打开数据库并清理退出的 worker 遗留的计数
+        self.submit(self._connection)
+
+    def _connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(
+                    self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+                )
+                conn.execute("PRAGMA journal_mode=WAL")
+                # 共享状态不需要持久化保证，降低每次提交的开销
+                conn.execute("PRAGMA synchronous=OFF")
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+                self._cleanup_dead_workers()
+            return self._conn
+
+    def submit(self, fn: Callable[..., T], *args) -> "Future[Optional[T]]":
+        """在后端线程中执行 fn；数据库出错（如等待锁超时）或后端已关闭时返回 None"""
+        try:
+            return self._executor.submit(self._guarded, fn, *args)
+        except RuntimeError:
+            # 热重载替换后端后，在途请求持有的旧状态对象退回进程内状态
+            future: "Future[Optional[T]]" = Future()
+            future.set_result(None)
+            return future
+
+    async def run(self, fn: Callable[..., T], *args) -> Optional[T]:
+        """在后端线程中执行 fn 并等待结果，不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _guarded(self, fn: Callable[..., T], *args) -> Optional[T]:
+        try:
+            return fn(*args)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("共享状态操作失败，本次使用进程内状态: %s", e)
+            return None
+
+    def flush(self, timeout: Optional[float] = None):
+        """等待已提交的操作全部执行完"""
+        self.submit(lambda: None).result(timeout)
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _query(self, sql: str, params: Sequence = ()) -> list:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def _cleanup_dead_workers(self):
+        def cleanup(conn: sqlite3.Connection):
+            pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM inflight")]
+            dead = [pid for pid in pids if pid == self.pid or not _pid_alive(pid)]
+            conn.executemany("DELETE FROM inflight WHERE pid = ?", [(pid,) for pid in dead])
+            return dead
+
+        dead = self._transaction(cleanup)
+        if dead:
+            logger.info("已清理退出的 worker 遗留的在途计数: %s", dead)
+
+    # 熔断器
+
+    def load_breaker(self, provider: str) -> Optional[Tuple[str, float, float]]:
+        """返回 (状态, 打开时间, 变更时间)"""
+        rows = self._query("SELECT state, opened_at, changed_at FROM breakers WHERE provider = ?", (provider,))
+        return rows[0] if rows else None
+
+    def save_breaker(self, provider: str, state: str, opened_at: float, changed_at: float):
+        """只在变更时间比已保存的记录新时写入，避免乱序覆盖其他 worker 较新的状态"""
+        self._transaction(lambda conn: conn.execute(
+            "INSERT INTO breakers (provider, state, opened_at, changed_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(provider) DO UPDATE SET state = excluded.state, opened_at = excluded.opened_at, "
+            "changed_at = excluded.changed_at WHERE excluded.changed_at > breakers.changed_at",
+            (provider, state, opened_at, changed_at),
+        ))
+
+    # 令牌桶
+
+    def load_buckets(self, keys: Sequence[str]) -> Dict[str, BucketRow]:
+        placeholders = ",".join("?" * len(keys))
+        rows = self._query(f"SELECT key, tokens, updated FROM buckets WHERE key IN ({placeholders})", keys)
+        return {key: (tokens, updated) for key, tokens, updated in rows}
+
+    def update_buckets(
+        self,
+        keys: Sequence[str],
+        fn: Callable[[Dict[str, Optional[BucketRow]]], Tuple[Dict[str, BucketRow], T]],
+    ) -> T:
+        """在一个事务中读取令牌桶，由 fn 计算新值（可以只返回部分键）和结果，写回后返回结果"""
+        placeholders = ",".join("?" * len(keys))
+
+        def update(conn: sqlite3.Connection) -> T:
+            current: Dict[str, Optional[BucketRow]] = dict.fromkeys(keys)
+            for key, tokens, updated in conn.execute(
+                f"SELECT key, tokens, updated FROM buckets WHERE key IN ({placeholders})", keys
+            ):
+                current[key] = (tokens, updated)
+            rows, result = fn(current)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, tokens, updated) for key, (tokens, updated) in rows.items()],
+            )
+            return result
+
+        return self._transaction(update)
+
+    # 在途请求数
+
+    def try_acquire_slot(self, provider: str, limit: int) -> Tuple[bool, int]:
+        """所有 worker 的在途请求数未达到 limit 时占用一个名额，返回 (是否占用, 之后的合计在途数)"""
+
+        def acquire(conn: sqlite3.Connection) -> Tuple[bool, int]:
+            (in_use,) = conn.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM inflight WHERE provider = ?", (provider,)
+            ).fetchone()
+            if in_use >= limit:
+                return False, in_use
+            conn.execute(
+                "INSERT INTO inflight (provider, pid, count) VALUES (?, ?, 1) "
+                "ON CONFLICT(provider, pid) DO UPDATE SET count = count + 1",
+                (provider, self.pid),
+            )
+            return True, in_use + 1
+
+        result = self._transaction(acquire)
+        if result[0]:
+            self._held[provider] = self._held.get(provider, 0) + 1
+        return result
+
+    def release_slot(self, provider: str):
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE inflight SET count = MAX(count - 1, 0) WHERE provider = ? AND pid = ?", (provider, self.pid)
+        ))
+        self._held[provider] = max(self._held.get(provider, 0) - 1, 0)
+
+    def slots_in_use(self, provider: str) -> int:
+        return self._query("SELECT COALESCE(SUM(count), 0) FROM inflight WHERE provider = ?", (provider,))[0][0]
+
+    # 响应缓存
+
+    def get_response(self, key: str, now: float) -> Optional[Tuple[float, bytes]]:
+        """返回未过期条目的 (过期时间, 序列化的响应)"""
+        rows = self._query(
+            "SELECT expires_at, payload FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+        )
+        return rows[0] if rows else None
+
+    def set_response(self, key: str, expires_at: float, payload: bytes):
+        self._transaction(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO responses (key, expires_at, size, payload) VALUES (?, ?, ?, ?)",
+            (key, expires_at, len(payload), payload),
+        ))
+
+    def prune_responses(self, now: float, max_bytes: int) -> int:
+        """删除过期条目，总大小仍超过 max_bytes 时按过期时间从早到晚删除，返回删除的条数"""
+
+        def prune(conn: sqlite3.Connection) -> int:
+            removed = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+            (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+            if total > max_bytes:
+                excess = total - max_bytes
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY expires_at"):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                removed += len(victims)
+            return removed
+
+        return self._transaction(prune)
+
+    def clear_responses(self):
+        self._transaction(lambda conn: conn.execute("DELETE FROM responses"))
+
+    def reset(self, provider_names: Optional[Iterable[str]] = None):
+        """清除指定提供商（默认全部）的熔断器和令牌桶状态；在途计数属于仍在进行的调用，保留"""
+        names = None if provider_names is None else list(provider_names)
+
+        def reset(conn: sqlite3.Connection):
+            if names is None:
+                conn.execute("DELETE FROM breakers")
+                conn.execute("DELETE FROM buckets")
+                return
+            for name in names:
+                conn.execute("DELETE FROM breakers WHERE provider = ?", (name,))
+                conn.execute("DELETE FROM buckets WHERE key LIKE ? ESCAPE '\\'", (_like_prefix(name),))
+
+        self._transaction(reset)
+
+    def close(self, wait: bool = True):
+        """
+        执行完已提交的操作后关闭连接。
+        wait 为 False 时不等待：关闭连接排在已提交的操作之后，由后端线程执行。
+        """
+        if not wait:
+            self.submit(self._close_connection)
+        self._executor.shutdown(wait=wait)
+        if wait:
+            self._close_connection()
+
+    def _close_connection(self):
+        with self._lock:
+            held = [(count, provider, self.pid) for provider, count in self._held.items() if count]
+            if held:
+                # 关闭后在途请求的归还不再经过本后端，它们占用的名额现在归还
+                self._guarded(self._transaction, lambda conn: conn.executemany(
+                    "UPDATE inflight SET count = MAX(count - ?, 0) WHERE provider = ? AND pid = ?", held
+                ))
+                self._held.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _like_prefix(name: str) -> str:
+    escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}:%"
+
+
+def bucket_key(provider: str, kind: str) -> str:
+    """令牌桶在共享存储中的键，如 "openai:rpm" """
+    return f"{provider}:{kind}"
+
+
+_backend: Optional[SQLiteStateBackend] = None
+_backend_loaded = False
+
+
+def get_state_backend() -> Optional[SQLiteStateBackend]:
+    """
+    获取共享状态后端；配置 state.backend 为 memory（默认）时返回 None，各 worker 使用进程内状态。
+    """
+    global _backend, _backend_loaded
+    if not _backend_loaded:
+        config = get_settings().get_section("state")
+        backend = config.get("backend", STATE_BACKEND_MEMORY)
+        if backend == STATE_BACKEND_SQLITE:
+            path = config.get("path") or default_state_path()
+            _backend = SQLiteStateBackend(
+                path,
+                sync_interval=config.get("sync_interval", SYNC_INTERVAL_DEFAULT),
+                busy_timeout=config.get("busy_timeout", BUSY_TIMEOUT_DEFAULT),
+            )
+            logger.info("使用共享状态后端: %s", path)
+        elif backend != STATE_BACKEND_MEMORY:
+            raise ValueError(f"不支持的状态后端: {backend}")
+        _backend_loaded = True
+    return _backend
+
+
+def reset_state_backend():
+    """
+    丢弃共享状态后端，下次使用时按当前配置重新打开（state 配置热重载时调用）。
+    旧后端执行完已提交的操作后在后端线程中关闭连接，不阻塞事件循环；
+    之后在途请求持有的旧状态对象提交的操作直接返回 None，按进程内状态处理。
+    """
+    global _backend, _backend_loaded
+    if _backend is not None:
+        _backend.close(wait=False)
+    _backend = None
+    _backend_loaded = False
+
+
+def wall_to_monotonic(timestamp: float) -> float:
+    """把共享存储中的 time.time() 时间换算为本进程的 time.monotonic() 时间"""
+    return time.monotonic() - (time.time() - timestamp)
@@ -0,0 +1,97 @@
+import math
+from typing import Dict, List, NamedTuple, Tuple
+from ..models.schemas import ChatMessage
+
+# 每条消息的格式开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# ASCII 文本大约每4个字符一个token；中文等非ASCII字符大约每个字符一个token
+ASCII_CHARS_PER_TOKEN = 4
+
+
+class TokenizerProfile(NamedTuple):
+    """分词器提示：按字符类别换算token数的粗略比例"""
+    # 每个token对应的ASCII字符数
+    ascii_chars_per_token: float = ASCII_CHARS_PER_TOKEN
+    # 每个非ASCII字符（中文等）对应的token数
+    tokens_per_other_char: float = 1.0
+
+    def tokens(self, ascii_chars: int, other_chars: int) -> int:
+        return math.ceil(ascii_chars / self.ascii_chars_per_token) + math.ceil(other_chars * self.tokens_per_other_char)
+
+
+DEFAULT_TOKENIZER = TokenizerProfile()
+
+# 提供商配置 tokenizer 可选的提示，比例为经验值，只用于发送前的估算
+TOKENIZER_PROFILES: Dict[str, TokenizerProfile] = {
+    "default": DEFAULT_TOKENIZER,
+    "openai": TokenizerProfile(4, 0.8),
+    "anthropic": TokenizerProfile(3.5, 1.2),
+    "llama": TokenizerProfile(4, 1.0),
+    "qwen": TokenizerProfile(4, 0.7),
+}
+
+
+def get_tokenizer_profile(name: str = None) -> TokenizerProfile:
+    """按名称获取分词器提示，未设置时使用默认比例"""
+    if not name:
+        return DEFAULT_TOKENIZER
+    profile = TOKENIZER_PROFILES.get(name)
+    if profile is None:
+        raise ValueError(f"未知的分词器提示: {name}，可选: {', '.join(TOKENIZER_PROFILES)}")
+    return profile
+
+
+def _char_counts(text: str) -> Tuple[int, int]:
+    """
+    统计文本中的ASCII字符数和其他字符数。
+    扫描和编码都在C层单趟完成；按文本缓存时查找也要对整段文本计算哈希，节省有限，却会让完整的消息文本常驻内存，因此不缓存。
+    """
+    if text.isascii():
+        return len(text), 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars, len(text) - ascii_chars
+
+
+def estimate_text_tokens(text: str, profile: TokenizerProfile = DEFAULT_TOKENIZER) -> int:
+    """粗略估算一段文本的token数"""
+    if not text:
+        return 0
+    return profile.tokens(*_char_counts(text))
+
+
+def _content_text(content) -> str:
+    """提取消息内容中的文本（支持多段内容）"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+class PromptEstimate:
+    """
+    一次请求的提示词估算。
+    每条消息只统计一次字符数，再按各提供商的分词器提示换算，故障转移中多次估算不会重复扫描文本。
+    """
+
+    def __init__(self, messages: List[ChatMessage]):
+        self.messages = messages
+        self._counts = [
+            _char_counts(_content_text(message.get("content"))) for message in messages
+        ]
+        self._totals: Dict[TokenizerProfile, int] = {}
+
+    def message_tokens(self, profile: TokenizerProfile = DEFAULT_TOKENIZER) -> List[int]:
+        """每条消息（含格式开销）的token数"""
+        return [MESSAGE_OVERHEAD_TOKENS + profile.tokens(*counts) for counts in self._counts]
+
+    def tokens(self, profile: TokenizerProfile = DEFAULT_TOKENIZER) -> int:
+        total = self._totals.get(profile)
+        if total is None:
+            total = self._totals[profile] = sum(self.message_tokens(profile))
+        return total
+
+
+def estimate_messages_tokens(messages: List[ChatMessage], profile: TokenizerProfile = DEFAULT_TOKENIZER) -> int:
+    """估算消息列表的提示词token数，用于发送前的限流预算和上下文窗口检查"""
+    return PromptEstimate(messages).tokens(profile)
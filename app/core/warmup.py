@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from .ai_factory import AIFactory
+from ..config.settings import Settings
+from ..utils.logger import logger
+
+WARMUP_WAIT_DEFAULT = False
+WARMUP_TIMEOUT_DEFAULT = 300.0
+
+# 后台预热任务，保持引用避免被垃圾回收，关闭时统一取消
+_tasks: Set[asyncio.Task] = set()
+
+
+def warmup_targets(settings: Settings, names: Optional[Iterable[str]] = None) -> List[str]:
+    """需要预热的提供商：配置了 warmup 的 Ollama 提供商（names 不为空时只取其中的）"""
+    candidates = settings.AI_MODELS if names is None else names
+    targets = []
+    for name in candidates:
+        config = settings.get_provider_config(name)
+        if config is not None and config.type == "ollama" and config.warmup:
+            targets.append(name)
+    return targets
+
+
+async def warm_up(names: List[str], timeout: float = WARMUP_TIMEOUT_DEFAULT) -> Dict[str, Optional[str]]:
+    """并发预热给定的提供商，返回每个提供商的错误信息（成功为 None）；单个失败不影响其他提供商"""
+
+    async def warm_up_one(name: str) -> Optional[str]:
+        provider = AIFactory.get_provider(name)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(provider.warm_up(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("预热提供商 %s 超时（%s 秒）", name, timeout)
+            return f"超过 {timeout} 秒未完成"
+        except Exception as e:
+            logger.warning("预热提供商 %s 失败: %s", name, e)
+            return str(e)
+        logger.info("提供商 %s 的模型已加载，耗时 %.1f 秒", name, time.monotonic() - started)
+        return None
+
+    results = await asyncio.gather(*(warm_up_one(name) for name in names))
+    return dict(zip(names, results))
+
+
+async def start_warmup(
+    settings: Settings, names: Optional[Iterable[str]] = None, wait: Optional[bool] = None
+) -> Optional[asyncio.Task]:
+    """
+    预热配置了 warmup 的 Ollama 模型。
+    默认在后台进行，不阻塞启动；配置 warmup.wait 为 true（或传入 wait=True）时等待预热完成后再返回。
+    """
+    targets = warmup_targets(settings, names)
+    if not targets:
+        return None
+    config = settings.get_section("warmup")
+    timeout = config.get("timeout", WARMUP_TIMEOUT_DEFAULT)
+    if wait is None:
+        wait = config.get("wait", WARMUP_WAIT_DEFAULT)
+
+    logger.info("开始预热提供商: %s", targets)
+    if wait:
+        await warm_up(targets, timeout)
+        return None
+    task = asyncio.create_task(warm_up(targets, timeout))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def stop_warmup():
+    """取消尚未完成的后台预热"""
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
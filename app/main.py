@@ -1,8 +1,14 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .api.endpoints import ai_request
+from .api.endpoints import ai_request, admin, metrics
 from .config.settings import get_settings
-from .utils.logger import logger
+from .core.client_pool import init_client_registry, close_client_registry
+from .core.ai_factory import AIFactory
+from .core.capture import close_traffic_capture
+from .core.config_reload import get_config_reloader
+from .core.response_cache import close_response_cache
+from .core.warmup import start_warmup, stop_warmup
+from .utils.logger import logger, stop_log_listener
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -10,12 +16,29 @@ async def lifespan(app: FastAPI):
     应用生命周期管理
     """
     # 启动时执行
-    get_settings()
+    settings = get_settings()
+    # 为每个提供商创建长连接客户端
+    init_client_registry(settings)
+    # 预编译路由表，请求路径上只需一次字典查找
+    AIFactory.build_routing_table(settings)
+    # 注册 SIGHUP / 配置文件监视触发的热重载
+    reloader = get_config_reloader()
+    reloader.start(settings)
+    # 预热配置了 warmup 的 Ollama 模型，避免第一个请求承担模型加载时间
+    await start_warmup(settings)
     logger.info("应用启动")
     yield
     # 关闭时执行
-    # 清理代码（如果需要）可以放在这里
+    await stop_warmup()
+    await reloader.stop()
+    await close_client_registry()
+    AIFactory.reset()
+    # 写出流量捕获队列中剩余的记录和在途的磁盘缓存
+    close_traffic_capture()
+    await close_response_cache()
     logger.info("应用关闭")
+    # 异步日志模式下写出队列中剩余的记录
+    stop_log_listener()
 
 app = FastAPI(
     title="AI Request Service",
@@ -23,4 +46,7 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-app.include_router(ai_request.router, prefix="/api/v1")
\ No newline at end of file
+app.include_router(ai_request.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
+# Prometheus 约定的抓取路径，不带 API 前缀
+app.include_router(metrics.router)
\ No newline at end of file
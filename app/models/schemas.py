@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List, Literal
-from openai.types.chat import ChatCompletion
+from typing import Dict, Optional, List, Literal, Type, TypeVar, Union
+from openai.types import CreateEmbeddingResponse, Embedding
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 
 ChatMessage = ChatCompletionMessageParam
@@ -11,6 +12,8 @@ class AIRequest(BaseModel):
     stream: Optional[bool] = False
     temperature: Optional[float] = Field(default=0.7, ge=0.0, le=2.0)
     max_tokens: Optional[int] = None
+    # 本次请求的总超时（秒），优先于请求头 X-Request-Timeout 和配置的默认值
+    timeout: Optional[float] = Field(default=None, gt=0)
 
     @field_validator("messages")
     @classmethod
@@ -31,5 +34,156 @@ class ChatUsage(BaseModel):
 
 class ExtendedChatCompletion(ChatCompletion):
     provider: str
+    # 是否由响应缓存直接返回
+    cached: bool = False
+
+class ExtendedChatCompletionChunk(ChatCompletionChunk):
+    """流式响应的分块，附带实际使用的提供商"""
+    provider: str
 
 AIResponse = ExtendedChatCompletion
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# 各模型字段的默认值（按定义顺序，必填字段为 None），按类缓存
+_field_defaults: Dict[type, Dict] = {}
+
+def _defaults_of(cls: Type[BaseModel]) -> Dict:
+    defaults = _field_defaults.get(cls)
+    if defaults is None:
+        # 这里用到的模型可选字段默认值都是 None / False 等不可变值，可以在实例间共享
+        defaults = _field_defaults[cls] = {
+            name: None if field.is_required() else field.get_default(call_default_factory=True)
+            for name, field in cls.model_fields.items()
+        }
+    return defaults
+
+def extend_trusted(cls: Type[ModelT], model: BaseModel, **values) -> ModelT:
+    """
+    把已解析的父类模型实例转为子类实例并补充子类字段，不序列化也不校验。
+    只用于可信数据（SDK 已解析的对象），嵌套对象直接复用。
+    model_construct 会逐字段取默认值，openai SDK 重写的 construct 还会递归处理嵌套字段，这里直接填充实例属性。
+    """
+    # 按字段定义顺序填充，序列化结果的键顺序与校验构建的对象一致
+    data = {**_defaults_of(cls), **model.__dict__, **values}
+    instance = cls.__new__(cls)
+    object.__setattr__(instance, "__dict__", data)
+    object.__setattr__(instance, "__pydantic_fields_set__", model.__pydantic_fields_set__ | values.keys())
+    extra = model.__pydantic_extra__
+    object.__setattr__(instance, "__pydantic_extra__", dict(extra) if extra is not None else None)
+    object.__setattr__(instance, "__pydantic_private__", model.__pydantic_private__)
+    return instance
+
+def extend_completion(completion: ChatCompletion, provider: str) -> ExtendedChatCompletion:
+    """把SDK返回的 ChatCompletion 转为 ExtendedChatCompletion，复用已解析的子对象"""
+    return extend_trusted(ExtendedChatCompletion, completion, provider=provider)
+
+def extend_chunk(chunk: ChatCompletionChunk, provider: str) -> ExtendedChatCompletionChunk:
+    """把SDK返回的流式分块转为 ExtendedChatCompletionChunk，复用已解析的子对象"""
+    return extend_trusted(ExtendedChatCompletionChunk, chunk, provider=provider)
+
+def build_completion(
+    provider: str,
+    completion_id: str,
+    model: str,
+    created: int,
+    message: Dict,
+    finish_reason: str,
+    usage: Optional[Dict] = None,
+) -> ExtendedChatCompletion:
+    """
+    由转换后的字段直接构建最终响应对象（message 中除 role/content 外的键作为附加字段保留）。
+    只经过一次 pydantic-core 校验，不再先构建 ChatCompletion 再导出重建。
+    """
+    return ExtendedChatCompletion.model_validate({
+        "id": completion_id,
+        "choices": [{"finish_reason": finish_reason, "index": 0, "logprobs": None, "message": message}],
+        "created": created,
+        "model": model,
+        "object": "chat.completion",
+        "usage": usage,
+        "provider": provider,
+    })
+
+def build_chat_chunk(
+    provider: str,
+    model: str,
+    chunk_id: str,
+    created: int,
+    delta: Dict,
+    finish_reason: Optional[str] = None,
+    usage: Optional[Dict] = None,
+) -> ExtendedChatCompletionChunk:
+    """构建OpenAI格式的流式分块（delta 中的 reasoning_content 等作为附加字段保留）"""
+    return ExtendedChatCompletionChunk.model_validate({
+        "id": chunk_id,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+        "created": created,
+        "model": model,
+        "object": "chat.completion.chunk",
+        "usage": usage,
+        "provider": provider,
+    })
+
+
+class EmbeddingRequest(BaseModel):
+    """OpenAI兼容的 embeddings 请求，model 按提供商名、分组名解析"""
+    input: Union[str, List[str]]
+    model: Optional[str] = None
+    # 本次请求的总超时（秒），与对话补全相同
+    timeout: Optional[float] = Field(default=None, gt=0)
+
+    @field_validator("input")
+    @classmethod
+    def validate_input(cls, v):
+        if not v:
+            raise ValueError("输入不能为空")
+        return v
+
+    @property
+    def inputs(self) -> List[str]:
+        return [self.input] if isinstance(self.input, str) else self.input
+
+class ExtendedEmbeddingResponse(CreateEmbeddingResponse):
+    provider: str
+
+def build_embedding_response(
+    provider: str, model: str, vectors: List[List[float]], prompt_tokens: int
+) -> ExtendedEmbeddingResponse:
+    """由上游返回的向量直接构建响应；向量已由SDK解析，不再逐个校验浮点数"""
+    return ExtendedEmbeddingResponse.model_construct(
+        data=[Embedding.model_construct(embedding=vector, index=i, object="embedding") for i, vector in enumerate(vectors)],
+        model=model,
+        object="list",
+        usage={"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        provider=provider,
+    )
+
+
+class BatchRequest(BaseModel):
+    """批量请求：并发执行多个对话补全"""
+    requests: List[AIRequest]
+    # 本批次的并发上限，不能超过服务端配置的 batch.max_concurrency
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    # 为 true 时按完成顺序以 NDJSON 逐行返回结果
+    stream: Optional[bool] = False
+
+    @field_validator("requests")
+    @classmethod
+    def validate_requests(cls, v):
+        if not v:
+            raise ValueError("请求列表不能为空")
+        return v
+
+class BatchItemError(BaseModel):
+    status_code: int
+    message: str
+
+class BatchItemResult(BaseModel):
+    """单个请求的结果，index 为其在输入中的位置"""
+    index: int
+    response: Optional[ExtendedChatCompletion] = None
+    error: Optional[BatchItemError] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItemResult]
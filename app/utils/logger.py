@@ -1,16 +1,109 @@
+import atexit
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from datetime import datetime, timezone
+from typing import Optional
 
 LOG_LEVEL_DEFAULT = 'INFO'
 LOG_DIR_DEFAULT = 'logs'
 LOG_FILE_SIZE_DEFAULT = '50M'
 LOG_BACKUP_COUNT_DEFAULT = 5
+LOG_FORMAT_DEFAULT = 'text'
+LOG_MESSAGE_MAX_CHARS_DEFAULT = 2000
+LOG_MESSAGE_SAMPLE_RATE_DEFAULT = 1.0
 
 # 缓冲区，用于存储在logger实例创建前需要记录的日志消息
 _log_buffer_for_setup_logger = []
 
+# 异步模式下在后台线程中执行实际写入的监听器，以及挂在 logger 上的队列处理器
+_queue_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_queue_logger: Optional[logging.Logger] = None
+
+def _env_flag(name: str, default: bool) -> bool:
+    """读取布尔类型的环境变量"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+class JsonFormatter(logging.Formatter):
+    """结构化JSON日志格式，每条记录一行，便于日志采集系统解析"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'location': f"{record.filename}:{record.lineno}",
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    只把记录放入队列的处理器。
+    标准库的 prepare 会在调用方线程（事件循环）中调用 format，渲染异常堆栈并把它并入消息；
+    这里只合并消息参数，保留 exc_info，格式化和堆栈渲染由监听器线程中的处理器完成（JSON格式也因此保留 exception 字段）。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # 参数中的对象之后可能被修改，入队前合并为字符串
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+class MessageLogPolicy:
+    """
+    对话内容日志的策略：可以整体关闭、按比例采样，并截断过长的内容。
+    由环境变量 LOG_MESSAGES、LOG_MESSAGE_SAMPLE_RATE、LOG_MESSAGE_MAX_CHARS 配置。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        sample_rate: float = LOG_MESSAGE_SAMPLE_RATE_DEFAULT,
+        max_chars: int = LOG_MESSAGE_MAX_CHARS_DEFAULT,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+
+    def should_log(self, logger: logging.Logger, level: int = logging.INFO) -> bool:
+        """本次请求是否记录对话内容；级别未启用时不做任何格式化"""
+        if not self.enabled or not logger.isEnabledFor(level):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def truncate(self, text) -> str:
+        text = str(text)
+        if self.max_chars > 0 and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}...(共{len(text)}字符，已截断)"
+        return text
+
+    @classmethod
+    def from_env(cls) -> "MessageLogPolicy":
+        try:
+            sample_rate = float(os.getenv('LOG_MESSAGE_SAMPLE_RATE', LOG_MESSAGE_SAMPLE_RATE_DEFAULT))
+            max_chars = int(os.getenv('LOG_MESSAGE_MAX_CHARS', LOG_MESSAGE_MAX_CHARS_DEFAULT))
+        except ValueError as e:
+            _log_buffer_for_setup_logger.append({
+                'level': 'warning',
+                'message': f"对话日志配置无效，使用默认值。错误信息: {e}"
+            })
+            sample_rate, max_chars = LOG_MESSAGE_SAMPLE_RATE_DEFAULT, LOG_MESSAGE_MAX_CHARS_DEFAULT
+        return cls(_env_flag('LOG_MESSAGES', True), sample_rate, max_chars)
+
 def parse_log_file_size(size_str: str) -> int:
     """
     解析日志文件大小的字符串，返回字节数。
@@ -122,22 +215,60 @@ def setup_logger(name='ai_request_service'):
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
 
-    # 设置日志格式
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
-    )
+    # 设置日志格式：text（默认）或 json（结构化）
+    log_format = os.getenv('LOG_FORMAT', LOG_FORMAT_DEFAULT).lower()
+    if log_format == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
+        )
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
+    _log_buffer_for_setup_logger.append({
+        'level': 'info',
+        'message': f"LOG_FORMAT: {log_format}"
+    })
 
-    # 添加处理器
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    if _env_flag('LOG_ASYNC', False):
+        # 异步模式：事件循环中只把记录放入队列，格式化和磁盘/控制台写入在后台线程完成
+        global _queue_listener, _queue_handler, _queue_logger
+        log_queue = queue.SimpleQueue()
+        _queue_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        _queue_listener.start()
+        atexit.register(stop_log_listener)
+        _queue_handler = DeferredQueueHandler(log_queue)
+        _queue_logger = logger
+        logger.addHandler(_queue_handler)
+        _log_buffer_for_setup_logger.append({
+            'level': 'info',
+            'message': "LOG_ASYNC: 已启用队列异步日志"
+        })
+    else:
+        # 添加处理器
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
 
     return logger
 
+def stop_log_listener():
+    """停止异步日志的后台线程并写出队列中剩余的记录；之后的日志改为由处理器直接写入"""
+    global _queue_listener, _queue_handler, _queue_logger
+    if _queue_listener is None:
+        return
+    # 先换回直接写入的处理器，再停止监听器，停止期间的日志不会留在无人处理的队列中
+    for handler in _queue_listener.handlers:
+        _queue_logger.addHandler(handler)
+    _queue_logger.removeHandler(_queue_handler)
+    _queue_listener.stop()
+    _queue_listener = _queue_handler = _queue_logger = None
+
 # 创建默认logger实例
 logger = setup_logger()
 
+# 对话内容日志策略
+message_log_policy = MessageLogPolicy.from_env()
+
 # 在logger实例创建后，处理缓冲区中的日志消息
 for log_message in _log_buffer_for_setup_logger:
     getattr(logger, log_message['level'])(log_message['message'])
@@ -0,0 +1,181 @@
+"""
+响应转换与序列化的微基准：对比旧的"转换后 model_dump 再校验"路径与一次性构建的快速路径。
+
+    python -m benchmarks.bench_conversion [--number 20000]
+
+每种提供商分别测量"转换"和"转换 + 序列化"的单次耗时（微秒），
+旧路径的序列化按 FastAPI 的处理方式（按 response_model 重新校验后 jsonable_encoder + json.dumps）计算。
+"""
+import argparse
+import json
+import time
+import timeit
+from typing import Callable, Dict, List, Tuple
+from anthropic.types.message import Message as AnthropicMessage
+from fastapi.encoders import jsonable_encoder
+from ollama import ChatResponse as OllamaChatCompletion
+from openai.types.chat.chat_completion import ChatCompletion
+from app.core.ai_provider import (
+    ANTHROPIC_FINISH_REASONS,
+    AnthropicProvider,
+    OllamaProvider,
+    THINK_CLOSE_TAG,
+    THINK_OPEN_TAG,
+)
+from app.models.schemas import AIResponse, ExtendedChatCompletion, extend_completion
+
+CONTENT = "这是一段用于基准测试的回复内容。" * 20
+
+OPENAI_RESPONSE = ChatCompletion.model_validate({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 1700000000,
+    "model": "gpt-4o-mini",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "logprobs": None,
+        "message": {"role": "assistant", "content": CONTENT},
+    }],
+    "usage": {"prompt_tokens": 120, "completion_tokens": 240, "total_tokens": 360},
+})
+
+ANTHROPIC_RESPONSE = AnthropicMessage.model_validate({
+    "id": "msg_bench",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-3-5-sonnet",
+    "content": [{"type": "text", "text": CONTENT}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 120, "output_tokens": 240},
+})
+
+OLLAMA_RESPONSE = OllamaChatCompletion.model_validate({
+    "model": "qwen2.5",
+    "created_at": "2024-01-01T00:00:00Z",
+    "done": True,
+    "message": {"role": "assistant", "content": f"{THINK_OPEN_TAG}推理过程{THINK_CLOSE_TAG}{CONTENT}"},
+    "prompt_eval_count": 120,
+    "eval_count": 240,
+})
+
+anthropic_provider = AnthropicProvider(None, "claude-3-5-sonnet", 1024, "anthropic")
+ollama_provider = OllamaProvider(None, "qwen2.5", 1024, "ollama")
+
+
+def legacy_openai(response: ChatCompletion) -> ExtendedChatCompletion:
+    return ExtendedChatCompletion(**response.model_dump(), provider="openai")
+
+
+def legacy_anthropic(response: AnthropicMessage) -> ExtendedChatCompletion:
+    choice = {
+        "finish_reason": ANTHROPIC_FINISH_REASONS.get(response.stop_reason, "stop"),
+        "index": 0,
+        "message": {
+            "role": response.role,
+            "content": "".join(getattr(block, "text", "") for block in response.content),
+        },
+        "logprobs": None,
+    }
+    completion = ChatCompletion(
+        id=response.id,
+        choices=[choice],
+        created=int(time.time()),
+        model="claude-3-5-sonnet",
+        object="chat.completion",
+        usage={
+            "prompt_tokens": response.usage.input_tokens,
+            "completion_tokens": response.usage.output_tokens,
+            "total_tokens": response.usage.input_tokens + response.usage.output_tokens,
+        },
+    )
+    return ExtendedChatCompletion(**completion.model_dump(), provider="anthropic")
+
+
+def legacy_ollama(response: OllamaChatCompletion) -> ExtendedChatCompletion:
+    reasoning_content, message_content = response.message.content.split(THINK_CLOSE_TAG)
+    choice = {
+        "finish_reason": "stop",
+        "index": 0,
+        "message": {
+            "role": response.message.role,
+            "content": message_content.strip(),
+            "reasoning_content": reasoning_content.replace(THINK_OPEN_TAG, "").strip(),
+        },
+        "logprobs": None,
+    }
+    completion = ChatCompletion(
+        id=f"ollama-{int(time.time())}",
+        choices=[choice],
+        created=int(time.time()),
+        model="qwen2.5",
+        object="chat.completion",
+        usage={
+            "prompt_tokens": response.prompt_eval_count or 0,
+            "completion_tokens": response.eval_count or 0,
+            "total_tokens": (response.prompt_eval_count or 0) + (response.eval_count or 0),
+        },
+    )
+    return ExtendedChatCompletion(**completion.model_dump(), provider="ollama")
+
+
+def legacy_serialize(response: ExtendedChatCompletion) -> bytes:
+    """FastAPI 对 response_model 的处理：重新校验、jsonable_encoder、json.dumps"""
+    validated = AIResponse.model_validate(response.model_dump())
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_serialize(response: ExtendedChatCompletion) -> bytes:
+    return response.__pydantic_serializer__.to_json(response)
+
+
+CASES: List[Tuple[str, Callable[[], ExtendedChatCompletion], Callable[[], ExtendedChatCompletion]]] = [
+    ("openai", lambda: legacy_openai(OPENAI_RESPONSE), lambda: extend_completion(OPENAI_RESPONSE, "openai")),
+    (
+        "anthropic",
+        lambda: legacy_anthropic(ANTHROPIC_RESPONSE),
+        lambda: anthropic_provider._convert_anthropic_to_openai_format(ANTHROPIC_RESPONSE),
+    ),
+    (
+        "ollama",
+        lambda: legacy_ollama(OLLAMA_RESPONSE),
+        lambda: ollama_provider._convert_ollama_to_openai_format(OLLAMA_RESPONSE),
+    ),
+]
+
+
+def measure(func: Callable[[], object], number: int) -> float:
+    """多次重复取最小值，返回单次耗时（微秒）"""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def run(number: int) -> List[Dict]:
+    rows = []
+    for name, legacy, fast in CASES:
+        rows.append({
+            "provider": name,
+            "legacy_convert_us": measure(legacy, number),
+            "fast_convert_us": measure(fast, number),
+            "legacy_total_us": measure(lambda: legacy_serialize(legacy()), number),
+            "fast_total_us": measure(lambda: fast_serialize(fast()), number),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_conversion", description="响应转换微基准")
+    parser.add_argument("--number", type=int, default=20000, help="每轮执行次数")
+    args = parser.parse_args(argv)
+
+    print(f"{'provider':<10} {'转换(旧)':>10} {'转换(新)':>10} {'含序列化(旧)':>14} {'含序列化(新)':>14} {'节省':>10}")
+    for row in run(args.number):
+        saved = row["legacy_total_us"] - row["fast_total_us"]
+        print(
+            f"{row['provider']:<10} {row['legacy_convert_us']:>10.1f} {row['fast_convert_us']:>10.1f} "
+            f"{row['legacy_total_us']:>14.1f} {row['fast_total_us']:>14.1f} {saved:>8.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+压测与代理开销基准：在本地启动模拟上游和网关，按给定并发驱动请求并输出 JSON 结果。
+
+    python -m benchmarks.bench_load [--protocols openai,anthropic,ollama] [--concurrency 1,16,64]
+                                    [--requests 200] [--stream] [--output results.json]
+
+流程：
+1. 以子进程启动 benchmarks.mock_upstream（参数同该模块，可注入延迟、分片节奏和错误）；
+2. 生成指向模拟上游的临时配置，以子进程启动网关（uvicorn app.main:app）；
+3. 对每种协议、每个并发级别，先直连模拟上游测量基线，再经网关测量同样的请求；
+4. 汇总吞吐、延迟分位数（流式请求另有首字节时间）、相对直连的代理开销，
+   以及网关进程的 RSS 峰值增量除以并发数得到的单个在途请求内存（读取 /proc，仅 Linux 可用）。
+
+网关按基准配置运行：关闭重试、熔断和请求合并，使注入的错误原样体现在结果中且相同请求不会被合并。
+任何一级的失败比例超出注入的错误率加 --max-error-rate 时中止压测并以非0状态退出，避免把出错的网关测成基线。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import httpx
+import yaml
+from benchmarks.mock_upstream import add_options_arguments
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGES = [{"role": "user", "content": "用一句话介绍你自己"}]
+MAX_TOKENS = 256
+STARTUP_TIMEOUT = 30.0
+RSS_SAMPLE_INTERVAL = 0.01
+# 在注入的错误率之外允许的失败比例（预热请求较少，留出随机波动的余量）
+MAX_ERROR_RATE_DEFAULT = 0.1
+
+# 协议 -> (网关中的提供商名称, 提供商类型, 模拟上游的请求路径)
+PROTOCOLS: Dict[str, tuple] = {
+    "openai": ("bench-openai", "openai", "/v1/chat/completions"),
+    "anthropic": ("bench-anthropic", "anthropic", "/v1/messages"),
+    "ollama": ("bench-ollama", "ollama", "/api/chat"),
+}
+
+
+class BenchmarkError(RuntimeError):
+    """压测结果不可用（如大部分请求失败），不应作为基线"""
+
+
+@dataclass
+class Sample:
+    status: int
+    latency: float
+    ttfb: Optional[float]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_rss(pid: int) -> Optional[int]:
+    """读取进程的常驻内存（字节）；不支持 /proc 的平台返回 None"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩法求分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def build_config(upstream: str, max_concurrency: int) -> Dict:
+    """生成指向模拟上游的网关配置"""
+    pool = {
+        "max_connections": max(100, max_concurrency * 2),
+        "max_keepalive_connections": max(20, max_concurrency),
+        "max_retries": 0,
+        "failure_threshold": 0,
+        "max_tokens": MAX_TOKENS,
+    }
+    providers = {
+        "bench-openai": {"type": "openai", "api_key": "bench", "base_url": f"{upstream}/v1", "model": "mock", **pool},
+        "bench-anthropic": {"type": "anthropic", "api_key": "bench", "base_url": upstream, "model": "mock", **pool},
+        "bench-ollama": {"type": "ollama", "base_url": upstream, "model": "mock", **pool},
+    }
+    return {
+        "providers": providers,
+        "priority": list(providers),
+        "singleflight": {"enabled": False},
+        "reload": {"sighup": False, "watch": False},
+    }
+
+
+def direct_payload(protocol: str, stream: bool) -> Dict:
+    payload = {"model": "mock", "messages": MESSAGES, "stream": stream}
+    if protocol == "anthropic":
+        payload["max_tokens"] = MAX_TOKENS
+    return payload
+
+
+async def send(client: httpx.AsyncClient, url: str, payload: Dict) -> Sample:
+    """发送一个请求并读完响应体，记录总耗时和首字节时间"""
+    started = time.perf_counter()
+    ttfb = None
+    try:
+        async with client.stream("POST", url, json=payload) as response:
+            async for _ in response.aiter_raw():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+            status = response.status_code
+    except httpx.HTTPError:
+        status = 0
+    return Sample(status, time.perf_counter() - started, ttfb)
+
+
+async def sample_rss(pid: int, peak: List[int], stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss(pid)
+        if rss is not None and rss > peak[0]:
+            peak[0] = rss
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict,
+    concurrency: int,
+    total: int,
+    pid: Optional[int] = None,
+    max_error_rate: Optional[float] = None,
+) -> Dict:
+    """
+    以固定并发发送 total 个请求，pid 不为空时同时采样该进程的内存。
+    max_error_rate 不为空时，失败（非200）的比例超过它就抛出 BenchmarkError。
+    """
+    remaining = [total]
+    samples: List[Sample] = []
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            samples.append(await send(client, url, payload))
+
+    idle_rss = read_rss(pid) if pid else None
+    peak = [idle_rss or 0]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(pid, peak, stop)) if idle_rss is not None else None
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if sampler is not None:
+        await sampler
+
+    ok = [s for s in samples if s.status == 200]
+    latencies = [s.latency for s in ok]
+    ttfbs = [s.ttfb for s in ok if s.ttfb is not None]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s.status != 200:
+            errors[str(s.status)] = errors.get(str(s.status), 0) + 1
+
+    error_rate = 1 - len(ok) / len(samples) if samples else 0.0
+    if max_error_rate is not None and error_rate > max_error_rate:
+        raise BenchmarkError(
+            f"{url} 并发 {concurrency} 时 {error_rate:.1%} 的请求失败（上限 {max_error_rate:.1%}），状态码: {errors}"
+        )
+
+    result = {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": errors,
+        "error_rate": error_rate,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": {f"p{q}": _ms(percentile(latencies, q)) for q in (50, 95, 99)},
+        "ttfb_ms": {f"p{q}": _ms(percentile(ttfbs, q)) for q in (50, 95, 99)},
+    }
+    if idle_rss is not None:
+        result["rss_idle_bytes"] = idle_rss
+        result["rss_peak_bytes"] = peak[0]
+        result["memory_per_in_flight_bytes"] = (peak[0] - idle_rss) / concurrency
+    return result
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value * 1000, 3)
+
+
+def overhead(gateway: Dict, direct: Dict, key: str) -> Dict:
+    """网关相对直连上游的额外耗时（毫秒）"""
+    return {
+        q: None if gateway[key][q] is None or direct[key][q] is None else round(gateway[key][q] - direct[key][q], 3)
+        for q in gateway[key]
+    }
+
+
+async def wait_ready(url: str, process: subprocess.Popen, name: str):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} 启动失败，退出码 {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{name} 在 {STARTUP_TIMEOUT} 秒内未就绪")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args: argparse.Namespace, mock_argv: List[str]) -> Dict:
+    protocols = [p.strip() for p in args.protocols.split(",") if p.strip()]
+    unknown = [p for p in protocols if p not in PROTOCOLS]
+    if unknown:
+        raise SystemExit(f"未知的协议: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    mock_port, gateway_port = free_port(), free_port()
+    upstream = f"http://127.0.0.1:{mock_port}"
+    gateway = f"http://127.0.0.1:{gateway_port}"
+
+    with tempfile.TemporaryDirectory(prefix="bench-load-") as workdir:
+        config_path = os.path.join(workdir, "config.yaml")
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(build_config(upstream, max(levels)), f, allow_unicode=True)
+
+        env = dict(os.environ, CONFIG_PATH=config_path, LOG_LEVEL=args.log_level, LOG_DIR=os.path.join(workdir, "logs"))
+        env.pop("TESTING", None)
+        mock = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.mock_upstream", "--port", str(mock_port), *mock_argv],
+            cwd=ROOT_DIR,
+        )
+        # 网关的控制台日志写入临时文件，避免错误注入时刷屏；启动失败时打印出来便于排查
+        server_output = open(os.path.join(workdir, "gateway.out"), "w+", encoding="utf-8")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(gateway_port), "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT_DIR,
+            env=env,
+            stdout=server_output,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            await wait_ready(f"{upstream}/health", mock, "模拟上游")
+            try:
+                await wait_ready(f"{gateway}/metrics", server, "网关")
+            except RuntimeError:
+                server_output.seek(0)
+                print(server_output.read()[-4000:], file=sys.stderr)
+                raise
+
+            # 预热阶段就检查失败比例，网关出错时尽早中止
+            max_error_rate = min(1.0, args.error_rate + args.max_error_rate)
+            limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels))
+            timeout = httpx.Timeout(args.request_timeout)
+            results = []
+            async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+                for protocol in protocols:
+                    provider_name, _, path = PROTOCOLS[protocol]
+                    gateway_payload = {"model": provider_name, "messages": MESSAGES, "stream": args.stream}
+                    for concurrency in levels:
+                        warmup = min(args.requests, max(concurrency, args.warmup))
+                        direct_url = f"{upstream}{path}"
+                        gateway_url = f"{gateway}/api/v1/chat/completions"
+                        direct_body = direct_payload(protocol, args.stream)
+                        try:
+                            await run_level(
+                                client, direct_url, direct_body, concurrency, warmup, max_error_rate=max_error_rate
+                            )
+                            await run_level(
+                                client, gateway_url, gateway_payload, concurrency, warmup, max_error_rate=max_error_rate
+                            )
+                            direct = await run_level(
+                                client, direct_url, direct_body, concurrency, args.requests, max_error_rate=max_error_rate
+                            )
+                            proxied = await run_level(
+                                client, gateway_url, gateway_payload,
+                                concurrency, args.requests, pid=server.pid, max_error_rate=max_error_rate,
+                            )
+                        except BenchmarkError:
+                            server_output.seek(0)
+                            print(server_output.read()[-4000:], file=sys.stderr)
+                            raise
+                        results.append({
+                            "protocol": protocol,
+                            "concurrency": concurrency,
+                            "gateway": proxied,
+                            "direct": direct,
+                            "overhead_ms": overhead(proxied, direct, "latency_ms"),
+                            "ttfb_overhead_ms": overhead(proxied, direct, "ttfb_ms"),
+                        })
+                        _print_row(results[-1])
+        finally:
+            for process in (server, mock):
+                process.terminate()
+            for process in (server, mock):
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            server_output.close()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {
+                "protocols": protocols,
+                "concurrency": levels,
+                "requests": args.requests,
+                "stream": args.stream,
+                "log_level": args.log_level,
+                "upstream": upstream_params(args),
+            },
+        },
+        "results": results,
+    }
+
+
+def upstream_params(args: argparse.Namespace) -> Dict:
+    return {
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "chunks": args.chunks,
+        "chunk_interval_ms": args.chunk_interval_ms,
+        "error_rate": args.error_rate,
+        "error_status": args.error_status,
+    }
+
+
+def _print_row(row: Dict):
+    gateway = row["gateway"]
+    memory = gateway.get("memory_per_in_flight_bytes")
+    print(
+        f"{row['protocol']:<10} c={row['concurrency']:<4} {gateway['throughput_rps']:>9.1f} req/s  "
+        f"p50={gateway['latency_ms']['p50']}ms p95={gateway['latency_ms']['p95']}ms p99={gateway['latency_ms']['p99']}ms  "
+        f"开销p50={row['overhead_ms']['p50']}ms  "
+        f"内存/在途={'-' if memory is None else f'{memory / 1024:.1f}KiB'}  "
+        f"错误={gateway['errors'] or 0}",
+        flush=True,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_load", description="网关压测与代理开销基准")
+    parser.add_argument("--protocols", default="openai,anthropic,ollama", help="逗号分隔的上游协议")
+    parser.add_argument("--concurrency", default="1,16,64", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发级别的请求数")
+    parser.add_argument("--warmup", type=int, default=20, help="每个并发级别正式测量前的预热请求数")
+    parser.add_argument("--stream", action="store_true", help="使用流式请求")
+    parser.add_argument("--request-timeout", type=float, default=60.0, help="单个请求的超时（秒）")
+    parser.add_argument("--log-level", default="WARNING", help="网关进程的日志级别")
+    parser.add_argument("--output", help="结果JSON的写入路径（默认只打印）")
+    parser.add_argument(
+        "--max-error-rate", type=float, default=MAX_ERROR_RATE_DEFAULT,
+        help="在注入的错误率之外允许的失败比例，超出时中止压测",
+    )
+    mock_group = parser.add_argument_group("模拟上游")
+    add_options_arguments(mock_group)
+    args = parser.parse_args(argv)
+
+    mock_argv = []
+    for name, value in upstream_params(args).items():
+        mock_argv += [f"--{name.replace('_', '-')}", str(value)]
+    try:
+        report = asyncio.run(benchmark(args, mock_argv))
+    except BenchmarkError as e:
+        raise SystemExit(f"压测中止: {e}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
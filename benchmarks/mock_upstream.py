@@ -0,0 +1,280 @@
+"""
+本地模拟上游：同一个服务同时实现 OpenAI、Anthropic 和 Ollama 的对话接口，用于压测时替代真实提供商。
+
+    python -m benchmarks.mock_upstream --port 9100 [--latency-ms 50] [--chunks 20] [--chunk-interval-ms 5] [--error-rate 0]
+
+- POST /v1/chat/completions  OpenAI 格式（JSON / SSE）
+- POST /v1/messages          Anthropic 格式（JSON / SSE 事件）
+- POST /api/chat             Ollama 格式（JSON / NDJSON）
+
+latency 为首字节前的等待时间（叠加 ±jitter 的均匀抖动），流式响应之后每隔 chunk_interval 输出一个分片；
+按 error_rate 的概率直接返回 error_status 状态码，用于观察故障转移和错误路径的开销。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+PROMPT_TOKENS = 16
+
+
+@dataclass
+class MockOptions:
+    """模拟上游的行为参数（时间单位为秒）"""
+    latency: float = 0.05
+    jitter: float = 0.0
+    chunks: int = 20
+    chunk_interval: float = 0.005
+    error_rate: float = 0.0
+    error_status: int = 500
+    chunk_text: str = "模拟输出"
+
+
+def _pieces(options: MockOptions) -> List[str]:
+    return [options.chunk_text] * max(options.chunks, 1)
+
+
+async def _wait_first_byte(options: MockOptions):
+    delay = options.latency
+    if options.jitter:
+        delay += random.uniform(-options.jitter, options.jitter)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+def _injected_error(options: MockOptions):
+    if options.error_rate and random.random() < options.error_rate:
+        return JSONResponse(
+            {"error": {"message": "injected error", "type": "server_error"}},
+            status_code=options.error_status,
+        )
+    return None
+
+
+async def _paced(pieces: List[str], options: MockOptions) -> AsyncIterator[str]:
+    """按固定间隔依次产出分片，首个分片之前不额外等待"""
+    for index, piece in enumerate(pieces):
+        if index and options.chunk_interval > 0:
+            await asyncio.sleep(options.chunk_interval)
+        yield piece
+
+
+def _sse(data: Dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def openai_chat(request: Request) -> Response:
+    options: MockOptions = request.app.state.options
+    body = await request.json()
+    await _wait_first_byte(options)
+    error = _injected_error(options)
+    if error is not None:
+        return error
+
+    model = body.get("model", "mock")
+    created = int(time.time())
+    completion_id = f"chatcmpl-mock-{time.monotonic_ns()}"
+    pieces = _pieces(options)
+    usage = {
+        "prompt_tokens": PROMPT_TOKENS,
+        "completion_tokens": len(pieces),
+        "total_tokens": PROMPT_TOKENS + len(pieces),
+    }
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(pieces)},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": usage,
+        })
+
+    def chunk(delta: Dict, finish_reason=None) -> str:
+        return _sse({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        async for piece in _paced(pieces, options):
+            yield chunk({"content": piece})
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def anthropic_messages(request: Request) -> Response:
+    options: MockOptions = request.app.state.options
+    body = await request.json()
+    await _wait_first_byte(options)
+    error = _injected_error(options)
+    if error is not None:
+        return error
+
+    model = body.get("model", "mock")
+    message_id = f"msg_mock_{time.monotonic_ns()}"
+    pieces = _pieces(options)
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": "".join(pieces)}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": PROMPT_TOKENS, "output_tokens": len(pieces)},
+        })
+
+    async def events():
+        yield _sse({
+            "type": "message_start",
+            "message": {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [],
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": {"input_tokens": PROMPT_TOKENS, "output_tokens": 1},
+            },
+        }, "message_start")
+        yield _sse({
+            "type": "content_block_start",
+            "index": 0,
+            "content_block": {"type": "text", "text": ""},
+        }, "content_block_start")
+        async for piece in _paced(pieces, options):
+            yield _sse({
+                "type": "content_block_delta",
+                "index": 0,
+                "delta": {"type": "text_delta", "text": piece},
+            }, "content_block_delta")
+        yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        yield _sse({
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(pieces)},
+        }, "message_delta")
+        yield _sse({"type": "message_stop"}, "message_stop")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+async def ollama_chat(request: Request) -> Response:
+    options: MockOptions = request.app.state.options
+    body = await request.json()
+    await _wait_first_byte(options)
+    error = _injected_error(options)
+    if error is not None:
+        return error
+
+    model = body.get("model", "mock")
+    created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    pieces = _pieces(options)
+    final = {
+        "done_reason": "stop",
+        "prompt_eval_count": PROMPT_TOKENS,
+        "eval_count": len(pieces),
+    }
+
+    # Ollama 默认使用流式输出，只有显式 stream=false 时返回单个对象
+    if body.get("stream") is False:
+        return JSONResponse({
+            "model": model,
+            "created_at": created_at,
+            "message": {"role": "assistant", "content": "".join(pieces)},
+            "done": True,
+            **final,
+        })
+
+    async def lines():
+        async for piece in _paced(pieces, options):
+            yield json.dumps({
+                "model": model,
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": piece},
+                "done": False,
+            }, ensure_ascii=False) + "\n"
+        yield json.dumps({
+            "model": model,
+            "created_at": created_at,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            **final,
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def health(request: Request) -> Response:
+    return JSONResponse({"status": "ok"})
+
+
+def create_app(options: MockOptions = None) -> Starlette:
+    app = Starlette(routes=[
+        Route("/v1/chat/completions", openai_chat, methods=["POST"]),
+        Route("/v1/messages", anthropic_messages, methods=["POST"]),
+        Route("/api/chat", ollama_chat, methods=["POST"]),
+        Route("/health", health, methods=["GET"]),
+    ])
+    app.state.options = options or MockOptions()
+    return app
+
+
+def add_options_arguments(parser: argparse.ArgumentParser):
+    """模拟上游的命令行参数，压测脚本启动子进程时原样透传"""
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="首字节前的等待时间（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="首字节等待时间的均匀抖动范围（毫秒）")
+    parser.add_argument("--chunks", type=int, default=20, help="每个响应的分片数")
+    parser.add_argument("--chunk-interval-ms", type=float, default=5.0, help="流式分片之间的间隔（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率（0-1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误时返回的状态码")
+
+
+def options_from_args(args: argparse.Namespace) -> MockOptions:
+    return MockOptions(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        chunks=args.chunks,
+        chunk_interval=args.chunk_interval_ms / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.mock_upstream", description="模拟上游提供商")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_options_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(options_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+回放捕获的流量（capture.enabled 时写出的 JSONL），按原始或缩放后的到达间隔向目标实例重新发送请求。
+
+    python -m benchmarks.replay capture.jsonl [--target http://127.0.0.1:8000] [--speed 1.0]
+                                [--limit 1000] [--model group1] [--output report.json]
+
+--speed 2 表示以两倍速回放（到达间隔减半），0.5 表示以一半速度回放。
+报告包含延迟分位数（流式请求另有首字节时间）、错误率、实际吞吐，
+以及请求实际发出时间相对计划时间的延迟：该值持续增大说明回放端或 --max-in-flight 成为了瓶颈，结果不再反映原始的流量形态。
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Iterator, List, Optional
+import httpx
+from benchmarks.bench_load import Sample, _ms, percentile, send
+
+CHAT_PATH = "/api/v1/chat/completions"
+QUANTILES = (50, 90, 95, 99)
+
+
+def load_capture(path: str, limit: Optional[int] = None) -> List[Dict]:
+    """读取捕获文件，按到达时间排序；跳过无法解析的行（如写入中断留下的半行）"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "ts" in record and "request" in record:
+                records.append(record)
+    records.sort(key=lambda record: record["ts"])
+    return records[:limit] if limit else records
+
+
+def schedule(records: List[Dict], speed: float) -> Iterator[float]:
+    """每个请求相对回放开始时间的发送时刻（秒）"""
+    if not records:
+        return
+    start = records[0]["ts"]
+    for record in records:
+        yield (record["ts"] - start) / speed
+
+
+def _quantiles(values: List[float]) -> Dict:
+    summary = {f"p{q}": _ms(percentile(values, q)) for q in QUANTILES}
+    summary["max"] = _ms(max(values)) if values else None
+    return summary
+
+
+def summarize(records: List[Dict], samples: List[Sample], lags: List[float], elapsed: float, speed: float) -> Dict:
+    ok = [s for s in samples if s.status == 200]
+    streamed = [s for record, s in zip(records, samples) if s.status == 200 and record["request"].get("stream")]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s.status != 200:
+            errors[str(s.status)] = errors.get(str(s.status), 0) + 1
+    captured_span = records[-1]["ts"] - records[0]["ts"] if records else 0.0
+    captured_latencies = [r["latency_ms"] / 1000 for r in records if r.get("outcome") == "success" and "latency_ms" in r]
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "offered_rps": round(len(records) * speed / captured_span, 3) if captured_span else None,
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": _quantiles([s.latency for s in ok]),
+        "ttfb_ms": _quantiles([s.ttfb for s in streamed if s.ttfb is not None]),
+        "schedule_lag_ms": _quantiles(lags),
+        # 捕获时记录的服务端耗时，便于和回放结果对比
+        "captured_latency_ms": _quantiles(captured_latencies),
+    }
+
+
+async def replay(
+    records: List[Dict],
+    target: str,
+    speed: float = 1.0,
+    max_in_flight: int = 1000,
+    request_timeout: float = 300.0,
+    model: Optional[str] = None,
+) -> Dict:
+    url = target.rstrip("/") + CHAT_PATH
+    samples: List[Optional[Sample]] = [None] * len(records)
+    lags: List[float] = []
+    slots = asyncio.Semaphore(max_in_flight)
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+
+    async with httpx.AsyncClient(timeout=request_timeout, limits=limits) as client:
+
+        async def fire(index: int, payload: Dict):
+            try:
+                samples[index] = await send(client, url, payload)
+            finally:
+                slots.release()
+
+        tasks = []
+        started = time.perf_counter()
+        for index, (record, offset) in enumerate(zip(records, schedule(records, speed))):
+            delay = offset - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            lags.append(max(0.0, time.perf_counter() - started - offset))
+            payload = dict(record["request"])
+            if model is not None:
+                payload["model"] = model
+            tasks.append(asyncio.create_task(fire(index, payload)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    return summarize(records, samples, lags, elapsed, speed)
+
+
+def _print_report(report: Dict):
+    latency = report["latency_ms"]
+    print(
+        f"请求 {report['requests']}，成功 {report['ok']}，错误率 {report['error_rate']:.2%} {report['errors'] or ''}\n"
+        f"耗时 {report['elapsed_s']} 秒，吞吐 {report['throughput_rps']} req/s（计划 {report['offered_rps']} req/s）\n"
+        f"延迟 p50={latency['p50']}ms p90={latency['p90']}ms p95={latency['p95']}ms "
+        f"p99={latency['p99']}ms max={latency['max']}ms\n"
+        f"首字节 p50={report['ttfb_ms']['p50']}ms p99={report['ttfb_ms']['p99']}ms；"
+        f"发送延迟 p99={report['schedule_lag_ms']['p99']}ms",
+        flush=True,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.replay", description="回放捕获的流量")
+    parser.add_argument("capture", help="捕获的 JSONL 文件")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="目标实例地址")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，1 为原始速度")
+    parser.add_argument("--limit", type=int, help="只回放前 N 个请求")
+    parser.add_argument("--model", help="覆盖请求中的 model（路由到目标实例上的其他分组）")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="回放端同时在途的请求上限")
+    parser.add_argument("--request-timeout", type=float, default=300.0, help="单个请求的超时（秒）")
+    parser.add_argument("--output", help="报告JSON的写入路径（默认只打印）")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed 必须大于0")
+
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        parser.error(f"{args.capture} 中没有可回放的请求")
+    print(f"回放 {len(records)} 个请求 -> {args.target}，速度 x{args.speed}", flush=True)
+    report = asyncio.run(replay(
+        records,
+        args.target,
+        speed=args.speed,
+        max_in_flight=args.max_in_flight,
+        request_timeout=args.request_timeout,
+        model=args.model,
+    ))
+    report["meta"] = {"capture": args.capture, "target": args.target, "speed": args.speed, "model": args.model}
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
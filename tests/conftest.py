@@ -1,6 +1,9 @@
+import asyncio
+import inspect
 import pytest
 import os
 import sys
+import time
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock, mock_open
 import json
@@ -13,6 +16,7 @@ os.environ["TESTING"] = "true"
 
 # 延迟导入 app，确保环境变量已设置
 from app.main import app
+from app.core.ai_provider import AIProvider, build_chat_chunk
 
 @pytest.fixture
 def client():
@@ -34,4 +38,87 @@ def format_response(response):
     try:
         return json.dumps(response.json(), ensure_ascii=False, indent=2)
     except:
-        return response.text
\ No newline at end of file
+        return response.text
+
+
+def fake_embeddings(inputs):
+    """每条输入的向量为 [输入长度]，token数为总字符数"""
+    return [[float(len(text))] for text in inputs], sum(len(text) for text in inputs)
+
+
+class FakeProvider(AIProvider):
+    """
+    测试用的可配置提供商，记录每次调用。
+    delay 为每次调用的耗时（秒），为列表时依次作为每次调用的耗时；fail 为 True 时调用抛出 error。
+    reply 按消息列表（embeddings 为输入列表）生成返回值，可以是协程函数；默认对话返回提供商名称，embeddings 见 fake_embeddings。
+    pieces 为流式输出的内容片段，fail_after 为从第几个片段开始中断；不设置时不支持流式。
+    """
+
+    def __init__(
+        self,
+        provider_name="fake",
+        delay=0,
+        fail=False,
+        error=None,
+        reply=None,
+        pieces=None,
+        fail_after=None,
+        max_tokens=None,
+        context_window=None,
+        supports_embeddings=False,
+    ):
+        self.provider_name = provider_name
+        self.delay = delay
+        self.fail = fail
+        self.error = error
+        self.reply = reply
+        self.pieces = pieces
+        self.fail_after = fail_after
+        self.max_tokens = max_tokens
+        self.context_window = context_window
+        self.supports_embeddings = supports_embeddings
+        # 每次调用的消息（embeddings 为输入列表）与分配的 timeout
+        self.calls = []
+        self.timeouts = []
+        self.in_flight = 0
+        self.peak = 0
+        self.started = False
+        self.cancelled = False
+
+    async def _call(self, produce):
+        self.started = True
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay.pop(0) if isinstance(self.delay, list) else self.delay)
+            if self.fail:
+                raise self.error or RuntimeError(f"{self.provider_name} 不可用")
+            result = produce()
+            return await result if inspect.isawaitable(result) else result
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def generate_response(self, messages, max_tokens=None, temperature=None, timeout=None):
+        self.calls.append(messages)
+        self.timeouts.append(timeout)
+        return await self._call(lambda: self.provider_name if self.reply is None else self.reply(messages))
+
+    async def stream_response(self, messages, max_tokens=None, temperature=None):
+        self.calls.append(messages)
+        await self._call(lambda: None)
+        if self.pieces is None:
+            raise NotImplementedError
+        yield build_chat_chunk(self.provider_name, "m", "id", int(time.time()), {"role": "assistant", "content": ""})
+        for i, piece in enumerate(self.pieces):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise Exception(f"{self.provider_name} 中断")
+            yield build_chat_chunk(self.provider_name, "m", "id", int(time.time()), {"content": piece})
+
+    async def create_embeddings(self, inputs, timeout=None):
+        if not self.supports_embeddings:
+            return await super().create_embeddings(inputs, timeout)
+        self.calls.append(list(inputs))
+        return await self._call(lambda: fake_embeddings(inputs) if self.reply is None else self.reply(inputs))
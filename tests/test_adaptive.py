@@ -0,0 +1,71 @@
+import pytest
+from app.config.settings import GroupConfig
+from app.core import adaptive
+from app.core.adaptive import AdaptiveSelector, ProviderLatencyStats, record_call
+from app.core.ai_factory import AIFactory
+from app.core.routing import RoutingTable
+
+
+class NamedProvider:
+    def __init__(self, provider_name):
+        self.provider_name = provider_name
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    adaptive._stats.clear()
+    adaptive.reset_adaptive_selector()
+    yield
+    adaptive._stats.clear()
+    adaptive.reset_adaptive_selector()
+
+
+def test_ewma_tracks_latency_and_errors():
+    stats = ProviderLatencyStats("p", alpha=0.5)
+    stats.record(1.0, ok=True)
+    stats.record(3.0, ok=True)
+    assert stats.latency == pytest.approx(2.0)
+    stats.record(10.0, ok=False)
+    assert stats.latency == pytest.approx(2.0)
+    assert stats.error_rate == pytest.approx(0.5)
+    assert stats.score() == pytest.approx(4.0)
+
+
+def test_selector_prefers_fastest_healthy_member():
+    fast, slow, flaky = NamedProvider("fast"), NamedProvider("slow"), NamedProvider("flaky")
+    record_call("fast", 0.2, ok=True)
+    record_call("slow", 2.0, ok=True)
+    record_call("flaky", 0.5, ok=True)
+    for _ in range(5):
+        record_call("flaky", 0.5, ok=False)
+
+    selector = AdaptiveSelector(exploration=0)
+    assert [p.provider_name for p in selector.order([slow, flaky, fast])] == ["fast", "slow", "flaky"]
+
+
+def test_unmeasured_member_is_tried_first():
+    record_call("known", 0.5, ok=True)
+    selector = AdaptiveSelector(exploration=0)
+    order = selector.order([NamedProvider("known"), NamedProvider("new")])
+    assert [p.provider_name for p in order] == ["new", "known"]
+
+
+def test_exploration_promotes_other_member(monkeypatch):
+    record_call("a", 0.1, ok=True)
+    record_call("b", 1.0, ok=True)
+    monkeypatch.setattr(adaptive.random, "random", lambda: 0.0)
+    selector = AdaptiveSelector(exploration=0.1)
+    assert [p.provider_name for p in selector.order([NamedProvider("a"), NamedProvider("b")])] == ["b", "a"]
+
+
+def test_route_reorders_only_adaptive_group(mock_settings, monkeypatch):
+    group = GroupConfig(providers=["deepseek-test", "ollama-test"], strategy="adaptive")
+    monkeypatch.setitem(mock_settings._group_configs, "primary", group)
+    monkeypatch.setitem(mock_settings._config, "adaptive", {"exploration": 0})
+    table = RoutingTable(mock_settings, AIFactory.get_provider)
+    record_call("deepseek-test", 3.0, ok=True)
+    record_call("ollama-test", 0.3, ok=True)
+
+    route = table.resolve("openai-test;primary")
+    assert [p.provider_name for p in route.providers] == ["openai-test", "deepseek-test", "ollama-test"]
+    assert [p.provider_name for p in route.ordered_providers()] == ["openai-test", "ollama-test", "deepseek-test"]
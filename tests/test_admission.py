@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from app.core import admission, circuit_breaker
+from app.core.admission import AdmissionController
+from app.core.failover import AllProvidersSaturatedError, generate_with_failover
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+REQUEST = AIRequest(messages=[{"role": "user", "content": "hi"}])
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+    yield
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+
+
+def test_controller_queue_and_reject():
+    async def main():
+        controller = AdmissionController("p", max_concurrency=1, max_queue=1)
+        assert await controller.acquire()
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.waiting == 1
+        assert not await controller.acquire()  # 队列已满，立即拒绝
+        controller.release()
+        assert await queued
+        assert controller.active == 1 and controller.waiting == 0
+        controller.release()
+        assert controller.active == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        controller = AdmissionController("p", max_concurrency=1, max_queue=1)
+        await controller.acquire()
+        queued = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert controller.waiting == 0
+        controller.release()
+        assert controller.active == 0
+
+    asyncio.run(main())
+
+
+def test_saturated_provider_is_skipped():
+    local, cloud = FakeProvider("local", delay=0.05), FakeProvider("cloud", delay=0.05)
+    admission._controllers["local"] = AdmissionController("local", max_concurrency=2)
+
+    async def main():
+        return await asyncio.gather(*[generate_with_failover([local, cloud], REQUEST) for _ in range(5)])
+
+    results = asyncio.run(main())
+    assert results.count("local") == 2 and results.count("cloud") == 3
+
+
+def test_all_saturated_fails_fast():
+    local = FakeProvider("local", delay=0.05)
+    admission._controllers["local"] = AdmissionController("local", max_concurrency=1)
+
+    async def main():
+        return await asyncio.gather(
+            generate_with_failover([local], REQUEST),
+            generate_with_failover([local], REQUEST),
+            return_exceptions=True,
+        )
+
+    ok, rejected = asyncio.run(main())
+    assert ok == "local"
+    assert isinstance(rejected, AllProvidersSaturatedError) and rejected.retry_after >= 1
@@ -0,0 +1,89 @@
+import pytest
+from app.config.settings import GroupConfig
+from app.core import admission, balancer
+from app.core.admission import AdmissionController
+from app.core.ai_factory import AIFactory
+from app.core.balancer import (
+    LeastOutstandingSelector,
+    PowerOfTwoChoicesSelector,
+    WeightedRoundRobinSelector,
+)
+from app.core.routing import RoutingTable
+
+
+class NamedProvider:
+    def __init__(self, provider_name):
+        self.provider_name = provider_name
+
+
+A, B, C = NamedProvider("a"), NamedProvider("b"), NamedProvider("c")
+
+
+def names(providers):
+    return [p.provider_name for p in providers]
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    admission._controllers.clear()
+    balancer._selectors.clear()
+    yield
+    admission._controllers.clear()
+    balancer._selectors.clear()
+
+
+def test_weighted_round_robin_is_smooth():
+    selector = WeightedRoundRobinSelector({"a": 2, "b": 1})
+    firsts = [selector.order([A, B])[0].provider_name for _ in range(6)]
+    assert firsts == ["a", "b", "a", "a", "b", "a"]
+
+
+def test_order_keeps_other_members_as_fallback():
+    selector = WeightedRoundRobinSelector({})
+    order = selector.order([A, B, C])
+    assert sorted(names(order)) == ["a", "b", "c"]
+
+
+def test_zero_weight_member_is_fallback_only():
+    selector = WeightedRoundRobinSelector({"a": 0})
+    for _ in range(4):
+        assert names(selector.order([A, B])) == ["b", "a"]
+
+
+def test_least_outstanding_prefers_idle_member():
+    admission._controllers["a"] = AdmissionController("a")
+    admission._controllers["a"].active = 3
+    admission._controllers["b"] = AdmissionController("b")
+    admission._controllers["b"].active = 1
+    admission._controllers["c"] = AdmissionController("c")
+    admission._controllers["c"].active = 2
+    assert names(LeastOutstandingSelector({}).order([A, B, C])) == ["b", "c", "a"]
+    # 权重更高的成员可以承担更多在途请求
+    assert names(LeastOutstandingSelector({"a": 4}).order([A, B, C]))[0] == "a"
+
+
+def test_p2c_picks_less_loaded_of_two(monkeypatch):
+    admission._controllers["a"] = AdmissionController("a")
+    admission._controllers["a"].active = 5
+    monkeypatch.setattr(balancer.random, "choices", lambda population, weights: [population[0]])
+    assert names(PowerOfTwoChoicesSelector({}).order([A, B, C]))[0] == "b"
+
+
+def test_p2c_samples_two_distinct_members():
+    # 有放回抽样时会抽到两次负载更高的成员；两个成员时应总是选中较空闲的那个
+    admission._controllers["a"] = AdmissionController("a")
+    admission._controllers["a"].active = 5
+    selector = PowerOfTwoChoicesSelector({})
+    assert all(selector.pick([A, B]) is B for _ in range(100))
+
+
+def test_balance_group_route(mock_settings, monkeypatch):
+    group = GroupConfig(providers=["deepseek-test", "ollama-test"], mode="balance")
+    monkeypatch.setitem(mock_settings._group_configs, "primary", group)
+    table = RoutingTable(mock_settings, AIFactory.get_provider)
+    route = table.resolve("primary;openai-test")
+    firsts = [names(route.ordered_providers()) for _ in range(2)]
+    assert firsts == [
+        ["deepseek-test", "ollama-test", "openai-test"],
+        ["ollama-test", "deepseek-test", "openai-test"],
+    ]
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import pytest
+from app.core import admission, batch, circuit_breaker
+from app.core.ai_factory import AIFactory
+from app.core.routing import Route
+from app.models.schemas import AIRequest, ExtendedChatCompletion
+from tests.conftest import FakeProvider
+
+
+def make_response(provider_name, content):
+    return ExtendedChatCompletion(
+        id="x",
+        choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        created=0,
+        model="m",
+        object="chat.completion",
+        provider=provider_name,
+    )
+
+
+async def echo(messages):
+    """按消息内容决定延迟，内容为 fail 时失败"""
+    content = messages[0]["content"]
+    await asyncio.sleep(0.001 * (10 - int(content)) if content.isdigit() else 0)
+    if content == "fail":
+        raise RuntimeError("boom")
+    return make_response("echo", content)
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+    provider = FakeProvider("echo", reply=echo)
+    monkeypatch.setattr(AIFactory, "resolve", classmethod(lambda cls, model=None: Route((provider,), name="echo")))
+    yield provider
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+
+
+def request(content, **kwargs):
+    return AIRequest(messages=[{"role": "user", "content": content}], **kwargs)
+
+
+def test_run_batch_bounds_concurrency(provider):
+    items = [(i, request(str(i))) for i in range(10)]
+
+    async def main():
+        return [result async for result in batch.run_batch(iter(items), concurrency=3)]
+
+    results = asyncio.run(main())
+    assert sorted(r.index for r in results) == list(range(10))
+    assert all(r.response.choices[0].message.content == str(r.index) for r in results)
+    assert provider.peak <= 3
+
+
+def test_item_errors_do_not_fail_batch(provider):
+    items = [(0, request("1")), (1, request("fail")), (2, request("2", stream=True))]
+
+    async def main():
+        return {r.index: r async for r in batch.run_batch(iter(items), concurrency=2)}
+
+    results = asyncio.run(main())
+    assert results[0].response is not None
+    assert results[1].error.status_code == 500
+    assert results[2].error.status_code == 400
+
+
+def test_batch_endpoint_preserves_order(client, provider):
+    body = {"requests": [{"messages": [{"role": "user", "content": str(i)}]} for i in range(5)]}
+    response = client.post("/api/v1/chat/completions/batch", json=body)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["index"] for r in results] == list(range(5))
+    assert [r["response"]["choices"][0]["message"]["content"] for r in results] == [str(i) for i in range(5)]
+
+
+def test_batch_endpoint_ndjson(client, provider):
+    body = {
+        "requests": [{"messages": [{"role": "user", "content": c}]} for c in ("1", "fail")],
+        "stream": True,
+    }
+    response = client.post("/api/v1/chat/completions/batch", json=body)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = {item["index"]: item for item in map(json.loads, response.text.splitlines())}
+    assert "response" in lines[0] and lines[1]["error"]["status_code"] == 500
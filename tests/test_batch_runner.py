@@ -0,0 +1,79 @@
+import asyncio
+import json
+import pytest
+from app import batch as batch_cli
+from app.core import admission, circuit_breaker
+from app.core.ai_factory import AIFactory
+from app.core.routing import Route
+from app.models.schemas import ExtendedChatCompletion
+from tests.conftest import FakeProvider
+
+
+async def echo(messages):
+    content = messages[0]["content"]
+    # 让后面的请求先完成，检验按输入顺序写出
+    await asyncio.sleep(0.001 * (10 - int(content)))
+    return ExtendedChatCompletion(
+        id=content,
+        choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        created=0,
+        model="m",
+        object="chat.completion",
+        usage={"prompt_tokens": 2, "completion_tokens": 3, "total_tokens": 5},
+        provider="echo",
+    )
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+    provider = FakeProvider("echo", reply=echo)
+    monkeypatch.setattr(AIFactory, "resolve", classmethod(lambda cls, model=None: Route((provider,), name="echo")))
+    yield provider
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+
+
+def write_input(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"messages": [{"role": "user", "content": str(i)}], "temperature": 0.3}) + "\n")
+        f.write("not json\n")
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_results_written_in_input_order(tmp_path, provider):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_input(input_path, 10)
+    args = batch_cli.parse_args([str(input_path), str(output_path), "--concurrency", "4", "--window", "4"])
+
+    stats = asyncio.run(batch_cli.run(args))
+
+    results = read_output(output_path)
+    assert [r["index"] for r in results] == list(range(11))
+    assert results[3]["response"]["id"] == "3"
+    assert results[10]["error"]["status_code"] == 400
+    assert stats.succeeded == 10 and stats.failed == 1
+    assert stats.prompt_tokens == 20 and stats.completion_tokens == 30
+    assert not (tmp_path / "out.jsonl.checkpoint").exists()
+
+
+def test_resume_from_checkpoint(tmp_path, provider):
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_input(input_path, 6)
+    # 模拟中断：已按顺序写出3条，检查点之后还有一行写了一半的结果
+    done = "".join(json.dumps({"index": i, "error": {"status_code": 500, "message": "x"}}) + "\n" for i in range(3))
+    output_path.write_text(done + '{"index": 3, "resp', encoding="utf-8")
+    checkpoint = batch_cli.Checkpoint(str(output_path) + ".checkpoint")
+    checkpoint.save(3, len(done.encode("utf-8")), batch_cli.BatchStats(total=3, failed=3))
+
+    stats = asyncio.run(batch_cli.run(batch_cli.parse_args([str(input_path), str(output_path)])))
+
+    assert sorted(messages[0]["content"] for messages in provider.calls) == ["3", "4", "5"]
+    assert [r["index"] for r in read_output(output_path)] == list(range(7))
+    assert stats.total == 7 and stats.succeeded == 3
@@ -0,0 +1,89 @@
+import json
+import pytest
+from app.core import admission, capture, circuit_breaker
+from app.core.ai_factory import AIFactory
+from app.core.capture import TrafficCapture, redact_messages
+from app.core.routing import Route
+from app.models.schemas import AIRequest, ExtendedChatCompletion
+from tests.conftest import FakeProvider
+
+
+def usage_provider():
+    return FakeProvider("usage", reply=lambda messages: ExtendedChatCompletion.model_validate({
+        "id": "x",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "m",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+        "usage": {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9},
+        "provider": "usage",
+    }))
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_redaction_keeps_shape():
+    messages = [
+        {"role": "system", "content": "机密"},
+        {"role": "user", "content": [{"type": "text", "text": "abc"}, {"type": "image_url", "image_url": {"url": "u"}}]},
+    ]
+    assert redact_messages(messages) == [
+        {"role": "system", "content": "xx"},
+        {"role": "user", "content": [{"type": "text", "text": "xxx"}, {"type": "text", "text": "[image_url]"}]},
+    ]
+    assert messages[0]["content"] == "机密"
+
+
+def test_writer_batches_and_flushes_on_stop(tmp_path):
+    path = str(tmp_path / "capture" / "traffic.jsonl")
+    traffic = TrafficCapture(path, redact=True, batch_size=2, flush_interval=0.05)
+    request = AIRequest(messages=[{"role": "user", "content": "hello"}], model="group1")
+    for _ in range(3):
+        traffic.start(request, [usage_provider()]).finish("success", "usage")
+    traffic.stop(timeout=2)
+
+    records = _read(path)
+    assert len(records) == 3 and traffic.stats()["captured"] == 3 and traffic.batches == 2
+    assert records[0]["request"]["messages"] == [{"role": "user", "content": "xxxxx"}]
+    assert records[0]["request"]["model"] == "group1"
+    assert records[0]["providers"] == ["usage"] and records[0]["outcome"] == "success"
+
+
+def test_queue_full_drops_instead_of_blocking(tmp_path):
+    traffic = TrafficCapture(str(tmp_path / "traffic.jsonl"), max_queue=1)
+    traffic._ensure_writer = lambda: None
+    entry = traffic.start(AIRequest(messages=[{"role": "user", "content": "a"}]), [])
+    entry.finish("success")
+    entry.finish("success")
+    assert traffic.dropped == 1
+
+
+@pytest.fixture
+def capture_enabled(mock_settings, monkeypatch, tmp_path):
+    path = str(tmp_path / "traffic.jsonl")
+    monkeypatch.setitem(mock_settings._config, "capture", {"enabled": True, "path": path, "flush_interval": 0.01})
+    monkeypatch.setitem(mock_settings._config, "singleflight", {"enabled": False})
+    capture.reset_traffic_capture()
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+    provider = usage_provider()
+    monkeypatch.setattr(AIFactory, "resolve", classmethod(lambda cls, model=None: Route((provider,), name="usage")))
+    yield path
+    capture.close_traffic_capture()
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+
+
+def test_endpoint_records_requests(client, capture_enabled):
+    response = client.post("/api/v1/chat/completions", json={"messages": [{"role": "user", "content": "hi"}]})
+    assert response.status_code == 200
+    assert client.get("/api/v1/admin/capture").json()["enabled"]
+    capture.close_traffic_capture()
+
+    (record,) = _read(capture_enabled)
+    assert record["provider"] == "usage" and record["outcome"] == "success"
+    assert record["usage"] == {"prompt_tokens": 7, "completion_tokens": 2}
+    assert record["latency_ms"] >= 0 and record["ts"] > 0
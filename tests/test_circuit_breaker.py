@@ -0,0 +1,70 @@
+import asyncio
+import time
+import pytest
+from app.core import circuit_breaker
+from app.core.circuit_breaker import CircuitBreaker, CircuitState, OPEN_POLICY_SKIP, order_by_health
+from app.core.failover import AllProvidersFailedError, generate_with_failover
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+
+@pytest.fixture(autouse=True)
+def clean_breakers():
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
+
+
+def test_breaker_state_transitions():
+    breaker = CircuitBreaker("p", failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # 只放行一个探测请求
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_open_provider_moved_to_end():
+    down, up = FakeProvider("down", fail=True), FakeProvider("up")
+    circuit_breaker._breakers["down"] = CircuitBreaker("down", failure_threshold=1)
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}])
+
+    assert asyncio.run(generate_with_failover([down, up], request)) == "up"
+    assert circuit_breaker._breakers["down"].state == CircuitState.OPEN
+    assert order_by_health([down, up]) == [up, down]
+    assert order_by_health([down, up], OPEN_POLICY_SKIP) == [up]
+
+    assert asyncio.run(generate_with_failover([down, up], request)) == "up"
+    assert len(down.calls) == 1
+
+
+def test_all_open_fails_fast(monkeypatch):
+    down = FakeProvider("down", fail=True)
+    circuit_breaker._breakers["down"] = CircuitBreaker("down", failure_threshold=1)
+    monkeypatch.setattr("app.core.failover.get_open_policy", lambda: OPEN_POLICY_SKIP)
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}])
+
+    with pytest.raises(AllProvidersFailedError):
+        asyncio.run(generate_with_failover([down], request))
+    with pytest.raises(AllProvidersFailedError):
+        asyncio.run(generate_with_failover([down], request))
+    assert len(down.calls) == 1
+
+
+def test_admin_endpoint(client):
+    response = client.get("/api/v1/admin/circuit-breakers")
+    assert response.status_code == 200
+    names = {b["provider"] for b in response.json()["circuit_breakers"]}
+    assert {"openai-test", "anthropic-test", "ollama-test", "deepseek-test"} <= names
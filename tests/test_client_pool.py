@@ -0,0 +1,63 @@
+import asyncio
+import socket
+import threading
+import time
+import pytest
+import uvicorn
+from app.config.settings import ProviderConfig
+from app.core.client_pool import ClientRegistry
+from app.core.ai_factory import AIFactory
+from app.core.ai_provider import OpenAIFormatProvider
+from benchmarks.mock_upstream import MockOptions, create_app
+
+
+def test_registry_reuses_client(mock_settings):
+    registry = ClientRegistry(mock_settings)
+    client = registry.get("openai-test")
+    assert registry.get("openai-test") is client
+    assert registry.get("ollama-test") is not client
+    asyncio.run(registry.aclose())
+
+
+def test_factory_shares_client(mock_settings):
+    first = AIFactory.create_provider("deepseek-test")
+    second = AIFactory.create_provider("deepseek-test")
+    assert first.client is second.client
+
+
+@pytest.fixture
+def mock_upstream():
+    """在后台线程中运行 benchmarks.mock_upstream，返回其地址"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    options = MockOptions(latency=0, chunks=3, chunk_interval=0)
+    server = uvicorn.Server(uvicorn.Config(create_app(options), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def test_registry_client_streams_without_per_call_timeout(mock_settings, monkeypatch, mock_upstream):
+    # 流式调用不传 timeout，使用注册表为客户端配置的连接池超时
+    monkeypatch.setitem(mock_settings._providers, "mock-openai", ProviderConfig(
+        type="openai", model="m", api_key="x", base_url=f"{mock_upstream}/v1", max_retries=0,
+    ))
+    registry = ClientRegistry(mock_settings)
+    provider = OpenAIFormatProvider(None, None, "m", 100, "mock-openai", client=registry.get("mock-openai"))
+
+    async def main():
+        try:
+            return "".join([
+                chunk.choices[0].delta.content or ""
+                async for chunk in provider.stream_response([{"role": "user", "content": "hi"}])
+                if chunk.choices
+            ])
+        finally:
+            await registry.aclose()
+
+    assert asyncio.run(main()) == "模拟输出" * 3
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+import yaml
+from app.config import settings as settings_module
+from app.core import client_pool
+from app.core.ai_factory import AIFactory
+from app.core.circuit_breaker import get_circuit_breaker
+from app.core.client_pool import ClientRegistry
+from app.core.config_reload import ConfigReloader, ConfigReloadError
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch, mock_settings, test_config_path):
+    """把测试配置复制到临时文件，重载时从该文件读取；结束后恢复原有的全局状态"""
+    with open(test_config_path, encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+    monkeypatch.setenv("TESTING", "false")
+    monkeypatch.setenv("CONFIG_PATH", str(path))
+
+    registry = ClientRegistry(mock_settings)
+    client_pool.set_client_registry(registry)
+    AIFactory.build_routing_table(mock_settings)
+    yield path, config
+
+    settings_module.set_settings(mock_settings)
+    client_pool.set_client_registry(None)
+    AIFactory.reset()
+
+
+def _write(path, config):
+    path.write_text(yaml.safe_dump(config, allow_unicode=True), encoding="utf-8")
+
+
+def test_reload_swaps_routes_and_reuses_unchanged_clients(config_file):
+    path, config = config_file
+    old_registry = client_pool.get_client_registry()
+    old_route = AIFactory.resolve("primary")
+    old_deepseek = old_route.providers[0]
+    unchanged_client = old_route.providers[1].client
+    breaker = get_circuit_breaker("deepseek-test")
+
+    config["providers"]["deepseek-test"]["model"] = "deepseek-reasoner"
+    config["providers"]["extra-test"] = {"type": "ollama", "model": "qwen2.5", "base_url": "http://localhost:11434"}
+    del config["providers"]["openai-test"]
+    config["priority"] = ["anthropic-test", "ollama-test"]
+    config["groups"]["primary"].append("extra-test")
+    _write(path, config)
+
+    async def run():
+        reloader = ConfigReloader()
+        changes = await reloader.reload()
+        # 没有在途调用，旧注册表立即关闭
+        await asyncio.gather(*reloader._drains)
+        return changes
+
+    changes = asyncio.run(run())
+    assert changes == {"added": ["extra-test"], "removed": ["openai-test"], "changed": ["deepseek-test"]}
+
+    route = AIFactory.resolve("primary")
+    assert [p.provider_name for p in route.providers] == ["deepseek-test", "ollama-test", "extra-test"]
+    assert route.providers[0].model == "deepseek-reasoner"
+    # 未变更的提供商复用原有客户端，变更的提供商使用新客户端
+    assert route.providers[1].client is unchanged_client
+    assert route.providers[0].client is not old_deepseek.client
+    assert client_pool.get_client_registry() is not old_registry
+    assert old_registry._clients == {}
+    # 变更的提供商的熔断器按新配置重建
+    assert get_circuit_breaker("deepseek-test") is not breaker
+    assert [p.provider_name for p in AIFactory.resolve(None).providers] == ["anthropic-test", "ollama-test"]
+
+
+def test_invalid_config_keeps_current_state(config_file):
+    path, config = config_file
+    settings = settings_module.get_settings()
+    table = AIFactory.get_routing_table()
+    config["priority"].append("missing-provider")
+    _write(path, config)
+
+    reloader = ConfigReloader()
+    with pytest.raises(ConfigReloadError):
+        asyncio.run(reloader.reload())
+    assert settings_module.get_settings() is settings
+    assert AIFactory.get_routing_table() is table
+    assert reloader.failures == 1 and "missing-provider" in reloader.last_error
+
+
+def test_drain_waits_for_in_flight_calls(mock_settings):
+    registry = ClientRegistry(mock_settings)
+    registry.get("openai-test")
+    registry.acquire()
+
+    async def run():
+        drain = asyncio.create_task(registry.drain(timeout=5, poll_interval=0.01))
+        await asyncio.sleep(0.05)
+        assert not drain.done() and registry._clients
+        registry.release()
+        await drain
+
+    asyncio.run(run())
+    assert registry._clients == {}
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from app.core import circuit_breaker
+from app.core.context_window import trim_messages
+from app.core.failover import AllProvidersContextExceededError, generate_with_failover
+from app.core.tokens import PromptEstimate, estimate_text_tokens, get_tokenizer_profile
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+
+def windowed(provider_name, context_window):
+    return FakeProvider(provider_name, context_window=context_window, max_tokens=100)
+
+
+# 每条约 4 + 100 token
+LONG_TURNS = [
+    {"role": "system", "content": "系统"},
+    {"role": "user", "content": "a" * 400},
+    {"role": "assistant", "content": "b" * 400},
+    {"role": "user", "content": "c" * 400},
+    {"role": "assistant", "content": "d" * 400},
+    {"role": "user", "content": "最后的问题"},
+]
+REQUEST = AIRequest(messages=LONG_TURNS)
+
+
+@pytest.fixture(autouse=True)
+def clean_breakers():
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
+
+
+def test_tokenizer_profiles():
+    assert estimate_text_tokens("你好", get_tokenizer_profile("anthropic")) == 3
+    assert estimate_text_tokens("a" * 35, get_tokenizer_profile("anthropic")) == 10
+    with pytest.raises(ValueError):
+        get_tokenizer_profile("unknown")
+
+    prompt = PromptEstimate(LONG_TURNS)
+    default = get_tokenizer_profile()
+    assert prompt.tokens(default) == sum(prompt.message_tokens(default)) == 6 * 4 + 2 + 400 + 5
+    assert prompt.tokens(get_tokenizer_profile("qwen")) < prompt.tokens(default)
+
+
+def test_skips_provider_that_cannot_fit(mock_settings):
+    small, large = windowed("small", 300), windowed("large", 8000)
+    assert asyncio.run(generate_with_failover([small, large], REQUEST)) == "large"
+    assert small.calls == []
+    # 请求指定的 max_tokens 也计入所需窗口
+    request = AIRequest(messages=LONG_TURNS, max_tokens=8000)
+    with pytest.raises(AllProvidersContextExceededError):
+        asyncio.run(generate_with_failover([small, large], request))
+
+
+def test_trim_oldest_turns_to_fit(mock_settings, monkeypatch):
+    monkeypatch.setitem(mock_settings._config, "context", {"trim": True})
+    small = windowed("small", 330)
+    assert asyncio.run(generate_with_failover([small], REQUEST)) == "small"
+    # 丢弃最早的一轮对话，保留system消息并以用户消息开头
+    assert [m["content"][:1] for m in small.calls[0]] == ["系", "c", "d", "最"]
+
+
+def test_fitting_provider_preferred_over_trimming(mock_settings, monkeypatch):
+    monkeypatch.setitem(mock_settings._config, "context", {"trim": True})
+    small, large = windowed("small", 300), windowed("large", 8000)
+    assert asyncio.run(generate_with_failover([small, large], REQUEST)) == "large"
+    assert small.calls == []
+
+
+def test_trim_messages_keeps_system_and_last():
+    messages = [
+        {"role": "system", "content": "s"},
+        {"role": "user", "content": "u1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "tool", "content": "t1"},
+        {"role": "user", "content": "u2"},
+    ]
+    kept, total = trim_messages(messages, [1, 10, 10, 10, 10], 25)
+    assert [m["content"] for m in kept] == ["s", "u2"] and total == 11
+    assert trim_messages(messages, [1, 10, 10, 10, 10], 5) is None
@@ -0,0 +1,97 @@
+import json
+from anthropic.types.message import Message as AnthropicMessage
+from ollama import ChatResponse as OllamaChatCompletion
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from app.core.ai_provider import AnthropicProvider, OllamaProvider
+from app.models.schemas import (
+    ExtendedChatCompletion,
+    ExtendedChatCompletionChunk,
+    build_chat_chunk,
+    extend_chunk,
+    extend_completion,
+)
+
+OPENAI_RESPONSE = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 1700000000,
+    "model": "gpt-4o-mini",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "logprobs": None,
+        "message": {"role": "assistant", "content": "你好"},
+    }],
+    "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+}
+
+
+def _validated(model):
+    """旧路径：导出后重新校验得到的结果"""
+    return type(model)(**model.model_dump())
+
+
+def test_extend_completion_matches_validated():
+    completion = ChatCompletion.model_validate(OPENAI_RESPONSE)
+    response = extend_completion(completion, "openai")
+    expected = ExtendedChatCompletion(**completion.model_dump(), provider="openai")
+    assert isinstance(response, ExtendedChatCompletion)
+    assert response.model_dump_json() == expected.model_dump_json()
+    assert response.cached is False
+    # 复用SDK已解析的子对象
+    assert response.choices[0] is completion.choices[0]
+
+
+def test_extend_chunk_matches_validated():
+    chunk = ChatCompletionChunk.model_validate({
+        "id": "chatcmpl-1",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "delta": {"content": "你"}, "finish_reason": None}],
+    })
+    response = extend_chunk(chunk, "openai")
+    expected = ExtendedChatCompletionChunk(**chunk.model_dump(), provider="openai")
+    assert response.model_dump_json() == expected.model_dump_json()
+
+
+def test_anthropic_conversion():
+    message = AnthropicMessage.model_validate({
+        "id": "msg_1",
+        "type": "message",
+        "role": "assistant",
+        "model": "claude-3-5-sonnet",
+        "content": [{"type": "text", "text": "你"}, {"type": "text", "text": "好"}],
+        "stop_reason": "max_tokens",
+        "stop_sequence": None,
+        "usage": {"input_tokens": 3, "output_tokens": 2},
+    })
+    provider = AnthropicProvider(None, "claude-3-5-sonnet", 1024, "anthropic")
+    response = provider._convert_anthropic_to_openai_format(message)
+    assert response.model_dump_json() == _validated(response).model_dump_json()
+    assert response.provider == "anthropic"
+    assert response.choices[0].message.content == "你好"
+    assert response.choices[0].finish_reason == "length"
+    assert response.usage.total_tokens == 5
+
+
+def test_ollama_conversion_keeps_reasoning():
+    chat = OllamaChatCompletion.model_validate({
+        "model": "qwen2.5",
+        "done": True,
+        "message": {"role": "assistant", "content": "<tink>推理</tink>答案"},
+        "prompt_eval_count": 3,
+        "eval_count": 2,
+    })
+    provider = OllamaProvider(None, "qwen2.5", 1024, "ollama")
+    response = provider._convert_ollama_to_openai_format(chat)
+    assert response.model_dump_json() == _validated(response).model_dump_json()
+    payload = json.loads(response.__pydantic_serializer__.to_json(response))
+    assert payload["choices"][0]["message"]["content"] == "答案"
+    assert payload["choices"][0]["message"]["reasoning_content"] == "推理"
+    assert payload["usage"]["total_tokens"] == 5
+
+
+def test_build_chat_chunk_keeps_reasoning():
+    chunk = build_chat_chunk("ollama", "qwen2.5", "chunk-1", 1, {"reasoning_content": "推理"})
+    assert json.loads(chunk.model_dump_json())["choices"][0]["delta"]["reasoning_content"] == "推理"
@@ -0,0 +1,161 @@
+import asyncio
+import time
+import pytest
+from app.api.endpoints import ai_request
+from app.core import circuit_breaker, singleflight
+from app.core.dispatcher import complete
+from app.core.deadline import DEADLINE_HEADER, Deadline, DeadlineExceededError, resolve_deadline
+from app.core.failover import generate_with_failover, open_stream_with_failover
+from app.core.routing import Route
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+
+REQUEST = AIRequest(messages=[{"role": "user", "content": "hi"}])
+# 默认只合并确定性请求
+DETERMINISTIC = AIRequest(messages=[{"role": "user", "content": "hi"}], temperature=0)
+
+
+@pytest.fixture(autouse=True)
+def clean_breakers():
+    circuit_breaker._breakers.clear()
+    yield
+    circuit_breaker._breakers.clear()
+
+
+def test_attempt_timeout_splits_remaining_budget():
+    deadline = Deadline(10.0, min_attempt_timeout=3.0)
+    assert deadline.attempt_timeout(2) == pytest.approx(5.0, abs=0.05)
+    # 平均分配不足下限时按下限分配，但不超过剩余时间
+    assert deadline.attempt_timeout(5) == 3.0
+    assert Deadline(1.0, min_attempt_timeout=3.0).attempt_timeout(5) <= 1.0
+
+
+def test_resolve_deadline_precedence(mock_settings, monkeypatch):
+    monkeypatch.setitem(mock_settings._config, "deadline", {"default_timeout": 30, "max_timeout": 60})
+    assert resolve_deadline().timeout == 30
+    assert resolve_deadline(header_value="10").timeout == 10
+    assert resolve_deadline(5, header_value="10").timeout == 5
+    assert resolve_deadline(120).timeout == 60
+    with pytest.raises(ValueError):
+        resolve_deadline(header_value="soon")
+    monkeypatch.setitem(mock_settings._config, "deadline", {"default_timeout": 0})
+    assert resolve_deadline() is None
+
+
+def test_failover_budget_leaves_time_for_next_provider(mock_settings):
+    slow, fast = FakeProvider("slow", delay=10), FakeProvider("fast", delay=0.01)
+    deadline = Deadline(1.0, min_attempt_timeout=0.1)
+    started = time.monotonic()
+    result = asyncio.run(generate_with_failover([slow, fast], REQUEST, deadline=deadline))
+    assert result == "fast"
+    assert slow.cancelled
+    # 第一次尝试只分到一半的预算，并把超时传给了提供商
+    assert slow.timeouts[0] == pytest.approx(0.5, abs=0.05)
+    assert time.monotonic() - started < 0.9
+
+
+def test_deadline_exceeded(mock_settings):
+    providers = [FakeProvider("a", delay=10), FakeProvider("b", delay=10)]
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(generate_with_failover(providers, REQUEST, deadline=Deadline(0.2, min_attempt_timeout=0.05)))
+
+
+def test_stream_first_token_deadline(mock_settings):
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(open_stream_with_failover([FakeProvider("a", delay=10)], REQUEST, Deadline(0.1)))
+
+
+class DisconnectingRequest:
+    """模拟在 delay 秒后断开连接的客户端"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def receive(self):
+        await asyncio.sleep(self.delay)
+        return {"type": "http.disconnect"}
+
+
+def test_client_disconnect_cancels_failover(mock_settings):
+    slow = FakeProvider("slow", delay=10)
+
+    async def run():
+        await ai_request._cancel_on_disconnect(
+            DisconnectingRequest(0.05), generate_with_failover([slow], REQUEST)
+        )
+
+    with pytest.raises(ai_request._ClientDisconnected):
+        asyncio.run(run())
+    assert slow.cancelled
+
+
+@pytest.fixture
+def coalescing(mock_settings, monkeypatch):
+    monkeypatch.setitem(mock_settings._config, "singleflight", {"enabled": True})
+    singleflight.reset_singleflight()
+    yield
+    singleflight.reset_singleflight()
+
+
+def test_disconnect_of_last_waiter_cancels_coalesced_call(coalescing):
+    slow = FakeProvider("slow", delay=10)
+
+    async def run():
+        await ai_request._cancel_on_disconnect(DisconnectingRequest(0.05), complete(Route((slow,)), DETERMINISTIC))
+
+    with pytest.raises(ai_request._ClientDisconnected):
+        asyncio.run(run())
+    assert slow.cancelled
+    assert singleflight.get_singleflight().stats()["cancelled"] == 1
+
+
+def test_follower_retries_after_leader_deadline(coalescing):
+    # 第一次调用超过发起者的截止时间，后到的等待者仍有剩余时间，按自己的截止时间重新发起
+    provider = FakeProvider("p", delay=[10, 0.01])
+    route = Route((provider,))
+
+    async def run():
+        leader = asyncio.ensure_future(complete(route, DETERMINISTIC, Deadline(0.2)))
+        await asyncio.sleep(0.1)
+        follower = asyncio.ensure_future(complete(route, DETERMINISTIC, Deadline(0.2)))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader, follower = asyncio.run(run())
+    assert isinstance(leader, DeadlineExceededError)
+    assert follower == "p" and len(provider.timeouts) == 2
+
+
+def test_different_timeouts_are_not_coalesced(coalescing):
+    provider = FakeProvider("p", delay=0.05)
+    route = Route((provider,))
+
+    async def run():
+        return await asyncio.gather(
+            complete(route, DETERMINISTIC, Deadline(5)), complete(route, DETERMINISTIC, Deadline(30))
+        )
+
+    assert asyncio.run(run()) == ["p", "p"]
+    assert len(provider.timeouts) == 2
+
+
+def test_different_route_options_are_not_coalesced(coalescing):
+    provider = FakeProvider("p", delay=0.05)
+
+    async def run():
+        return await asyncio.gather(
+            complete(Route((provider,)), DETERMINISTIC, Deadline(5)),
+            complete(Route((provider,), race=1), DETERMINISTIC, Deadline(5)),
+        )
+
+    assert asyncio.run(run()) == ["p", "p"]
+    assert len(provider.timeouts) == 2
+
+
+def test_invalid_timeout_header(client):
+    response = client.post(
+        "/api/v1/chat/completions",
+        json={"messages": [{"role": "user", "content": "hi"}]},
+        headers={DEADLINE_HEADER: "abc"},
+    )
+    assert response.status_code == 400
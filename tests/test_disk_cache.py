@@ -0,0 +1,137 @@
+import asyncio
+import sqlite3
+import time
+from app.config.settings import ProviderConfig
+from app.core.disk_cache import DiskResponseCache
+from app.core import response_cache
+from app.core.response_cache import ResponseCache
+from app.models.schemas import ExtendedChatCompletion
+
+
+def make_response(content="ok"):
+    return ExtendedChatCompletion(
+        id="id",
+        choices=[{"finish_reason": "stop", "index": 0, "message": {"role": "assistant", "content": content}}],
+        created=int(time.time()),
+        model="m",
+        object="chat.completion",
+        provider="p",
+    )
+
+
+def test_survives_restart_and_compresses(tmp_path):
+    path = str(tmp_path / "cache" / "responses.sqlite")
+    disk = DiskResponseCache(path)
+    response = make_response("重复的内容" * 200)
+    disk.set("a", response, ttl=60)
+    disk.close()
+
+    reopened = DiskResponseCache(path)
+    ttl, cached = reopened.get("a")
+    assert 0 < ttl <= 60
+    assert cached.choices[0].message.content == response.choices[0].message.content
+    stats = reopened.stats()
+    assert stats["entries"] == 1 and stats["bytes"] < len(response.model_dump_json().encode("utf-8")) / 4
+
+
+def test_ttl_and_size_eviction(tmp_path):
+    disk = DiskResponseCache(str(tmp_path / "responses.sqlite"), compact_every=1)
+    disk.set("expired", make_response(), ttl=0.01)
+    time.sleep(0.02)
+    assert disk.get("expired") is None
+
+    disk.set("a", make_response("a"), ttl=60)
+    size = disk.stats()["bytes"]
+    disk.max_bytes = size * 2 + size // 2
+    disk.set("b", make_response("b"), ttl=60)
+    time.sleep(0.01)
+    disk.get("a")
+    # 超出大小时淘汰最久未访问的 b
+    disk.set("c", make_response("c"), ttl=60)
+    assert disk.get("b") is None
+    assert disk.get("a") is not None and disk.get("c") is not None
+    assert disk.stats()["evictions"] == 1
+
+
+def test_disk_tier_behind_memory(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(default_ttl=60)
+    cache.disk = DiskResponseCache(path)
+
+    async def store():
+        cache.store("k", make_response("hello"))
+        await cache.close()
+
+    asyncio.run(store())
+
+    # 模拟重启：新的内存缓存，同一个磁盘文件
+    restarted = ResponseCache(default_ttl=60)
+    restarted.disk = DiskResponseCache(path)
+    cached = asyncio.run(restarted.lookup("k"))
+    assert cached.cached and cached.choices[0].message.content == "hello"
+    assert restarted.disk.stats()["hits"] == 1
+    # 之后直接命中内存
+    assert asyncio.run(restarted.lookup("k")) is not None
+    assert restarted.disk.stats()["hits"] == 1
+    stats = asyncio.run(restarted.stats())
+    assert stats["hits"] == 2 and stats["misses"] == 0
+
+    asyncio.run(restarted.clear())
+    assert asyncio.run(ResponseCache().lookup("k")) is None
+    assert restarted.disk.get("k") is None
+
+
+class BrokenDisk(DiskResponseCache):
+    def get(self, key):
+        raise sqlite3.OperationalError("database is locked")
+
+    def set(self, key, response, ttl):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_disk_errors_do_not_fail_requests(tmp_path):
+    cache = ResponseCache(default_ttl=60)
+    cache.disk = BrokenDisk(str(tmp_path / "responses.sqlite"))
+
+    async def scenario():
+        assert await cache.lookup("k") is None
+        cache.store("k", make_response())
+        await cache.close()
+        return await cache.lookup("k")
+
+    # 磁盘写入失败不影响内存缓存
+    assert asyncio.run(scenario()) is not None
+    assert cache.disk_errors == 2
+
+
+def test_open_is_deferred_to_first_use(tmp_path):
+    path = tmp_path / "cache" / "responses.sqlite"
+    disk = DiskResponseCache(str(path))
+    assert not path.exists()
+    assert disk.get("k") is None and path.exists()
+
+
+def test_provider_fingerprint_tracks_model():
+    base = dict(type="openai", base_url="https://api.example.com/v1")
+    assert ProviderConfig(model="a", **base).fingerprint == ProviderConfig(model="a", api_key="k", **base).fingerprint
+    assert ProviderConfig(model="a", **base).fingerprint != ProviderConfig(model="b", **base).fingerprint
+
+
+def test_reset_closes_old_disk_cache(mock_settings, monkeypatch, tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    monkeypatch.setitem(mock_settings._config, "cache", {"enabled": True, "disk": {"enabled": True, "path": path}})
+    response_cache.reset_response_cache()
+
+    async def scenario():
+        old = response_cache.get_response_cache()
+        disk = old.disk
+        old.store("k", make_response())
+        response_cache.reset_response_cache()
+        await asyncio.gather(*response_cache._closing)
+        return old, disk
+
+    old, disk = asyncio.run(scenario())
+    # 旧缓存写完在途的磁盘写入后在后台关闭
+    assert old.disk is None and disk._conn is None
+    assert DiskResponseCache(path).get("k") is not None
+    response_cache.reset_response_cache()
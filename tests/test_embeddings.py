@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+from ollama import EmbedResponse
+from app.core import admission, circuit_breaker, embeddings
+from app.core.ai_factory import AIFactory
+from app.core.ai_provider import OllamaProvider
+from app.core.embeddings import EmbeddingBatcher, EmbeddingsNotSupportedError, embed_with_failover
+from app.core.routing import Route
+from tests.conftest import FakeProvider, fake_embeddings
+
+
+class BadInputError(Exception):
+    status_code = 400
+
+
+def embedder(provider_name, reject=None, **kwargs):
+    """支持 embeddings 的提供商；包含 reject 的调用按请求错误（400）拒绝"""
+
+    def reply(inputs):
+        if reject in inputs:
+            raise BadInputError(f"invalid input: {reject}")
+        return fake_embeddings(inputs)
+
+    return FakeProvider(provider_name, delay=0.01, reply=reply, supports_embeddings=True, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    for module_state in (admission._controllers, circuit_breaker._breakers, embeddings._batchers):
+        module_state.clear()
+    yield
+    for module_state in (admission._controllers, circuit_breaker._breakers, embeddings._batchers):
+        module_state.clear()
+
+
+def test_concurrent_requests_merged_and_split():
+    provider = embedder("embed")
+    batcher = EmbeddingBatcher(provider, window_ms=20, batch_size=64)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.embed(["a"]), batcher.embed(["bb", "ccc"]), batcher.embed(["dddd"])
+        )
+
+    results = asyncio.run(scenario())
+    assert provider.calls == [["a", "bb", "ccc", "dddd"]]
+    assert [vectors for vectors, _ in results] == [[[1.0]], [[2.0], [3.0]], [[4.0]]]
+    # token数按字符数比例分摊
+    assert [tokens for _, tokens in results] == [1, 5, 4]
+    assert batcher.snapshot()["batches"] == 1 and batcher.snapshot()["requests"] == 3
+
+
+def test_batch_size_cap_flushes_immediately():
+    provider = embedder("embed")
+    batcher = EmbeddingBatcher(provider, window_ms=1000, batch_size=3)
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(batcher.embed(["a", "b"]), batcher.embed(["c"]), batcher.embed(["d", "e", "f"]))
+        return asyncio.get_running_loop().time() - started
+
+    elapsed = asyncio.run(scenario())
+    # 凑满的批次和达到上限的单个请求都立即发送，不等时间窗口
+    assert sorted(provider.calls) == [["a", "b", "c"], ["d", "e", "f"]]
+    assert elapsed < 0.5
+
+
+def test_batch_error_delivered_to_every_caller():
+    batcher = EmbeddingBatcher(embedder("embed", fail=True), window_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(scenario()))
+
+
+def test_breaker_counts_one_failure_per_upstream_call(mock_settings):
+    batcher = EmbeddingBatcher(embedder("embed", fail=True), window_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(*[batcher.embed([str(i)]) for i in range(5)], return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(scenario()))
+    assert circuit_breaker.get_circuit_breaker("embed").snapshot()["consecutive_failures"] == 1
+
+
+def test_rejected_batch_is_split_per_request(mock_settings):
+    provider = embedder("embed", reject="bad")
+    batcher = EmbeddingBatcher(provider, window_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.embed(["a"]), batcher.embed(["bad"]), batcher.embed(["cc"]), return_exceptions=True
+        )
+
+    good, bad, other = asyncio.run(scenario())
+    assert good == ([[1.0]], 1) and other == ([[2.0]], 2)
+    assert isinstance(bad, BadInputError)
+    assert provider.calls[0] == ["a", "bad", "cc"] and len(provider.calls) == 4
+    assert batcher.snapshot()["splits"] == 1
+    # 合并调用被拒绝不计入熔断器，只有有问题的那个请求计一次失败
+    assert circuit_breaker.get_circuit_breaker("embed").snapshot()["total_failures"] == 1
+
+
+def test_failover_skips_unsupported_and_failed(mock_settings):
+    chat_only = FakeProvider("chat")
+    broken = embedder("broken", fail=True)
+    healthy = embedder("healthy")
+    provider, (vectors, _) = asyncio.run(embed_with_failover([chat_only, broken, healthy], ["hi"]))
+    assert provider is healthy and vectors == [[2.0]]
+    assert chat_only.calls == []
+    with pytest.raises(EmbeddingsNotSupportedError):
+        asyncio.run(embed_with_failover([chat_only], ["hi"]))
+
+
+def test_embeddings_endpoint(client, monkeypatch):
+    provider = embedder("embed")
+    monkeypatch.setattr(AIFactory, "resolve", classmethod(lambda cls, model=None: Route((provider,), name="embed")))
+    response = client.post("/api/v1/embeddings", json={"input": "hello", "model": "embed"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["provider"] == "embed" and body["object"] == "list"
+    assert body["data"] == [{"embedding": [5.0], "index": 0, "object": "embedding"}]
+    assert body["usage"] == {"prompt_tokens": 5, "total_tokens": 5}
+    assert client.post("/api/v1/embeddings", json={"input": []}).status_code == 422
+
+
+def test_ollama_embeddings():
+    class FakeOllamaClient:
+        async def embed(self, **kwargs):
+            self.kwargs = kwargs
+            return EmbedResponse(model=kwargs["model"], embeddings=[[0.1, 0.2], [0.3, 0.4]], prompt_eval_count=6)
+
+    client = FakeOllamaClient()
+    provider = OllamaProvider("http://localhost:11434", "qwen2.5", 1024, "ollama-test", client=client, keep_alive="30m")
+    provider.embedding_model = "nomic-embed-text"
+    vectors, tokens = asyncio.run(provider.create_embeddings(["a", "b"]))
+    assert vectors == [[0.1, 0.2], [0.3, 0.4]] and tokens == 6
+    assert client.kwargs["model"] == "nomic-embed-text" and client.kwargs["keep_alive"] == "30m"
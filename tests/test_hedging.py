@@ -0,0 +1,53 @@
+import asyncio
+import time
+import pytest
+from app.core import circuit_breaker, failover
+from app.core.failover import AllProvidersFailedError, HedgeLimiter, generate_with_failover
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+
+REQUEST = AIRequest(messages=[{"role": "user", "content": "hi"}])
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    circuit_breaker._breakers.clear()
+    monkeypatch.setattr(failover, "_hedge_limiter", HedgeLimiter(8))
+    yield
+    circuit_breaker._breakers.clear()
+
+
+def test_hedge_fires_after_delay_and_cancels_loser():
+    slow, fast = FakeProvider("slow", delay=1.0), FakeProvider("fast", delay=0.01)
+    started = time.monotonic()
+    result = asyncio.run(generate_with_failover([slow, fast], REQUEST, hedge_after_ms=50))
+    assert result == "fast"
+    assert slow.cancelled
+    assert time.monotonic() - started < 0.5
+
+
+def test_hedge_not_needed_when_first_is_fast():
+    first, second = FakeProvider("first", delay=0.01), FakeProvider("second", delay=0.01)
+    assert asyncio.run(generate_with_failover([first, second], REQUEST, hedge_after_ms=500)) == "first"
+    assert not second.started
+
+
+def test_race_starts_first_n():
+    a, b, c = FakeProvider("a", delay=0.2), FakeProvider("b", delay=0.01), FakeProvider("c", delay=0.01)
+    assert asyncio.run(generate_with_failover([a, b, c], REQUEST, race=2)) == "b"
+    assert a.cancelled and not c.started
+
+
+def test_race_failure_fails_over():
+    a, b = FakeProvider("a", delay=0.01, fail=True), FakeProvider("b", delay=0.05)
+    assert asyncio.run(generate_with_failover([a, b], REQUEST, race=1, hedge_after_ms=1000)) == "b"
+    with pytest.raises(AllProvidersFailedError):
+        asyncio.run(generate_with_failover([FakeProvider("x", delay=0, fail=True)], REQUEST, race=2))
+
+
+def test_hedge_cap(monkeypatch):
+    monkeypatch.setattr(failover, "_hedge_limiter", HedgeLimiter(0))
+    slow, fast = FakeProvider("slow", delay=0.2), FakeProvider("fast", delay=0.01)
+    assert asyncio.run(generate_with_failover([slow, fast], REQUEST, hedge_after_ms=10)) == "slow"
+    assert not fast.started
@@ -0,0 +1,66 @@
+import json
+import logging
+from app.utils import logger as logger_module
+from app.utils.logger import JsonFormatter, MessageLogPolicy
+
+
+def test_json_formatter():
+    record = logging.LogRecord("ars", logging.INFO, "x.py", 3, "提供商 %s 成功", ("gpt4",), None)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "提供商 gpt4 成功"
+    assert entry["level"] == "INFO" and entry["location"] == "x.py:3"
+
+
+def test_json_formatter_includes_exception():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        import sys
+        record = logging.LogRecord("ars", logging.ERROR, "x.py", 3, "失败", (), sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_message_policy_truncates():
+    policy = MessageLogPolicy(max_chars=5)
+    assert policy.truncate("abc") == "abc"
+    assert policy.truncate("abcdefgh").startswith("abcde...")
+    assert MessageLogPolicy(max_chars=0).truncate("abcdefgh") == "abcdefgh"
+
+
+def test_message_policy_respects_level_and_sampling():
+    logger = logging.getLogger("test_message_policy")
+    logger.setLevel(logging.WARNING)
+    assert not MessageLogPolicy().should_log(logger)
+    logger.setLevel(logging.INFO)
+    assert MessageLogPolicy().should_log(logger)
+    assert not MessageLogPolicy(enabled=False).should_log(logger)
+    assert not MessageLogPolicy(sample_rate=0).should_log(logger)
+
+
+def test_async_logging_formats_in_listener(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_ASYNC", "true")
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    monkeypatch.setenv("LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(logger_module, "_queue_listener", None)
+    async_logger = logger_module.setup_logger("test_async_logging")
+    try:
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            async_logger.error("失败: %s", "gpt4", exc_info=True)
+    finally:
+        logger_module.stop_log_listener()
+    # 停止后换回直接写入的处理器
+    assert not any(isinstance(h, logger_module.DeferredQueueHandler) for h in async_logger.handlers)
+    async_logger.warning("停止之后")
+    for handler in async_logger.handlers:
+        handler.flush()
+
+    (log_file,) = tmp_path.glob("*.log")
+    first, second = [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+    assert first["message"] == "失败: gpt4" and "ValueError: boom" in first["exception"]
+    assert second["message"] == "停止之后"
+    for handler in list(async_logger.handlers):
+        handler.close()
+        async_logger.removeHandler(handler)
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from app.core import admission, circuit_breaker, metrics
+from app.core.failover import AllProvidersFailedError, generate_with_failover
+from app.core.metrics import Counter, Histogram, MetricsRegistry, record_usage
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+REQUEST = AIRequest(messages=[{"role": "user", "content": "hi"}])
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+    yield
+    admission._controllers.clear()
+    circuit_breaker._breakers.clear()
+
+
+def test_render_counter_and_histogram():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("c_total", "计数", ("provider",)))
+    histogram = registry.register(Histogram("h_seconds", "延迟", ("provider",), (0.1, 1.0)))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    histogram.observe("a", value=0.05)
+    histogram.observe("a", value=0.5)
+    histogram.observe("a", value=5)
+
+    text = registry.render()
+    assert "# TYPE c_total counter" in text
+    assert 'c_total{provider="a"} 3' in text
+    assert 'h_seconds_bucket{provider="a",le="0.1"} 1' in text
+    assert 'h_seconds_bucket{provider="a",le="1.0"} 2' in text
+    assert 'h_seconds_bucket{provider="a",le="+Inf"} 3' in text
+    assert 'h_seconds_count{provider="a"} 3' in text
+
+
+def test_failover_records_metrics():
+    before_error = metrics.PROVIDER_REQUESTS.value("m-bad", "error")
+    before_success = metrics.PROVIDER_REQUESTS.value("m-good", "success")
+    before_failover = metrics.FAILOVERS.value("m-bad")
+    before_latency = metrics.UPSTREAM_LATENCY.count("m-good")
+
+    result = asyncio.run(generate_with_failover([FakeProvider("m-bad", fail=True), FakeProvider("m-good")], REQUEST))
+
+    assert result == "m-good"
+    assert metrics.PROVIDER_REQUESTS.value("m-bad", "error") == before_error + 1
+    assert metrics.PROVIDER_REQUESTS.value("m-good", "success") == before_success + 1
+    assert metrics.FAILOVERS.value("m-bad") == before_failover + 1
+    assert metrics.UPSTREAM_LATENCY.count("m-good") == before_latency + 1
+
+
+def test_last_failed_provider_is_not_a_failover():
+    before_first, before_last = metrics.FAILOVERS.value("m-first"), metrics.FAILOVERS.value("m-last")
+    providers = [FakeProvider("m-first", fail=True), FakeProvider("m-last", fail=True)]
+    with pytest.raises(AllProvidersFailedError):
+        asyncio.run(generate_with_failover(providers, REQUEST))
+    # 最后一个提供商失败后没有可转向的提供商
+    assert metrics.FAILOVERS.value("m-first") == before_first + 1
+    assert metrics.FAILOVERS.value("m-last") == before_last
+
+
+def test_record_usage_accepts_dict_and_object():
+    class Usage:
+        prompt_tokens = 3
+        completion_tokens = 4
+
+    before = metrics.PROMPT_TOKENS.value("m-usage")
+    record_usage("m-usage", {"prompt_tokens": 10, "completion_tokens": 5})
+    record_usage("m-usage", Usage())
+    record_usage("m-usage", None)
+    assert metrics.PROMPT_TOKENS.value("m-usage") == before + 13
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE ars_provider_requests_total counter" in response.text
+    assert "ars_provider_in_flight_requests" in response.text
@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from app.core import admission, circuit_breaker, rate_limit
+from app.core.failover import (
+    AllProvidersFailedError,
+    AllProvidersRateLimitedError,
+    generate_with_failover,
+    open_stream_with_failover,
+)
+from app.core.rate_limit import ProviderRateLimiter, TokenBucket
+from app.core.tokens import estimate_messages_tokens, estimate_text_tokens
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+REQUEST = AIRequest(messages=[{"role": "user", "content": "hi"}], max_tokens=100)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    for registry in (rate_limit._limiters, admission._controllers, circuit_breaker._breakers):
+        registry.clear()
+    yield
+    for registry in (rate_limit._limiters, admission._controllers, circuit_breaker._breakers):
+        registry.clear()
+
+
+def test_estimate_tokens():
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens("abcdefgh") == 2
+    assert estimate_text_tokens("你好") == 2
+    assert estimate_messages_tokens([{"role": "user", "content": "abcd"}]) == 5
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(60)
+    bucket.adjust(60)
+    assert bucket.available() == 0
+    assert bucket.wait_time(3) == pytest.approx(3.0)
+    now[0] += 2
+    assert bucket.available() == pytest.approx(2.0)
+
+
+def test_reconcile_refunds_overestimate():
+    limiter = ProviderRateLimiter("p", tpm=1000)
+    assert limiter.try_acquire(600)
+    assert not limiter.can_admit(600)
+    limiter.reconcile(600, 100)
+    assert limiter.can_admit(600)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_attempt_keeps_token_estimate(stream):
+    provider = FakeProvider("openai", max_tokens=100, fail=True, pieces=["a"])
+    limiter = rate_limit._limiters["openai"] = ProviderRateLimiter("openai", tpm=1000)
+
+    async def main():
+        if stream:
+            await open_stream_with_failover([provider], REQUEST)
+        else:
+            await generate_with_failover([provider], REQUEST)
+
+    with pytest.raises(AllProvidersFailedError):
+        asyncio.run(main())
+    # 上游可能已经处理了请求，失败时不退还预扣的估算
+    assert limiter.tokens.available() <= 1000 - 100
+
+
+def test_exhausted_provider_is_skipped():
+    openai, backup = FakeProvider("openai", max_tokens=100), FakeProvider("backup", max_tokens=100)
+    rate_limit._limiters["openai"] = ProviderRateLimiter("openai", rpm=2)
+
+    async def main():
+        return [await generate_with_failover([openai, backup], REQUEST) for _ in range(4)]
+
+    assert asyncio.run(main()) == ["openai", "openai", "backup", "backup"]
+    assert len(openai.calls) == 2
+
+
+def test_all_exhausted_reports_retry_after():
+    openai = FakeProvider("openai", max_tokens=100)
+    rate_limit._limiters["openai"] = ProviderRateLimiter("openai", rpm=6)
+    rate_limit._limiters["openai"].requests.adjust(6)
+
+    with pytest.raises(AllProvidersRateLimitedError) as exc_info:
+        asyncio.run(generate_with_failover([openai], REQUEST))
+    assert exc_info.value.retry_after >= 1
+    assert openai.calls == []
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from app.core import dispatcher
+from app.core.response_cache import ResponseCache, request_cache_key
+from app.core.routing import Route
+from app.models.schemas import AIRequest, ExtendedChatCompletion
+from tests.conftest import FakeProvider
+
+
+def make_response(content="ok", provider="p"):
+    return ExtendedChatCompletion(
+        id="id",
+        choices=[{"finish_reason": "stop", "index": 0, "message": {"role": "assistant", "content": content}}],
+        created=int(time.time()),
+        model="m",
+        object="chat.completion",
+        provider=provider,
+    )
+
+
+def test_cache_key_is_canonical():
+    a = AIRequest(messages=[{"role": "user", "content": "hi"}], temperature=0)
+    b = AIRequest(messages=[{"content": "hi", "role": "user"}], temperature=0)
+    c = AIRequest(messages=[{"role": "user", "content": "hi"}], temperature=0, max_tokens=10)
+    assert request_cache_key(a, ["x"]) == request_cache_key(b, ["x"])
+    assert request_cache_key(a, ["x"]) != request_cache_key(a, ["y"])
+    assert request_cache_key(a, ["x"]) != request_cache_key(c, ["x"])
+
+
+def test_ttl_and_lru_eviction():
+    size = len(make_response().model_dump_json())
+    cache = ResponseCache(default_ttl=60, max_bytes=size * 2)
+    cache.set("a", make_response())
+    cache.set("b", make_response())
+    assert cache.get("a").cached
+    cache.set("c", make_response())  # 淘汰最久未使用的 b
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    cache.set("d", make_response(), ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+    assert asyncio.run(cache.stats())["evictions"] >= 1
+
+
+def test_complete_uses_cache(monkeypatch):
+    cache = ResponseCache()
+    monkeypatch.setattr(dispatcher, "get_response_cache", lambda: cache)
+    provider = FakeProvider("counting", reply=lambda messages: make_response(provider="counting"))
+    route = Route((provider,))
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}], temperature=0)
+
+    first = asyncio.run(dispatcher.complete(route, request))
+    second = asyncio.run(dispatcher.complete(route, request))
+    assert not first.cached and second.cached
+    assert len(provider.calls) == 1
+
+    # 非确定性请求不走缓存
+    asyncio.run(dispatcher.complete(route, AIRequest(messages=[{"role": "user", "content": "hi"}])))
+    assert len(provider.calls) == 2
+    assert asyncio.run(cache.stats())["hits"] == 1
@@ -0,0 +1,36 @@
+from app.core.ai_factory import AIFactory
+from app.core.routing import RoutingTable
+
+
+def test_static_routes(mock_settings):
+    table = AIFactory.build_routing_table(mock_settings)
+    assert [p.provider_name for p in table.resolve(None).providers] == ["openai-test", "anthropic-test", "ollama-test"]
+    assert [p.provider_name for p in table.resolve("primary").providers] == ["deepseek-test", "ollama-test"]
+    # 同一提供商在所有路由中共享同一个实例
+    assert table.resolve("ollama-test").providers[0] is table.resolve("primary").providers[1]
+
+
+def test_combination_memo(mock_settings):
+    table = RoutingTable(mock_settings, AIFactory.get_provider, memo_size=2)
+    route = table.resolve("primary;openai-test;deepseek-test")
+    assert [p.provider_name for p in route.providers] == ["deepseek-test", "ollama-test", "openai-test"]
+    assert table.resolve("primary;openai-test;deepseek-test") is route
+    table.resolve("openai-test;primary")
+    table.resolve("anthropic-test;primary")
+    assert "primary;openai-test;deepseek-test" not in table._memo
+
+
+def test_unknown_provider_skipped(mock_settings):
+    table = AIFactory.build_routing_table(mock_settings)
+    assert table.resolve("invalid-provider").providers == ()
+    assert [p.provider_name for p in table.resolve("invalid-provider;openai-test").providers] == ["openai-test"]
+
+
+def test_route_modifiers(mock_settings):
+    table = AIFactory.build_routing_table(mock_settings)
+    assert not table.resolve("primary").parallel
+    race = table.resolve("primary@race")
+    assert [p.provider_name for p in race.providers] == ["deepseek-test", "ollama-test"]
+    assert race.race == 2 and race.hedge_after_ms is None
+    assert table.resolve("primary@race:3").race == 3
+    assert table.resolve("primary@hedge:200").hedge_after_ms == 200
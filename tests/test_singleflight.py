@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from app.core.singleflight import SingleFlight
+from app.models.schemas import AIRequest
+
+
+def test_concurrent_calls_are_coalesced():
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(*[flight.do("k", upstream) for _ in range(10)])
+        assert flight.coalesced == 9 and flight.in_flight == 0
+        return results
+
+    assert asyncio.run(main()) == ["result"] * 10
+    assert calls == 1
+
+
+def test_failure_propagates_to_all_waiters():
+    async def upstream():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(*[flight.do("k", upstream) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def upstream():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("k", upstream))
+        second = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_last_waiter_leaving_cancels_shared_call():
+    cancelled = False
+
+    async def upstream():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    async def main():
+        flight = SingleFlight()
+        waiters = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled and flight.in_flight == 1
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight
+
+    flight = asyncio.run(main())
+    assert cancelled and flight.in_flight == 0 and flight.cancelled == 1
+
+
+def test_only_deterministic_requests_are_eligible():
+    sampled = AIRequest(messages=[{"role": "user", "content": "hi"}])
+    deterministic = AIRequest(messages=[{"role": "user", "content": "hi"}], temperature=0)
+    assert SingleFlight().is_eligible(deterministic)
+    assert not SingleFlight().is_eligible(sampled)
+    assert SingleFlight(deterministic_only=False).is_eligible(sampled)
+    assert not SingleFlight(deterministic_only=False).is_eligible(deterministic.model_copy(update={"stream": True}))
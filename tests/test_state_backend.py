@@ -0,0 +1,204 @@
+import asyncio
+import sqlite3
+import pytest
+from app.core import state_backend
+from app.core.admission import SharedAdmissionController
+from app.core.circuit_breaker import CircuitState, SharedCircuitBreaker
+from app.core.rate_limit import SharedRateLimiter
+from app.core.response_cache import SharedResponseCache
+from app.core.state_backend import SQLiteStateBackend, get_state_backend
+from app.models.schemas import ExtendedChatCompletion
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """同一个 SQLite 文件上的两个后端，模拟两个 worker"""
+    path = str(tmp_path / "state.sqlite")
+    first, second = SQLiteStateBackend(path, sync_interval=0), SQLiteStateBackend(path, sync_interval=0)
+    # 两个后端都在同一进程中，等它们打开数据库（并清理本进程的遗留计数）后再开始
+    settle((first, second), rounds=1)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def settle(workers, rounds=2):
+    """等待两个 worker 的后台操作完成；第一轮提交的读取在下一次检查时才应用"""
+    for _ in range(rounds):
+        for backend in workers:
+            backend.flush()
+
+
+def _response(content="答案"):
+    return ExtendedChatCompletion.model_validate({
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "provider": "openai",
+    })
+
+
+def test_breaker_open_propagates_to_other_workers(workers):
+    first = SharedCircuitBreaker("openai", workers[0], failure_threshold=2)
+    second = SharedCircuitBreaker("openai", workers[1], failure_threshold=2)
+    first.record_failure()
+    assert second.state == CircuitState.CLOSED
+    first.record_failure()
+    settle(workers)
+    # 检查从不等待数据库：提交的读取在下一次检查时应用
+    second.state
+    settle(workers)
+    assert second.state == CircuitState.OPEN
+    assert not second.allow_request()
+    # 连续失败计数按 worker 统计
+    assert second.snapshot()["consecutive_failures"] == 0
+
+    first._state = CircuitState.HALF_OPEN
+    first.record_success()
+    settle(workers)
+    second.state
+    settle(workers)
+    assert second.state == CircuitState.CLOSED
+
+
+def test_rate_limit_budget_shared(workers):
+    first = SharedRateLimiter("openai", workers[0], rpm=3)
+    second = SharedRateLimiter("openai", workers[1], rpm=3)
+    assert first.try_acquire(10) and second.try_acquire(10) and first.try_acquire(10)
+    settle(workers)
+    second.can_admit(10)
+    settle(workers)
+    assert not second.try_acquire(10)
+    assert second.wait_time(10) > 0
+    assert second.snapshot()["rpm_available"] < 1
+
+
+def test_local_debits_survive_stale_sync(workers):
+    limiter = SharedRateLimiter("openai", workers[0], rpm=3)
+    limiter.can_admit(1)
+    # 读取已提交但尚未应用时本地继续扣除，应用读取结果时不会丢失这次扣除
+    assert limiter.try_acquire(1)
+    settle(workers)
+    limiter._synced_at = float("inf")
+    limiter.can_admit(1)
+    assert limiter.requests.available() == pytest.approx(2, abs=0.01)
+
+
+def test_token_budget_reconciled_across_workers(workers):
+    first = SharedRateLimiter("openai", workers[0], tpm=1000)
+    second = SharedRateLimiter("openai", workers[1], tpm=1000)
+    assert first.try_acquire(600)
+    first.reconcile(600, 900)
+    settle(workers)
+    second.can_admit(200)
+    settle(workers)
+    assert not second.can_admit(200)
+
+
+def test_concurrency_cap_across_workers(workers):
+    first = SharedAdmissionController("ollama", workers[0], max_concurrency=2, max_queue=1)
+    second = SharedAdmissionController("ollama", workers[1], max_concurrency=2, max_queue=1)
+
+    async def scenario():
+        assert await first.acquire() and await second.acquire()
+        waiter = asyncio.create_task(second.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done() and second.waiting == 1
+        # 本 worker 的队列已满
+        assert not await second.acquire()
+        assert second.saturated
+        first.release()
+        assert await asyncio.wait_for(waiter, 2)
+        assert second.snapshot()["host_active"] == 2
+        # 本 worker 归还的名额直接转交给本 worker 的等待者
+        local = asyncio.create_task(second.acquire())
+        await asyncio.sleep(0.01)
+        second.release()
+        assert await asyncio.wait_for(local, 1)
+
+    asyncio.run(scenario())
+
+
+def test_admission_falls_back_to_local_state(workers):
+    controller = SharedAdmissionController("ollama", workers[0], max_concurrency=1)
+    controller.backend = BrokenBackend(workers[0])
+
+    async def scenario():
+        assert await controller.acquire()
+        assert not await controller.acquire()
+        controller.release()
+        assert controller.active == 0 and controller._local == 0
+
+    asyncio.run(scenario())
+
+
+class BrokenBackend:
+    """数据库一直被其他 worker 锁住"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def submit(self, fn, *args):
+        def locked(*_):
+            raise sqlite3.OperationalError("database is locked")
+
+        return self.backend.submit(locked, *args)
+
+
+def test_dead_worker_slots_cleaned(workers, tmp_path):
+    workers[0].try_acquire_slot("ollama", 1)
+    workers[0]._connection().execute("UPDATE inflight SET pid = ?", (2 ** 22 + 1,))
+    assert workers[1].try_acquire_slot("ollama", 1) == (False, 1)
+    fresh = SQLiteStateBackend(str(tmp_path / "state.sqlite"))
+    assert fresh.try_acquire_slot("ollama", 1) == (True, 1)
+    fresh.close()
+
+
+def test_response_cached_by_other_worker(workers):
+    first = SharedResponseCache(workers[0])
+    second = SharedResponseCache(workers[1])
+
+    async def scenario():
+        first.store("key", _response())
+        settle(workers)
+        cached = await second.lookup("key")
+        assert cached.cached and cached.choices[0].message.content == "答案"
+        stats = await second.stats()
+        assert stats["shared_hits"] == 1 and stats["hits"] == 1
+        await first.clear()
+        settle(workers)
+        assert await SharedResponseCache(workers[1]).lookup("key") is None
+
+    asyncio.run(scenario())
+
+
+def test_memory_backend_by_default(mock_settings, monkeypatch):
+    monkeypatch.setitem(mock_settings._config, "state", {"backend": "memory"})
+    state_backend.reset_state_backend()
+    assert get_state_backend() is None
+    monkeypatch.setitem(mock_settings._config, "state", {"backend": "redis"})
+    state_backend.reset_state_backend()
+    with pytest.raises(ValueError):
+        get_state_backend()
+    state_backend.reset_state_backend()
+
+
+def test_reset_closes_old_backend(mock_settings, monkeypatch, tmp_path):
+    monkeypatch.setitem(mock_settings._config, "state", {"backend": "sqlite", "path": str(tmp_path / "state.sqlite")})
+    state_backend.reset_state_backend()
+    old = get_state_backend()
+    assert old.submit(old.try_acquire_slot, "ollama", 2).result() == (True, 1)
+    state_backend.reset_state_backend()
+    # 关闭排在已提交的操作之后由后端线程执行，关闭时归还占用的名额
+    old._executor.shutdown(wait=True)
+    assert old._conn is None
+    # 在途请求之后的归还直接返回 None，不会重复归还
+    assert old.submit(old.release_slot, "ollama").result() is None
+    new = get_state_backend()
+    assert new is not old and new.submit(new.slots_in_use, "ollama").result() == 0
+    state_backend.reset_state_backend()
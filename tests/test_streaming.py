@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from openai.types.chat import ChatCompletionChunk
+from starlette.requests import ClientDisconnect
+from app.api.endpoints import ai_request
+from app.core import admission
+from app.core.ai_provider import OpenAIFormatProvider, ReasoningStreamSplitter
+from app.core.metrics import ROUTE_IN_FLIGHT
+from app.core.failover import AllProvidersFailedError, open_stream_with_failover
+from app.models.schemas import AIRequest
+from tests.conftest import FakeProvider
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 5, 100])
+def test_reasoning_splitter(step):
+    text = "<tink>\n思考过程</tink>\n\n最终回答"
+    splitter = ReasoningStreamSplitter()
+    reasoning, content = "", ""
+    for i in range(0, len(text), step):
+        r, c = splitter.feed(text[i:i + step])
+        reasoning += r
+        content += c
+    r, c = splitter.flush()
+    assert reasoning + r == "思考过程"
+    assert content + c == "最终回答"
+
+
+def test_reasoning_splitter_without_tags():
+    splitter = ReasoningStreamSplitter()
+    assert splitter.feed("<ti") == ("", "")
+    assert splitter.feed("p: 普通回答") == ("", "<tip: 普通回答")
+
+
+def test_stream_failover_before_first_token():
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}], stream=True)
+    providers = [FakeProvider("broken", pieces=["a"], fail_after=0), FakeProvider("ok", pieces=["a", "b"])]
+    chunks = asyncio.run(_collect_stream(providers, request))
+    assert {c.provider for c in chunks} == {"ok"}
+    assert "".join(c.choices[0].delta.content or "" for c in chunks) == "ab"
+
+
+def test_stream_error_after_first_token_is_not_retried():
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}], stream=True)
+    providers = [FakeProvider("flaky", pieces=["a", "b"], fail_after=1), FakeProvider("ok", pieces=["c"])]
+    with pytest.raises(Exception, match="flaky 中断"):
+        asyncio.run(_collect_stream(providers, request))
+
+
+def test_stream_all_failed():
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}], stream=True)
+    with pytest.raises(AllProvidersFailedError):
+        asyncio.run(_collect_stream([FakeProvider("broken", pieces=["a"], fail_after=0)], request))
+
+
+def test_openai_stream_requests_usage():
+    chunks = [
+        {"choices": [{"index": 0, "delta": {"content": "hi"}, "finish_reason": "stop"}]},
+        {"choices": [], "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4}},
+    ]
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+
+        async def stream():
+            for chunk in chunks:
+                yield ChatCompletionChunk.model_validate(
+                    {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m", **chunk}
+                )
+        return stream()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    provider = OpenAIFormatProvider(None, None, "m", 100, "openai-test", client=client)
+    result = asyncio.run(_collect(provider.stream_response([{"role": "user", "content": "hi"}])))
+    assert calls[0]["stream_options"] == {"include_usage": True}
+    assert result[-1].usage.total_tokens == 4
+
+
+@pytest.mark.parametrize("spec_version", ["2.0", "2.4"])
+def test_unsent_stream_response_releases_lease(mock_settings, spec_version):
+    # 2.0：客户端在响应开始前断开；2.4：发送响应头时连接已重置。两种情况下响应体生成器都不会开始运行
+    admission._controllers.clear()
+    request = AIRequest(messages=[{"role": "user", "content": "hi"}], stream=True)
+    before = ROUTE_IN_FLIGHT.value("unsent")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if spec_version == "2.4":
+            raise OSError("connection reset")
+        await asyncio.sleep(10)
+
+    async def run():
+        chunks = await open_stream_with_failover([FakeProvider("unsent", pieces=["a"])], request)
+        assert admission.get_admission_controller("unsent").active == 1
+        ROUTE_IN_FLIGHT.inc("unsent")
+        response = ai_request._EventStreamResponse(ai_request._StreamFinalizer(chunks, "unsent"))
+        scope = {"type": "http", "asgi": {"spec_version": spec_version}}
+        if spec_version == "2.4":
+            with pytest.raises(ClientDisconnect):
+                await response(scope, receive, send)
+        else:
+            await response(scope, receive, send)
+
+    asyncio.run(run())
+    assert admission.get_admission_controller("unsent").active == 0
+    assert ROUTE_IN_FLIGHT.value("unsent") == before
+    admission._controllers.clear()
+
+
+async def _collect_stream(providers, request):
+    return await _collect(await open_stream_with_failover(providers, request))
@@ -0,0 +1,77 @@
+import asyncio
+from ollama import ChatResponse as OllamaChatCompletion
+from app.config.settings import ProviderConfig
+from app.core import warmup
+from app.core.ai_factory import AIFactory
+from app.core.ai_provider import OllamaProvider
+
+
+class FakeOllamaClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def chat(self, **kwargs):
+        self.calls.append(("chat", kwargs))
+        return OllamaChatCompletion.model_validate({
+            "model": kwargs["model"],
+            "done": True,
+            "done_reason": "length",
+            "message": {"role": "assistant", "content": "答案"},
+            "prompt_eval_count": 3,
+            "eval_count": 64,
+        })
+
+    async def generate(self, **kwargs):
+        self.calls.append(("generate", kwargs))
+        if self.fail:
+            raise ConnectionError("connection refused")
+
+
+def _provider(client, **kwargs):
+    return OllamaProvider("http://localhost:11434", "qwen2.5", 1024, "ollama-test", client=client, **kwargs)
+
+
+def test_generation_limits_passed_to_ollama():
+    client = FakeOllamaClient()
+    provider = _provider(client, keep_alive="30m", num_ctx=8192)
+    response = asyncio.run(provider.generate_response([{"role": "user", "content": "hi"}], max_tokens=64))
+
+    _, kwargs = client.calls[0]
+    assert kwargs["options"].num_predict == 64
+    assert kwargs["options"].num_ctx == 8192
+    assert kwargs["keep_alive"] == "30m"
+    assert response.choices[0].finish_reason == "length"
+    # 未指定 max_tokens 时使用提供商配置的值
+    asyncio.run(provider.generate_response([{"role": "user", "content": "hi"}]))
+    assert client.calls[1][1]["options"].num_predict == 1024
+    # temperature 为 0 时原样传递，未指定时使用默认值
+    assert client.calls[1][1]["options"].temperature == 0.7
+    asyncio.run(provider.generate_response([{"role": "user", "content": "hi"}], temperature=0))
+    assert client.calls[2][1]["options"].temperature == 0
+
+
+def test_warm_up_loads_model_with_same_context():
+    client = FakeOllamaClient()
+    asyncio.run(_provider(client, keep_alive=-1, num_ctx=8192).warm_up())
+    name, kwargs = client.calls[0]
+    assert name == "generate" and kwargs["prompt"] == ""
+    assert kwargs["options"].num_ctx == 8192 and kwargs["keep_alive"] == -1
+
+
+def test_warmup_targets_only_ollama_with_warmup(mock_settings, monkeypatch):
+    monkeypatch.setitem(mock_settings._providers, "ollama-warm", ProviderConfig(
+        type="ollama", model="qwen2.5", warmup=True,
+    ))
+    monkeypatch.setitem(mock_settings._providers, "openai-warm", ProviderConfig(
+        type="openai", model="gpt-4o", warmup=True,
+    ))
+    assert warmup.warmup_targets(mock_settings, ["ollama-warm", "openai-warm", "ollama-test"]) == ["ollama-warm"]
+
+
+def test_warm_up_failure_is_isolated(monkeypatch):
+    providers = {"ok": _provider(FakeOllamaClient()), "down": _provider(FakeOllamaClient(fail=True))}
+    monkeypatch.setattr(AIFactory, "get_provider", classmethod(lambda cls, name: providers[name]))
+    results = asyncio.run(warmup.warm_up(["ok", "down"], timeout=1))
+    assert results["ok"] is None
+    assert "connection refused" in results["down"]